@@ -0,0 +1,72 @@
+# Description:
+# Measures how much a burst of LoRa sends delays the rest of the uasyncio event loop.
+#
+# A probe task asks for a 10 ms sleep in a loop and records how late it wakes up
+# (the "lag"). While it runs, a sender task pushes BURST messages through the radio:
+# first with the blocking LoRaE32 driver, then with AsyncLoRaE32. With the blocking
+# driver the probe is starved for the whole send; with the async one the lag stays
+# close to the polling interval.
+#
+# Wiring is the same as main.py (UART1, M0=21, M1=22, no AUX).
+
+from lora_e32 import LoRaE32
+from lora_e32_async import AsyncLoRaE32
+from lora_e32_operation_constant import ResponseStatusCode
+from machine import UART
+import uasyncio as asyncio
+import utime
+
+MODEL = '433T20D'
+BURST = 20
+PROBE_PERIOD_MS = 10
+MESSAGE = 'P000000 H:12 A:7 T:42:17'
+
+
+async def probe(lags, stop):
+    while not stop[0]:
+        t = utime.ticks_ms()
+        await asyncio.sleep_ms(PROBE_PERIOD_MS)
+        lags.append(utime.ticks_diff(utime.ticks_ms(), t) - PROBE_PERIOD_MS)
+
+
+async def blocking_sender(lora, stop):
+    for _ in range(BURST):
+        lora.send_transparent_message(MESSAGE)
+        await asyncio.sleep_ms(0)
+    stop[0] = True
+
+
+async def async_sender(lora, stop):
+    for _ in range(BURST):
+        await lora.send_transparent_message(MESSAGE)
+    stop[0] = True
+
+
+async def run(name, sender, lora):
+    lags = []
+    stop = [False]
+    t = utime.ticks_ms()
+    await asyncio.gather(probe(lags, stop), sender(lora, stop))
+    elapsed = utime.ticks_diff(utime.ticks_ms(), t)
+
+    lags.sort()
+    print("{}: {} msgs in {} ms, probe wakeups {}, lag avg {} ms, p99 {} ms, max {} ms".format(
+        name, BURST, elapsed, len(lags),
+        sum(lags) // max(len(lags), 1),
+        lags[min(len(lags) - 1, len(lags) * 99 // 100)] if lags else 0,
+        lags[-1] if lags else 0))
+
+
+async def main():
+    uart1 = UART(1, baudrate=9600)
+
+    lora = LoRaE32(MODEL, uart1, m0_pin=21, m1_pin=22)
+    print("Initialization: {}", ResponseStatusCode.get_description(lora.begin()))
+    await run("LoRaE32 (blocking)", blocking_sender, lora)
+
+    alora = AsyncLoRaE32(MODEL, uart1, m0_pin=21, m1_pin=22)
+    print("Initialization: {}", ResponseStatusCode.get_description(await alora.begin()))
+    await run("AsyncLoRaE32", async_sender, alora)
+
+
+asyncio.run(main())
@@ -0,0 +1,45 @@
+# Description:
+# Compares the schema based binary records of lora_e32_codec with ujson for typical
+# scoreboard payloads: encoded size (bytes on air) and encode/decode time.
+# It doesn't need the radio, run it on the Pico (or any MicroPython board).
+
+from lora_e32_codec import RecordCodec, Schema
+import ujson
+import utime
+
+ROUNDS = 200
+
+codec = RecordCodec()
+codec.register(Schema(1, 'score',
+                      [('home', 'u8'), ('away', 'u8'), ('period', 'u8'), ('clock', 'u16')],
+                      optional=[(1, 'home_fouls', 'u8'), (2, 'away_fouls', 'u8'),
+                                (3, 'possession', 'bool'), (4, 'shot_clock', 'u8')]))
+codec.register(Schema(2, 'teams', [('project', 'u32'), ('home_name', 'str'), ('away_name', 'str')]))
+
+PAYLOADS = [
+    ('score', {'home': 12, 'away': 7, 'period': 2, 'clock': 2537}),
+    ('score', {'home': 102, 'away': 99, 'period': 4, 'clock': 59, 'home_fouls': 5, 'away_fouls': 3,
+               'possession': True, 'shot_clock': 14}),
+    ('teams', {'project': 230411, 'home_name': 'Tigers', 'away_name': 'Lions'}),
+]
+
+
+def measure(fn, arg):
+    t = utime.ticks_us()
+    for _ in range(ROUNDS):
+        fn(arg)
+    return utime.ticks_diff(utime.ticks_us(), t) / ROUNDS
+
+
+for schema, record in PAYLOADS:
+    binary = codec.encode(record, schema)
+    text = ujson.dumps(record)
+    assert codec.decode(binary)[1] == record
+
+    print("{}: {} fields".format(schema, len(record)))
+    print("  size   json {:4d} B  record {:4d} B  ({}%)".format(
+        len(text), len(binary), 100 * len(binary) // len(text)))
+    print("  encode json {:7.1f} us  record {:7.1f} us".format(
+        measure(ujson.dumps, record), measure(lambda r: codec.encode(r, schema), record)))
+    print("  decode json {:7.1f} us  record {:7.1f} us".format(
+        measure(ujson.loads, text), measure(codec.decode, binary)))
@@ -0,0 +1,221 @@
+# Description:
+# Throughput / latency benchmark of the LoRaE32 driver against the e32emu emulator.
+# Run it on the PC (CPython), not on the board:
+#
+#   python benchmark_driver.py --iterations 50 --json results.json
+#   python benchmark_driver.py --baseline results.json --tolerance 10
+#
+# Every case runs the real driver code (send, receive, configuration round trips,
+# dict encode/decode) on an emulated module wired like main.py plus an AUX pin. For
+# each case it reports messages/s, p50/p99 latency, the part of the latency that is
+# not time on air (driver overhead, sends only) and the bytes allocated per operation
+# (tracemalloc peak, measured in a separate pass so it doesn't slow the timed one).
+# With --baseline the p50 latencies are compared with a previous --json file and the
+# exit status is 1 when a case got slower than --tolerance percent. With --json - the
+# JSON goes to stdout and the table, the comparison and the logs to stderr.
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+import e32emu
+
+MODEL = '433T20D'
+MESSAGE = 'P000000 H:12 A:7 T:42:17'
+DICT_MESSAGE = {'project': 230411, 'home': 12, 'away': 7, 'clock': 2537}
+GATEWAY = (0x00, 0x01, 0x17)
+SCOREBOARD = (0x00, 0x02, 0x17)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+class Bench:
+    def __init__(self, args):
+        board = e32emu.install()
+        air = e32emu.Air()
+        configuration = bytearray(e32emu.DEFAULT_CONFIGURATION)
+        configuration[3] = (configuration[3] & 0b11111000) | args.air_data_rate
+        self.gateway = e32emu.E32Module(board, 1, m0_pin=21, m1_pin=22, aux_pin=args.aux_pin,
+                                        configuration=configuration, air=air)
+        self.scoreboard = e32emu.E32Module(board, 0, m0_pin=2, m1_pin=3, aux_pin=4,
+                                           configuration=configuration, air=air)
+
+        # after install(): they import machine
+        from machine import UART
+        from lora_e32 import LoRaE32
+        from lora_e32_operation_constant import ResponseStatusCode
+        self.success = ResponseStatusCode.E32_SUCCESS
+
+        self.lora = LoRaE32(MODEL, UART(1), aux_pin=args.aux_pin, m0_pin=21, m1_pin=22,
+                            uart_baudrate=args.baudrate)
+        self.peer = LoRaE32(MODEL, UART(0), aux_pin=4, m0_pin=2, m1_pin=3)
+        self._check(self.lora.begin(), 'begin')
+        self._check(self.peer.begin(), 'peer begin')
+        for lora, (ADDH, ADDL, CHAN) in ((self.lora, GATEWAY), (self.peer, SCOREBOARD)):
+            code, configuration = lora.get_configuration(refresh=True)
+            configuration.ADDH, configuration.ADDL, configuration.CHAN = ADDH, ADDL, CHAN
+            self._check(lora.set_configuration(configuration)[0], 'configuration')
+
+    def _check(self, code, what):
+        if code != self.success:
+            raise RuntimeError("{}: {}".format(what, code))
+
+    def _drain_peer(self):
+        # the scoreboard module doesn't keep what the gateway sends
+        self.peer.reader.clear()
+
+    # --- cases: (setup, operation, airtime of the payload or None) ---------------------
+
+    def send_transparent(self):
+        return self._drain_peer, lambda: self.lora.send_transparent_message(MESSAGE), len(MESSAGE)
+
+    def send_fixed(self):
+        return self._drain_peer, lambda: self.lora.send_fixed_message(*SCOREBOARD, MESSAGE), len(MESSAGE)
+
+    def send_dict(self):
+        size = len(json.dumps(DICT_MESSAGE))
+        return self._drain_peer, lambda: self.lora.send_fixed_dict(*SCOREBOARD, DICT_MESSAGE), size
+
+    def receive(self):
+        return lambda: self.gateway.inject(MESSAGE.encode()), lambda: self.lora.receive_message(), None
+
+    def receive_dict(self):
+        payload = json.dumps(DICT_MESSAGE).encode()
+        return lambda: self.gateway.inject(payload), lambda: self.lora.receive_dict(), None
+
+    def get_configuration(self):
+        return None, lambda: self.lora.get_configuration(refresh=True), None
+
+    def set_configuration(self):
+        code, configuration = self.lora.get_configuration()
+        channels = [GATEWAY[2] + 1, GATEWAY[2]]
+
+        def operation():
+            configuration.CHAN = channels[0]
+            channels.reverse()
+            return self.lora.set_configuration(configuration)
+
+        return None, operation, None
+
+    CASES = ('send_transparent', 'send_fixed', 'send_dict', 'receive', 'receive_dict',
+             'get_configuration', 'set_configuration')
+
+    def run(self, name, iterations):
+        setup, operation, airtime_size = getattr(self, name)()
+        airtime_ms = None
+        if airtime_size is not None:
+            airtime_ms = e32emu.time_on_air_ms(self.gateway.air_data_rate, self.gateway.fec, airtime_size)
+
+        latencies = []
+        failures = 0
+        for _ in range(iterations):
+            if setup is not None:
+                setup()
+            t = time.perf_counter()
+            result = operation()
+            latencies.append((time.perf_counter() - t) * 1000)
+            code = result[0] if isinstance(result, tuple) else result
+            if code != self.success:
+                failures += 1
+
+        allocations = []
+        tracemalloc.start()
+        for _ in range(max(iterations // 5, 1)):
+            if setup is not None:
+                setup()
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            operation()
+            allocations.append(tracemalloc.get_traced_memory()[1] - before)
+        tracemalloc.stop()
+
+        result = {
+            'iterations': iterations,
+            'failures': failures,
+            'msgs_per_s': iterations * 1000 / sum(latencies),
+            'p50_ms': percentile(latencies, 0.5),
+            'p99_ms': percentile(latencies, 0.99),
+            'max_ms': max(latencies),
+            'alloc_bytes': sum(allocations) // len(allocations),
+        }
+        if airtime_ms is not None:
+            result['airtime_ms'] = airtime_ms
+            result['overhead_p50_ms'] = result['p50_ms'] - airtime_ms
+        return result
+
+
+def compare(results, baseline, tolerance) -> bool:
+    ok = True
+    print("\n{:<20} {:>10} {:>10} {:>8}".format('vs baseline', 'p50 ms', 'was', 'change'))
+    for name, result in results['cases'].items():
+        previous = baseline['cases'].get(name)
+        if previous is None:
+            continue
+        change = (result['p50_ms'] - previous['p50_ms']) * 100 / previous['p50_ms']
+        slower = change > tolerance
+        ok = ok and not slower
+        print("{:<20} {:>10.1f} {:>10.1f} {:>+7.1f}%{}".format(
+            name, result['p50_ms'], previous['p50_ms'], change, '  SLOWER' if slower else ''))
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LoRaE32 driver benchmark on the e32emu emulator")
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--cases', nargs='*', choices=Bench.CASES, default=Bench.CASES)
+    parser.add_argument('--baudrate', type=int, default=9600, help='UART rate of the normal mode traffic')
+    parser.add_argument('--air-data-rate', type=int, default=2, help='AirDataRate code (2 = 2.4kbps)')
+    parser.add_argument('--no-aux', dest='aux_pin', action='store_const', const=None, default=15,
+                        help='run the driver without AUX pin (fixed waits, like main.py)')
+    parser.add_argument('--json', help='write the results to this file (- for stdout)')
+    parser.add_argument('--baseline', help='results of a previous --json run to compare with')
+    parser.add_argument('--tolerance', type=float, default=10, help='p50 slowdown (%%) that fails --baseline')
+    args = parser.parse_args()
+
+    # with --json - stdout carries the JSON only: the table, the comparison and the
+    # driver logs (printed) go to stderr
+    out = sys.stdout
+    if args.json == '-':
+        sys.stdout = sys.stderr
+
+    bench = Bench(args)
+    results = {
+        'model': MODEL,
+        'baudrate': args.baudrate,
+        'air_data_rate': args.air_data_rate,
+        'aux': args.aux_pin is not None,
+        'cases': {},
+    }
+
+    print("{:<20} {:>8} {:>9} {:>9} {:>9} {:>11} {:>9}".format(
+        'case', 'msg/s', 'p50 ms', 'p99 ms', 'air ms', 'overhead ms', 'alloc B'))
+    for name in args.cases:
+        result = bench.run(name, args.iterations)
+        results['cases'][name] = result
+        print("{:<20} {:>8.1f} {:>9.1f} {:>9.1f} {:>9} {:>11} {:>9}{}".format(
+            name, result['msgs_per_s'], result['p50_ms'], result['p99_ms'],
+            '{:.1f}'.format(result['airtime_ms']) if 'airtime_ms' in result else '-',
+            '{:.1f}'.format(result['overhead_p50_ms']) if 'overhead_p50_ms' in result else '-',
+            result['alloc_bytes'], '  ({} failed)'.format(result['failures']) if result['failures'] else ''))
+
+    if args.json == '-':
+        json.dump(results, out, indent=2)
+        out.write('\n')
+    elif args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
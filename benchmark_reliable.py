@@ -0,0 +1,77 @@
+# Description:
+# Compares the sliding window of lora_e32_reliable with stop-and-wait (window=1) on a
+# simulated lossy channel: two ReliableLink endpoints exchange messages through
+# SimulatedRadio objects that drop LOSS of the packets and block for the airtime of
+# each packet, like the module does while AUX is low.
+# It doesn't need the radio, run it on the Pico (or any MicroPython board).
+
+from lora_e32_operation_constant import ResponseStatusCode
+from lora_e32_reliable import ReliableLink
+
+import random
+import utime
+
+MESSAGES = 60
+MESSAGE = b'{"home": 12, "away": 7, "clock": 2537}'
+LOSS = 0.2
+# 19.2kbps: ~1 ms per byte plus the preamble
+AIRTIME_MS_PER_BYTE = 1
+AIR_OVERHEAD_MS = 6
+
+
+class SimulatedRadio:
+    def __init__(self, loss):
+        self.loss = loss
+        self.peer = None
+        self._rx = []
+        self.sent = 0
+        self.lost = 0
+
+    def estimate_transmit_time_ms(self, size) -> int:
+        return AIR_OVERHEAD_MS + size * AIRTIME_MS_PER_BYTE
+
+    def send_fixed_message(self, ADDH, ADDL, CHAN, message) -> ResponseStatusCode:
+        utime.sleep_ms(self.estimate_transmit_time_ms(len(message)))
+        self.sent += 1
+        if random.random() < self.loss:
+            self.lost += 1
+        else:
+            self.peer._rx.append(bytes(message))
+        return ResponseStatusCode.E32_SUCCESS
+
+    def receive_frame(self, timeout=0):
+        if not self._rx:
+            return ResponseStatusCode.ERR_E32_DATA_SIZE_NOT_MATCH, None
+        return ResponseStatusCode.E32_SUCCESS, self._rx.pop(0)
+
+
+def run(window):
+    random.seed(1)
+    radio_a = SimulatedRadio(LOSS)
+    radio_b = SimulatedRadio(LOSS)
+    radio_a.peer = radio_b
+    radio_b.peer = radio_a
+    a = ReliableLink(radio_a, 0, 1, 23, window=window, max_retries=8, max_pending=MESSAGES)
+    b = ReliableLink(radio_b, 0, 2, 23, window=window)
+
+    for i in range(MESSAGES):
+        a.send(0, 2, 23, MESSAGE)
+
+    received = 0
+    t = utime.ticks_ms()
+    while a.pending():
+        a.poll()
+        received += b.poll()
+    elapsed = utime.ticks_diff(utime.ticks_ms(), t)
+
+    stats = a.stats((0, 2, 23))
+    print("window {}: {} of {} received in {} ms ({:.1f} msg/s), packets on air {}".format(
+        window, received, MESSAGES, elapsed, received * 1000 / elapsed, radio_a.sent + radio_b.sent))
+    print("  " + str(stats))
+    return elapsed
+
+
+stop_and_wait = run(1)
+for window in (4, 8):
+    elapsed = run(window)
+    print("  {:.2f}x faster than stop-and-wait".format(stop_and_wait / elapsed))
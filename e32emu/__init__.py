@@ -0,0 +1,46 @@
+#############################################################################################
+# Host side emulator of the Pico + EBYTE LoRa E32, to run lora_e32 on CPython
+#
+# install() puts fake machine, utime, ure, ujson, micropython and uasyncio modules in
+# sys.modules and returns the Board; E32Module objects attached to it play the radio
+# on a UART id and pins, exactly as wired on the Pico:
+#
+#   import e32emu
+#   board = e32emu.install()
+#   air = e32emu.Air()
+#   gateway = e32emu.E32Module(board, 1, m0_pin=21, m1_pin=22, aux_pin=15, air=air)
+#   scoreboard = e32emu.E32Module(board, 0, m0_pin=2, m1_pin=3, aux_pin=4, air=air)
+#
+#   from machine import UART
+#   from lora_e32 import LoRaE32
+#   lora = LoRaE32('433T20D', UART(1), aux_pin=15, m0_pin=21, m1_pin=22)
+#   lora.begin()
+#   lora.send_transparent_message('hello')
+#   print(gateway.transmitted, scoreboard.received)
+#
+# install() must run before the first import of lora_e32 (or of anything importing
+# machine). The board runs on the real clock: airtime and AUX waits take their time.
+#############################################################################################
+
+import sys
+
+from e32emu.board import Board, MICROPYTHON_MODULES, TICKS_PERIOD
+from e32emu.module import E32Module, Air, Packet, DEFAULT_CONFIGURATION, time_on_air_ms
+
+board = None
+
+
+def install(ticks_offset_ms=0) -> Board:
+    """Install the fake MicroPython modules (once) and return the board"""
+    global board
+    if board is None:
+        board = Board(ticks_offset_ms)
+        board.install()
+    return board
+
+
+def uninstall():
+    global board
+    for name in MICROPYTHON_MODULES:
+        sys.modules.pop(name, None)
+    board = None
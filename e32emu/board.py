@@ -0,0 +1,331 @@
+#############################################################################################
+# Fake MicroPython board for CPython: machine, utime, ure, ujson, micropython, uasyncio
+#
+# The modules are built on a Board that owns the pins and the UARTs by id. An E32Module
+# attached to the board sees the M0/M1 pins driven by the driver, drives AUX and
+# exchanges bytes with the UART of the same id. Every call that can observe the
+# hardware (ticks_ms, Pin.value, UART.any, ...) first lets the modules catch up with
+# the time, so AUX edges and received bytes show up as on the board.
+#
+# ticks_ms()/ticks_us() wrap like on the RP2040 port (TICKS_PERIOD), ticks_diff()
+# handles the wrap: drivers that forget it fail here too.
+#############################################################################################
+
+import asyncio
+import json
+import re
+import sys
+import time
+import types
+
+TICKS_PERIOD = 1 << 30
+TICKS_MAX = TICKS_PERIOD - 1
+TICKS_HALFPERIOD = TICKS_PERIOD // 2
+
+MICROPYTHON_MODULES = ('machine', 'utime', 'ure', 'ujson', 'micropython', 'uasyncio')
+
+
+class _PinState:
+    def __init__(self, value=0):
+        self.value = value
+        self.handler = None
+        self.trigger = 0
+        self.pin = None
+
+
+class Board:
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    def __init__(self, ticks_offset_ms=0):
+        # start near the wrap to catch the ticks_diff() mistakes early
+        self._t0 = time.monotonic() - ticks_offset_ms / 1000
+        self.pins = {}
+        self.uart_rx = {}
+        # (baudrate, parity) of the host UARTs, the modules check it
+        self.uart_config = {}
+        self.modules = []
+        self._ticking = False
+
+    def ms(self) -> float:
+        """Time of the board in ms (float, no wrap), the modules run on it"""
+        return (time.monotonic() - self._t0) * 1000
+
+    def pin_state(self, pin_id) -> _PinState:
+        state = self.pins.get(pin_id)
+        if state is None:
+            state = _PinState()
+            self.pins[pin_id] = state
+        return state
+
+    def pin_value(self, pin_id) -> int:
+        if pin_id is None:
+            return 0
+        return self.pin_state(pin_id).value
+
+    # Driven by the modules: the IRQ handler runs inline, like a soft IRQ
+    def drive_pin(self, pin_id, value):
+        if pin_id is None:
+            return
+        state = self.pin_state(pin_id)
+        if state.value == value:
+            return
+        state.value = value
+        edge = self.IRQ_RISING if value else self.IRQ_FALLING
+        if state.handler is not None and state.trigger & edge:
+            state.handler(state.pin)
+
+    def module_on_uart(self, uart_id):
+        for module in self.modules:
+            if module.uart_id == uart_id:
+                return module
+        return None
+
+    def rx_buffer(self, uart_id) -> bytearray:
+        buf = self.uart_rx.get(uart_id)
+        if buf is None:
+            buf = bytearray()
+            self.uart_rx[uart_id] = buf
+        return buf
+
+    def tick(self):
+        # a handler called by a module may read the time or a pin again
+        if self._ticking:
+            return
+        self._ticking = True
+        try:
+            now = self.ms()
+            for module in self.modules:
+                module.update(now)
+        finally:
+            self._ticking = False
+
+    def make_modules(self) -> dict:
+        return {
+            'machine': _make_machine(self),
+            'utime': _make_utime(self),
+            'ure': _alias('ure', re),
+            'ujson': _alias('ujson', json),
+            'micropython': _make_micropython(),
+            'uasyncio': _make_uasyncio(self),
+        }
+
+    def install(self):
+        sys.modules.update(self.make_modules())
+
+
+def _alias(name, module):
+    alias = types.ModuleType(name)
+    alias.__dict__.update({k: v for k, v in module.__dict__.items() if not k.startswith('__')})
+    return alias
+
+
+def _make_machine(board):
+    machine = types.ModuleType('machine')
+
+    class Pin:
+        IN = 0
+        OUT = 1
+        OPEN_DRAIN = 2
+        PULL_UP = 1
+        PULL_DOWN = 2
+        IRQ_FALLING = Board.IRQ_FALLING
+        IRQ_RISING = Board.IRQ_RISING
+
+        def __init__(self, id, mode=IN, pull=None, value=None):
+            self.id = id
+            self._state = board.pin_state(id)
+            self._state.pin = self
+            if value is not None:
+                self._state.value = 1 if value else 0
+
+        def value(self, value=None):
+            if value is None:
+                board.tick()
+                return self._state.value
+            self._state.value = 1 if value else 0
+            board.tick()
+
+        def __call__(self, value=None):
+            return self.value(value)
+
+        def on(self):
+            self.value(1)
+
+        def off(self):
+            self.value(0)
+
+        def toggle(self):
+            self.value(1 - self._state.value)
+
+        def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING, hard=False):
+            self._state.handler = handler
+            self._state.trigger = trigger
+
+    class UART:
+        def __init__(self, id, baudrate=9600, bits=8, parity=None, stop=1, **kwargs):
+            self.id = id
+            self.init(baudrate, bits, parity, stop)
+
+        def init(self, baudrate=9600, bits=8, parity=None, stop=1, **kwargs):
+            self.baudrate = baudrate
+            self.bits = bits
+            self.parity = parity
+            self.stop = stop
+            board.uart_config[self.id] = (baudrate, parity)
+
+        def deinit(self):
+            pass
+
+        def _rx(self) -> bytearray:
+            board.tick()
+            return board.rx_buffer(self.id)
+
+        def write(self, buf) -> int:
+            board.tick()
+            module = board.module_on_uart(self.id)
+            if module is not None:
+                module.host_write(bytes(buf), self.baudrate, self.parity)
+            return len(buf)
+
+        def any(self) -> int:
+            return len(self._rx())
+
+        def read(self, nbytes=None):
+            rx = self._rx()
+            if not rx:
+                return None
+            if nbytes is None:
+                nbytes = len(rx)
+            data = bytes(rx[:nbytes])
+            del rx[:nbytes]
+            return data
+
+        def readinto(self, buf, nbytes=None):
+            rx = self._rx()
+            if not rx:
+                return None
+            n = min(len(buf), len(rx)) if nbytes is None else min(nbytes, len(buf), len(rx))
+            buf[:n] = rx[:n]
+            del rx[:n]
+            return n
+
+        def readline(self):
+            rx = self._rx()
+            end = rx.find(b'\n')
+            return self.read(len(rx) if end < 0 else end + 1)
+
+        def flush(self):
+            pass
+
+        def txdone(self) -> bool:
+            return True
+
+    def idle():
+        board.tick()
+        time.sleep(0.0001)
+
+    def lightsleep(ms=None):
+        time.sleep((ms or 0) / 1000)
+        board.tick()
+
+    machine.Pin = Pin
+    machine.UART = UART
+    machine.idle = idle
+    machine.lightsleep = lightsleep
+    machine.deepsleep = lightsleep
+    machine.unique_id = lambda: b'\xe6\x61\x41\x04\x03\x2e\x5a\x2a'
+    machine.freq = lambda hz=None: 125000000
+    machine.reset = lambda: None
+    return machine
+
+
+def _make_utime(board):
+    utime = types.ModuleType('utime')
+
+    def ticks_ms():
+        board.tick()
+        return int(board.ms()) & TICKS_MAX
+
+    def ticks_us():
+        board.tick()
+        return int(board.ms() * 1000) & TICKS_MAX
+
+    def ticks_add(ticks, delta):
+        return (ticks + delta) & TICKS_MAX
+
+    def ticks_diff(ticks1, ticks2):
+        return ((ticks1 - ticks2 + TICKS_HALFPERIOD) & TICKS_MAX) - TICKS_HALFPERIOD
+
+    def sleep_ms(ms):
+        time.sleep(max(ms, 0) / 1000)
+        board.tick()
+
+    def sleep_us(us):
+        time.sleep(max(us, 0) / 1000000)
+        board.tick()
+
+    def sleep(seconds):
+        time.sleep(seconds)
+        board.tick()
+
+    utime.ticks_ms = ticks_ms
+    utime.ticks_us = ticks_us
+    utime.ticks_cpu = ticks_us
+    utime.ticks_add = ticks_add
+    utime.ticks_diff = ticks_diff
+    utime.sleep_ms = sleep_ms
+    utime.sleep_us = sleep_us
+    utime.sleep = sleep
+    utime.time = time.time
+    utime.localtime = time.localtime
+    return utime
+
+
+def _make_micropython():
+    micropython = types.ModuleType('micropython')
+
+    def _identity(f):
+        return f
+
+    micropython.const = lambda value: value
+    micropython.native = _identity
+    micropython.viper = _identity
+    micropython.schedule = lambda func, arg: func(arg)
+    micropython.alloc_emergency_exception_buf = lambda size: None
+    micropython.mem_info = lambda *args: None
+    return micropython
+
+
+def _make_uasyncio(board):
+    uasyncio = _alias('uasyncio', asyncio)
+
+    async def sleep_ms(ms):
+        await asyncio.sleep(max(ms, 0) / 1000)
+        board.tick()
+
+    async def wait_for_ms(awaitable, timeout):
+        return await asyncio.wait_for(awaitable, timeout / 1000)
+
+    # Set from a (soft) IRQ handler: the waiter polls the board, so the edges produced
+    # by the modules are seen without a thread
+    class ThreadSafeFlag:
+        def __init__(self):
+            self._flag = False
+
+        def set(self):
+            self._flag = True
+
+        def clear(self):
+            self._flag = False
+
+        async def wait(self):
+            while not self._flag:
+                await asyncio.sleep(0.0005)
+                board.tick()
+            self._flag = False
+
+    uasyncio.sleep_ms = sleep_ms
+    uasyncio.wait_for_ms = wait_for_ms
+    uasyncio.ThreadSafeFlag = ThreadSafeFlag
+    return uasyncio
@@ -0,0 +1,422 @@
+#############################################################################################
+# Model of an EBYTE LoRa E32 module for the fake board
+#
+#   - M1/M0 select the mode (0 normal, 1 wake-up, 2 power saving, 3 program/sleep), the
+#     switch takes MODE_SWITCH_MS with AUX low and the input is ignored meanwhile
+#   - program mode talks at 9600 8N1 and understands C0/C2 + 5 bytes (write, saved or
+#     not) and C1 C1 C1, C3 C3 C3, C4 C4 C4 (read configuration, version, reset)
+#   - the other modes talk at the configured SPED rate/parity; bytes at another rate
+#     are lost (framing_errors)
+#   - in normal/wake-up mode the written bytes go to the 512 bytes TX buffer and are
+#     sent in packets of up to 58 bytes when the UART is quiet for 3 bytes or a packet
+#     is full; with fixed transmission the first 3 bytes of a write are ADDH, ADDL, CHAN
+#   - a packet stays on air for its time on air (air data rate, FEC, plus the wake-up
+#     preamble in mode 1), AUX is low while the buffer is not empty
+#   - modules on the same Air receive the packets for their address (or broadcast) on
+#     their channel and air data rate, in mode 2 only the ones with a preamble; packets
+#     overlapping on a channel collide, the receiver outputs the payload on its UART
+#
+# It is a model of the behaviour described in the datasheet, good enough to exercise
+# the driver and compare timings, not a measure of a real module.
+#############################################################################################
+
+import random
+
+from lora_e32_constants import AirDataRate, UARTBaudRate, UARTParity, WirelessWakeUpTime
+
+MODE_SWITCH_MS = 2
+# AUX stays low this long after the last packet left the air
+AUX_TAIL_MS = 2
+# AUX goes low this long before a received packet is output on the UART
+AUX_LEAD_MS = 2
+PROGRAM_RESPONSE_MS = 5
+PROGRAM_SAVE_MS = 30
+RESET_MS = 100
+TX_BUFFER_SIZE = 512
+MAX_PACKET_SIZE = 58
+AIR_OVERHEAD_BYTES = 6
+PROGRAM_BAUDRATE = 9600
+
+DEFAULT_CONFIGURATION = b'\xc0\x00\x00\x1a\x17\x44'
+BROADCAST_ADDRESS = 0xFF
+
+_FREQUENCY_CODES = {170: 0x46, 433: 0x32, 470: 0x38, 868: 0x45, 915: 0x44}
+
+
+def time_on_air_ms(air_data_rate, fec, payload_size) -> float:
+    bits = (payload_size + AIR_OVERHEAD_BYTES) * 8
+    if not fec:
+        bits = bits * 4 / 5
+    return bits * 1000 / AirDataRate.get_bits_per_second(air_data_rate)
+
+
+class Packet:
+    def __init__(self, source, ADDH, ADDL, CHAN, payload, air_data_rate, wake, start_ms, end_ms):
+        self.source = source
+        self.ADDH = ADDH
+        self.ADDL = ADDL
+        self.CHAN = CHAN
+        self.payload = payload
+        self.air_data_rate = air_data_rate
+        self.wake = wake
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+        self.collided = False
+
+    def __repr__(self):
+        return "Packet({:02X}{:02X}@{} {} bytes{} {:.1f}-{:.1f} ms)".format(
+            self.ADDH, self.ADDL, self.CHAN, len(self.payload), ' wake' if self.wake else '',
+            self.start_ms, self.end_ms)
+
+
+class Air:
+    """Medium shared by the modules: delivery, collisions and random loss"""
+
+    def __init__(self, loss=0.0, seed=None):
+        self.loss = loss
+        self.random = random.Random(seed)
+        self.modules = []
+        self.packets = []
+        self.collisions = 0
+
+    def start(self, packet):
+        for other in self.packets:
+            if other.CHAN == packet.CHAN and other.start_ms < packet.end_ms and packet.start_ms < other.end_ms:
+                if not other.collided:
+                    self.collisions += 1
+                other.collided = True
+                packet.collided = True
+        self.packets.append(packet)
+        # keep the recent ones only, for the overlaps
+        self.packets = [p for p in self.packets if p.end_ms > packet.start_ms - 10000]
+
+    def deliver(self, packet):
+        for module in self.modules:
+            if module is packet.source:
+                continue
+            if packet.collided or (self.loss and self.random.random() < self.loss):
+                module.packets_lost += 1
+                continue
+            module.air_receive(packet)
+
+
+class _Burst:
+    # bytes written without a pause: a packet (fixed transmission: one header)
+    def __init__(self, start_ms, period_ms):
+        self.data = bytearray()
+        self.end_ms = start_ms
+        self.period_ms = period_ms
+
+    def arrival_ms(self, size) -> float:
+        """Time the first `size` bytes are in the module"""
+        return self.end_ms - (len(self.data) - size) * self.period_ms
+
+
+class E32Module:
+    def __init__(self, board, uart_id, m0_pin=None, m1_pin=None, aux_pin=None, model='433T20D',
+                 configuration=DEFAULT_CONFIGURATION, air=None, mode=0):
+        self.board = board
+        self.uart_id = uart_id
+        self.m0_pin = m0_pin
+        self.m1_pin = m1_pin
+        self.aux_pin = aux_pin
+        self.model = model
+        self.air = air if air is not None else Air()
+        self.air.modules.append(self)
+        board.modules.append(self)
+
+        self.saved = bytearray(configuration)
+        self.saved[0] = 0xC0
+        self.config = bytearray(self.saved)
+
+        # mode used when M0/M1 are not wired (set by hand like jumpers)
+        self.fixed_mode = mode
+        self.mode = self._pins_mode()
+        self._target_mode = self.mode
+        self._mode_ready_ms = None
+
+        self._bursts = []
+        self._buffered = 0
+        self._tx_until = 0.0
+        self._tx_intervals = []
+        self._in_flight = []
+        # (time, bytes) to output on the UART, and AUX low until _busy_until
+        self._output = []
+        self._busy_until = 0.0
+        self._reset_until = 0.0
+        self._command = bytearray()
+
+        self.transmitted = []
+        self.received = []
+        self.packets_sent = 0
+        self.packets_received = 0
+        self.packets_lost = 0
+        self.tx_overflows = 0
+        self.framing_errors = 0
+        self.ignored_bytes = 0
+        self.invalid_commands = 0
+        self.resets = 0
+
+        board.drive_pin(aux_pin, 1)
+
+    # --- configuration ---------------------------------------------------------------
+
+    @property
+    def ADDH(self):
+        return self.config[1]
+
+    @property
+    def ADDL(self):
+        return self.config[2]
+
+    @property
+    def CHAN(self):
+        return self.config[4]
+
+    @property
+    def uart_baudrate(self) -> int:
+        return UARTBaudRate.get_bps((self.config[3] >> 3) & 0b111)
+
+    @property
+    def uart_parity(self):
+        return UARTParity.get_uart_value(self.config[3] >> 6)
+
+    @property
+    def air_data_rate(self) -> int:
+        return self.config[3] & 0b111
+
+    @property
+    def fec(self) -> bool:
+        return bool(self.config[5] & 0b100)
+
+    @property
+    def fixed_transmission(self) -> bool:
+        return bool(self.config[5] & 0x80)
+
+    @property
+    def wake_up_time_ms(self) -> int:
+        return WirelessWakeUpTime.get_milliseconds((self.config[5] >> 3) & 0b11)
+
+    def module_version(self) -> bytes:
+        try:
+            frequency = _FREQUENCY_CODES.get(int(self.model[:3]), 0x32)
+        except ValueError:
+            frequency = 0x32
+        return bytes([0xC3, frequency, 0x0D, 0x14])
+
+    # --- host side -------------------------------------------------------------------
+
+    def _pins_mode(self) -> int:
+        if self.m0_pin is None or self.m1_pin is None:
+            return self.fixed_mode
+        return self.board.pin_value(self.m0_pin) | (self.board.pin_value(self.m1_pin) << 1)
+
+    def _host_rate(self):
+        if self.mode == 3:
+            return PROGRAM_BAUDRATE, None
+        return self.uart_baudrate, self.uart_parity
+
+    def host_write(self, data, baudrate, parity=None):
+        now = self.board.ms()
+        if self._mode_ready_ms is not None or now < self._reset_until:
+            self.ignored_bytes += len(data)
+        elif (baudrate, parity) != self._host_rate():
+            self.framing_errors += len(data)
+        elif self.mode == 3:
+            self._command += data
+            self._run_commands(now)
+        elif self.mode == 2:
+            # no transmission in power saving mode
+            self.ignored_bytes += len(data)
+        else:
+            self._buffer(now, data, baudrate)
+        self._drive_aux(now)
+
+    def _buffer(self, now, data, baudrate):
+        room = TX_BUFFER_SIZE - self._buffered
+        if len(data) > room:
+            self.tx_overflows += len(data) - room
+            data = data[:room]
+        if not data:
+            return
+        period = 10000 / baudrate
+        burst = self._bursts[-1] if self._bursts else None
+        # a write within 3 bytes of the previous one continues its packet
+        if burst is None or now > burst.end_ms + 3 * period:
+            burst = _Burst(now, period)
+            self._bursts.append(burst)
+        burst.end_ms = max(burst.end_ms, now) + len(data) * period
+        burst.data += data
+        self._buffered += len(data)
+
+    def _run_commands(self, now):
+        command = self._command
+        while command:
+            head = command[0]
+            if head in (0xC0, 0xC2):
+                if len(command) < 6:
+                    return
+                self.config[1:6] = command[1:6]
+                busy = PROGRAM_RESPONSE_MS
+                if head == 0xC0:
+                    self.saved[1:6] = command[1:6]
+                    busy = PROGRAM_SAVE_MS
+                self._respond(now, bytes(self.config), busy)
+                del command[:6]
+            elif head in (0xC1, 0xC3, 0xC4):
+                if len(command) < 3:
+                    return
+                if command[1] != head or command[2] != head:
+                    self.invalid_commands += 1
+                    del command[:1]
+                    continue
+                del command[:3]
+                if head == 0xC1:
+                    self._respond(now, bytes(self.config), PROGRAM_RESPONSE_MS)
+                elif head == 0xC3:
+                    self._respond(now, self.module_version(), PROGRAM_RESPONSE_MS)
+                else:
+                    self.reset(now)
+                    return
+            else:
+                self.invalid_commands += 1
+                del command[:1]
+
+    def _respond(self, now, data, busy_ms):
+        self._output.append((now + PROGRAM_RESPONSE_MS, data))
+        self._busy_until = max(self._busy_until, now + busy_ms + len(data) * 10000 / PROGRAM_BAUDRATE)
+
+    def reset(self, now=None):
+        """C4 C4 C4: the saved configuration is reloaded, the buffers are lost"""
+        if now is None:
+            now = self.board.ms()
+        self.resets += 1
+        self.config[:] = self.saved
+        self._command = bytearray()
+        self._bursts = []
+        self._buffered = 0
+        self._output = []
+        self._busy_until = now + RESET_MS
+        self._reset_until = now + RESET_MS
+
+    # --- radio side ------------------------------------------------------------------
+
+    def _transmit(self, now):
+        while self._bursts:
+            burst = self._bursts[0]
+            header = 3 if self.fixed_transmission else 0
+            size = len(burst.data)
+            if size - header >= MAX_PACKET_SIZE:
+                ready = burst.arrival_ms(header + MAX_PACKET_SIZE)
+                payload_size = MAX_PACKET_SIZE
+            else:
+                # the tail of a write goes when the UART is quiet for 3 bytes
+                ready = burst.end_ms + 3 * burst.period_ms
+                payload_size = size - header
+            start = max(ready, self._tx_until)
+            if start > now:
+                return
+
+            if payload_size <= 0:
+                # a fixed transmission without payload: dropped
+                self._bursts.pop(0)
+                self._buffered -= size
+                continue
+
+            if header:
+                ADDH, ADDL, CHAN = burst.data[0], burst.data[1], burst.data[2]
+            else:
+                ADDH, ADDL, CHAN = self.ADDH, self.ADDL, self.CHAN
+            payload = bytes(burst.data[header:header + payload_size])
+            del burst.data[header:header + payload_size]
+            self._buffered -= payload_size
+            if len(burst.data) <= header:
+                self._bursts.pop(0)
+                self._buffered -= len(burst.data)
+
+            wake = self.mode == 1
+            airtime = time_on_air_ms(self.air_data_rate, self.fec, len(payload))
+            if wake:
+                airtime += self.wake_up_time_ms
+            packet = Packet(self, ADDH, ADDL, CHAN, payload, self.air_data_rate, wake, start, start + airtime)
+            self._tx_until = packet.end_ms
+            self._tx_intervals.append((packet.start_ms, packet.end_ms))
+            self._tx_intervals = self._tx_intervals[-8:]
+            self.transmitted.append(packet)
+            self.packets_sent += 1
+            self.air.start(packet)
+            self._in_flight.append(packet)
+
+    def _deliver(self, now):
+        while self._in_flight and self._in_flight[0].end_ms <= now:
+            self.air.deliver(self._in_flight.pop(0))
+
+    def _can_receive(self, packet) -> bool:
+        mode = self.mode if self._mode_ready_ms is None else None
+        if mode == 2:
+            if not packet.wake:
+                return False
+        elif mode not in (0, 1):
+            return False
+        if packet.CHAN != self.CHAN or packet.air_data_rate != self.air_data_rate:
+            return False
+        address = (packet.ADDH, packet.ADDL)
+        if address != (self.ADDH, self.ADDL) and address != (BROADCAST_ADDRESS, BROADCAST_ADDRESS) \
+                and (self.ADDH, self.ADDL) != (BROADCAST_ADDRESS, BROADCAST_ADDRESS):
+            return False
+        # half duplex: deaf while transmitting
+        for start, end in self._tx_intervals:
+            if start < packet.end_ms and packet.start_ms < end:
+                return False
+        return True
+
+    def air_receive(self, packet):
+        if not self._can_receive(packet):
+            return
+        self.packets_received += 1
+        self.received.append(packet)
+        self.inject(packet.payload, packet.end_ms)
+
+    def inject(self, payload, at_ms=None):
+        """Output `payload` on the UART as if it was received on air at `at_ms` (now)"""
+        if at_ms is None:
+            at_ms = self.board.ms()
+        at_ms = max(at_ms, self._busy_until)
+        self._output.append((at_ms + AUX_LEAD_MS, bytes(payload)))
+        self._busy_until = at_ms + AUX_LEAD_MS + len(payload) * 10000 / self.uart_baudrate
+
+    # --- time ------------------------------------------------------------------------
+
+    def update(self, now):
+        target = self._pins_mode()
+        if target != self._target_mode:
+            self._target_mode = target
+            self._mode_ready_ms = now + MODE_SWITCH_MS
+            self._command = bytearray()
+        if self._mode_ready_ms is not None and now >= self._mode_ready_ms:
+            self.mode = self._target_mode
+            self._mode_ready_ms = None
+
+        self._transmit(now)
+        self._deliver(now)
+
+        if self._output and self._output[0][0] <= now:
+            rx = self.board.rx_buffer(self.uart_id)
+            host = self.board.uart_config.get(self.uart_id)
+            while self._output and self._output[0][0] <= now:
+                data = self._output.pop(0)[1]
+                if host is not None and host != self._host_rate():
+                    self.framing_errors += len(data)
+                else:
+                    rx += data
+
+        self._drive_aux(now)
+
+    def busy(self, now=None) -> bool:
+        if now is None:
+            now = self.board.ms()
+        return self._mode_ready_ms is not None or bool(self._bursts) or bool(self._output) or \
+            now < self._tx_until + AUX_TAIL_MS or now < self._busy_until
+
+    def _drive_aux(self, now):
+        self.board.drive_pin(self.aux_pin, 0 if self.busy(now) else 1)
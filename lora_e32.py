@@ -45,44 +45,36 @@
 # THE SOFTWARE.
 #############################################################################################
 
-from lora_e32_constants import UARTParity, UARTBaudRate, TransmissionPower, ForwardErrorCorrectionSwitch, \
-    WirelessWakeUpTime, IODriveMode, FixedTransmission, AirDataRate, OperatingFrequency
+from lora_e32_constants import UARTParity, UARTBaudRate, ForwardErrorCorrectionSwitch, WirelessWakeUpTime, \
+    IODriveMode, FixedTransmission, AirDataRate, ModelSpec
 from lora_e32_operation_constant import ResponseStatusCode, ModeType, ProgramCommand, SerialUARTBaudRate
+from lora_e32_fragment import fragment_message, Reassembler, FRAGMENT_MARKER, FRAGMENT_HEADER_SIZE, \
+    FRAGMENT_PACKET_SIZE
+from lora_e32_reader import UARTRingReader
+from lora_e32_codec import RecordCodec, RECORD_MARKER
+from lora_e32_scheduler import DutyCycleScheduler
+from lora_e32_logging import Logger, getLogger
 
 import machine
+from micropython import const
 import ure
 import utime
 import ujson
 
 
-class Logger:
-    def __init__(self, enable_debug):
-        self.enable_debug = enable_debug
-        self.name = ''
+# True compiles back in the debug traces of the mode switch, AUX wait and send paths
+_DEBUG = const(False)
 
-    def debug(self, msg, *args):
-        if self.enable_debug:
-            print(self.name + ' DEBUG ' + msg, *args)
+# kept for the scripts that call lora_e32.logging.getLogger()
+logging = Logger()
 
-    def info(self, msg, *args):
-        if self.enable_debug:
-            print(self.name + ' INFO ' + msg, *args)
-
-    def error(self, msg, *args):
-        if self.enable_debug:
-            print(self.name + ' ERROR ' + msg, *args)
-
-    def getLogger(self, name):
-        self.name = name
-        return Logger(self.enable_debug)
-
-
-logging = Logger(True)
-
-logger = logging.getLogger(__name__)
+logger = getLogger(__name__)
 
 BROADCAST_ADDRESS = 0xFF
 
+# model is like 433T20D or 433T27D or 433T30D or 868T20S or 868T27S or 868T30S
+MODEL_REGEX = ure.compile('^(230|400|433|868|900|915|170)(T|R|S|M)(20|27|30|33|37)(S|D|C|U|E)?..?(\\d)?$')
+
 
 class Speed:
     def __init__(self, model):
@@ -105,15 +97,16 @@ class Speed:
 class Option:
     def __init__(self, model):
         self.model = model
+        self._spec = ModelSpec.get(model)
 
-        self.transmissionPower = TransmissionPower(self.model).get_transmission_power().get_default_value()
+        self.transmissionPower = self._spec.default_power
         self.fec = ForwardErrorCorrectionSwitch.FEC_1_ON
         self.wirelessWakeupTime = WirelessWakeUpTime.WAKE_UP_250
         self.ioDriveMode = IODriveMode.PUSH_PULLS_PULL_UPS
         self.fixedTransmission = FixedTransmission.TRANSPARENT_TRANSMISSION
 
     def get_transmission_power_description(self):
-        return TransmissionPower(self.model).get_transmission_power_description(self.transmissionPower)
+        return self._spec.power_class.get_description(self.transmissionPower)
 
     def get_fec_description(self):
         return ForwardErrorCorrectionSwitch.get_description(self.fec)
@@ -131,15 +124,11 @@ class Option:
 class Configuration:
     def __init__(self, model):
         self.model = model
+        self.spec = ModelSpec.get(model)
 
-        self.package_type = None
-        self.frequency = None
-        self.transmission_power = None
-
-        if model is not None:
-            self.package_type = model[6]
-            self.frequency = int(model[0:3])
-            self.transmission_power = int(model[4:6])
+        self.package_type = self.spec.package_type
+        self.frequency = self.spec.frequency
+        self.transmission_power = self.spec.transmission_power
 
         self.HEAD = 0
         self.ADDH = 0
@@ -158,7 +147,7 @@ class Configuration:
         return self.CHAN
 
     def get_frequency(self):
-        return OperatingFrequency.get_freq_from_channel(self.frequency, self.CHAN)
+        return self.spec.get_freq_from_channel(self.CHAN)
 
     def get_model(self):
         return self.model
@@ -207,6 +196,20 @@ class Configuration:
     def from_bytes(self, bytes):
         self.from_hex_array([x for x in bytes])
 
+    def get_time_on_air_ms(self, payload_size) -> int:
+        return time_on_air_ms(self.SPED.airDataRate, self.OPTION.fec, payload_size)
+
+    def copy(self):
+        configuration = Configuration(self.model)
+        configuration.from_hex_array(self.to_hex_array())
+        return configuration
+
+    # Index of the bytes (ADDH, ADDL, CHAN, SPED, OPTION) that differ, HEAD excluded
+    def diff(self, other) -> list:
+        mine = self.to_hex_array()
+        theirs = other.to_hex_array()
+        return [i for i in range(1, len(mine)) if mine[i] != theirs[i]]
+
 
 def print_configuration(configuration):
     print("----------------------------------------")
@@ -237,6 +240,36 @@ def print_configuration(configuration):
 
 MAX_SIZE_TX_PACKET = 58
 
+# Bytes of preamble, header and CRC the module adds on air to every packet
+AIR_OVERHEAD_BYTES = 6
+
+
+# Time on air of a packet: the nominal air data rate includes the FEC redundancy (the
+# module default), without FEC the same bits need 4/5 of the time. It's a model of the
+# module, good enough for pacing and scheduling, not a measure.
+def time_on_air_ms(air_data_rate, fec, payload_size) -> int:
+    bits = (payload_size + AIR_OVERHEAD_BYTES) * 8
+    if fec == ForwardErrorCorrectionSwitch.FEC_0_OFF:
+        bits = bits * 4 // 5
+    return (bits * 1000 + AirDataRate.get_bits_per_second(air_data_rate) - 1) // \
+        AirDataRate.get_bits_per_second(air_data_rate)
+
+# Time the module needs after AUX goes high before it accepts the next command
+AUX_SETTLE_MS = 2
+# Size of the module transmit buffer, fragments are streamed without waiting AUX up to this size
+MODULE_BUFFER_SIZE = 512
+# Bytes reserved in front of a TX buffer for ADDH, ADDL and CHAN of a fixed transmission
+TX_HEADER_SIZE = 3
+# Largest payload accepted in a single packet
+MAX_SIZE_TX_PAYLOAD = MAX_SIZE_TX_PACKET + 2
+# Configuration bytes (ADDH, ADDL, CHAN) that are changed at runtime: by default they
+# are written with WRITE_CFG_PWR_DWN_LOSE, so they don't wear the module flash
+TRANSIENT_CONFIGURATION_BYTES = (1, 2, 4)
+# The module answers a read command in a few ms, this bounds the wait of a response
+PROGRAM_RESPONSE_TIMEOUT_MS = 200
+# Largest program mode response (the configuration)
+PROGRAM_RESPONSE_MAX_SIZE = 6
+
 
 class ModuleInformation:
     def __init__(self):
@@ -271,18 +304,37 @@ class ModuleInformation:
         self.from_hex_array([x for x in bytes])
 
 
+class ProgramSession:
+    def __init__(self, lora):
+        self.lora = lora
+        self.prev_mode = None
+        self.code = ResponseStatusCode.E32_SUCCESS
+
+    def __enter__(self):
+        lora = self.lora
+        if lora._program_session_depth == 0:
+            self.code, self.prev_mode = lora._enter_program_mode()
+        lora._program_session_depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        lora = self.lora
+        lora._program_session_depth -= 1
+        if lora._program_session_depth == 0 and self.code == ResponseStatusCode.E32_SUCCESS:
+            self.code = lora.set_mode(self.prev_mode)
+        return False
+
+
 class LoRaE32:
     # now the constructor that receive directly the UART object
     def __init__(self, model, uart, aux_pin=None, m0_pin=None, m1_pin=None,
-                 uart_baudrate=SerialUARTBaudRate.BPS_RATE_9600):
+                 uart_baudrate=SerialUARTBaudRate.BPS_RATE_9600, aux_irq=True):
         self.uart = uart
         self.model = model
 
-        pattern = '^(230|400|433|868|900|915|170)(T|R|S|M)(20|27|30|33|37)(S|D|C|U|E)?..?(\\d)?$'
-
-        model_regex = ure.compile(pattern)
-        if not model_regex.match(model):
+        if not MODEL_REGEX.match(model):
             raise ValueError('Invalid model')
+        self.spec = ModelSpec.get(model)
 
         self.aux_pin = aux_pin
         self.m0_pin = m0_pin
@@ -292,24 +344,85 @@ class LoRaE32:
         self.m0 = None
         self.m1 = None
 
+        # rate of the normal mode traffic; program mode always runs at 9600 8N1 and the
+        # host UART is switched to it and back by set_mode()
         self.uart_baudrate = uart_baudrate
+        self.uart_parity = UARTParity.MODE_00_8N1
+        self._uart_current_baudrate = None
         self.mode = None
 
+        # AUX rising edge interrupt: the flag is raised by the IRQ handler, aux_event
+        # (a uasyncio.ThreadSafeFlag) is set too when an async driver is waiting on it
+        self.aux_irq = aux_irq
+        self.aux_event = None
+        self._aux_rose = False
+
+        # used to estimate the transmission time when there is no AUX pin
+        self.air_data_rate = AirDataRate.AIR_DATA_RATE_010_24
+
+        # incoming bytes are framed in a preallocated ring buffer
+        self.reader = UARTRingReader(uart)
+        # program mode responses are read straight from the UART into this buffer, the
+        # ring keeps the packets received before (see _drive_mode_pins)
+        self._program_buf = memoryview(bytearray(PROGRAM_RESPONSE_MAX_SIZE))
+        self._program_count = 0
+
+        # messages bigger than a packet are sent as fragments and reassembled on receive
+        self.reassembler = Reassembler()
+        self._fragment_id = 0
+
+        # last configuration read from or written to the module
+        self._shadow = None
+        # True after a transient write (0xC2): the module runs a configuration its flash
+        # doesn't have, a permanent write of the same configuration must still happen
+        self._unsaved = False
+        # nesting level of program_session()
+        self._program_session_depth = 0
+
+        # optional duty cycle limit, see set_duty_cycle()
+        self.scheduler = None
+
+        # schemas used by send_record/receive_record
+        self.codec = RecordCodec()
+
+        # Preallocated TX buffer: | ADDH | ADDL | CHAN | payload |, the views of each
+        # packet length are created once and reused, so a send doesn't allocate
+        self.tx_buffer = memoryview(bytearray(TX_HEADER_SIZE + MAX_SIZE_TX_PAYLOAD))
+        self._fixed_views = [None] * (MAX_SIZE_TX_PAYLOAD + 1)
+        self._transparent_views = [None] * (MAX_SIZE_TX_PAYLOAD + 1)
+
     # model is like 433T20D or 433T27D or 433T30D or 868T20S or 868T27S or 868T30S
     # def __init__(self, model, tx_pin, rx_pin, uart_id=0, aux_pin=None, m0_pin=None, m1_pin=None,
     #              uart_baudrate=SerialUARTBaudRate.BPS_RATE_9600):
     #     self.uart = machine.UART(uart_id, tx=tx_pin, rx=rx_pin)
     #     super().__init__(model, self.uart, aux_pin, m0_pin, m1_pin, uart_baudrate)
 
-    def begin(self, uart_parity=UARTParity.MODE_00_8N1):
-        self.uart.init(baudrate=self.uart_baudrate, bits=8, parity=UARTParity.get_uart_value(uart_parity), stop=1,
-                       timeout=1000, timeout_char=1000)
+    # sync_UART_baudrate: check the module UART rate, even at 9600 (the module may have been
+    # moved to another rate by another program). With False the caller does it with
+    # sync_UART_baudrate() in the program session it opens anyway, one round trip for both.
+    def begin(self, uart_parity=UARTParity.MODE_00_8N1, sync_UART_baudrate=True):
+        self._init_hardware(uart_parity)
+
+        code = self.set_mode(ModeType.MODE_0_NORMAL)
+        if code != ResponseStatusCode.SUCCESS:
+            return code
+
+        # M0/M1 wired by hand: no program mode, the rate is the user's business
+        if not sync_UART_baudrate or self.m0 is None or self.m1 is None:
+            return code
+        return self.sync_UART_baudrate()
+
+    def _init_hardware(self, uart_parity=UARTParity.MODE_00_8N1):
+        self.uart_parity = uart_parity
+        self._init_UART(self.uart_baudrate, uart_parity)
 
         self.m0 = None
         self.m1 = None
         self.aux = None
         if self.aux_pin is not None:
             self.aux = machine.Pin(self.aux_pin, machine.Pin.IN)
+            if self.aux_irq:
+                self.aux.irq(trigger=machine.Pin.IRQ_RISING, handler=self._on_aux_rising)
         if self.m0_pin is not None and self.m1_pin is not None:
             self.m0 = machine.Pin(self.m0_pin, machine.Pin.OUT)
             self.m1 = machine.Pin(self.m1_pin, machine.Pin.OUT)
@@ -318,48 +431,99 @@ class LoRaE32:
 
         # self.uart.timeout(1000)
 
-        code = self.set_mode(ModeType.MODE_0_NORMAL)
-        if code != ResponseStatusCode.SUCCESS:
+    def _init_UART(self, baudrate, uart_parity):
+        self.uart.init(baudrate=baudrate, bits=8, parity=UARTParity.get_uart_value(uart_parity), stop=1,
+                       timeout=1000, timeout_char=1000)
+        self._uart_current_baudrate = baudrate
+
+    # The module talks at 9600 8N1 in program mode and at its configured rate otherwise:
+    # follow it with the host UART (only once the hardware is initialized)
+    def _switch_UART_baudrate(self, mode):
+        if self._uart_current_baudrate is None:
+            return
+        if mode == ModeType.MODE_3_PROGRAM:
+            if self._uart_current_baudrate != SerialUARTBaudRate.BPS_RATE_9600:
+                self._init_UART(SerialUARTBaudRate.BPS_RATE_9600, UARTParity.MODE_00_8N1)
+        elif self._uart_current_baudrate != self.uart_baudrate:
+            self._init_UART(self.uart_baudrate, self.uart_parity)
+
+    # Write uart_baudrate in the module (SPED.uartBaudRate, saved) if it runs at another rate.
+    # The configuration is read from the module: get_configuration() returns it afterwards.
+    def sync_UART_baudrate(self) -> ResponseStatusCode:
+        code = self.check_UART_configuration(ModeType.MODE_0_NORMAL)
+        if code != ResponseStatusCode.E32_SUCCESS:
             return code
 
-        return code
+        code, configuration = self.get_configuration(refresh=True)
+        if code != ResponseStatusCode.E32_SUCCESS:
+            return code
+        if not self._UART_baudrate_to_write(configuration):
+            return code
+        return self.set_configuration(configuration, permanentConfiguration=True)[0]
+
+    # Put uart_baudrate in the configuration read from the module, False if already there
+    def _UART_baudrate_to_write(self, configuration) -> bool:
+        uart_baud_rate = UARTBaudRate.from_bps(self.uart_baudrate)
+        if configuration.SPED.uartBaudRate == uart_baud_rate:
+            return False
+
+        logger.info("Module UART %s -> %s", configuration.SPED.get_UART_baud_rate(),
+                    UARTBaudRate.get_description(uart_baud_rate))
+        configuration.SPED.uartBaudRate = uart_baud_rate
+        return True
 
     def set_mode(self, mode) -> ResponseStatusCode:
         self.managed_delay(40)
 
+        if not self._drive_mode_pins(mode):
+            return ResponseStatusCode.ERR_E32_INVALID_PARAM
+
+        self.managed_delay(40)
+
+        res = self.wait_complete_response(1000)
+        if res == ResponseStatusCode.E32_SUCCESS:
+            self.mode = mode
+            self._switch_UART_baudrate(mode)
+
+        return res
+
+    def _drive_mode_pins(self, mode) -> bool:
+        if mode == ModeType.MODE_3_PROGRAM and self.mode != ModeType.MODE_3_PROGRAM:
+            # what arrived in normal mode goes to the ring before the UART changes rate
+            self.reader.fill()
+
         if self.m0 is None and self.m1 is None:
-            logger.debug("The M0 and M1 pins are not set, which means that you are connecting the pins directly as you need!")
+            if _DEBUG:
+                logger.debug("The M0 and M1 pins are not set, which means that you are connecting the pins directly as you need!")
         else:
             if mode == ModeType.MODE_0_NORMAL:
                 # Mode 0 | normal operation
                 self.m0.off()
                 self.m1.off()
-                logger.debug("MODE NORMAL!")
+                if _DEBUG:
+                    logger.debug("MODE NORMAL!")
             elif mode == ModeType.MODE_1_WAKE_UP:
                 # Mode 1 | wake-up operation
                 self.m0.on()
                 self.m1.off()
-                logger.debug("MODE WAKE UP!")
+                if _DEBUG:
+                    logger.debug("MODE WAKE UP!")
             elif mode == ModeType.MODE_2_POWER_SAVING:
                 # Mode 2 | power saving operation
                 self.m0.off()
                 self.m1.on()
-                logger.debug("MODE POWER SAVING!")
+                if _DEBUG:
+                    logger.debug("MODE POWER SAVING!")
             elif mode == ModeType.MODE_3_SLEEP:
                 # Mode 3 | Setting operation
                 self.m0.on()
                 self.m1.on()
-                logger.debug("MODE PROGRAM/SLEEP!")
+                if _DEBUG:
+                    logger.debug("MODE PROGRAM/SLEEP!")
             else:
-                return ResponseStatusCode.ERR_E32_INVALID_PARAM
+                return False
 
-        self.managed_delay(40)
-
-        res = self.wait_complete_response(1000)
-        if res == ResponseStatusCode.E32_SUCCESS:
-            self.mode = mode
-
-        return res
+        return True
 
     @staticmethod
     def managed_delay(timeout):
@@ -372,7 +536,10 @@ class LoRaE32:
         while utime.ticks_diff(utime.ticks_ms(), t) < timeout:
             pass
 
-    def wait_complete_response(self, timeout, wait_no_aux=100) -> ResponseStatusCode:
+    def wait_complete_response(self, timeout, wait_no_aux=100, size=None) -> ResponseStatusCode:
+        if size is not None:
+            return self._wait_transmit_complete(timeout, size)
+
         result = ResponseStatusCode.E32_SUCCESS
         t = utime.ticks_ms()
 
@@ -383,33 +550,162 @@ class LoRaE32:
             while self.aux.value() == 0:
                 if utime.ticks_diff(utime.ticks_ms(), t) > timeout:
                     result = ResponseStatusCode.ERR_E32_TIMEOUT
-                    logger.debug("Timeout error!")
+                    if _DEBUG:
+                        logger.debug("Timeout error!")
                     return result
 
-            logger.debug("AUX HIGH!")
+            if _DEBUG:
+                logger.debug("AUX HIGH!")
         else:
             self.managed_delay(wait_no_aux)
-            logger.debug("Wait no AUX pin!")
+            if _DEBUG:
+                logger.debug("Wait no AUX pin!")
 
         self.managed_delay(20)
-        logger.debug("Complete!")
+        if _DEBUG:
+            logger.debug("Complete!")
         return result
 
+    def _on_aux_rising(self, pin):
+        self._aux_rose = True
+        if self.aux_event is not None:
+            self.aux_event.set()
+
+    def _arm_aux(self):
+        self._aux_rose = False
+        if self.aux_event is not None:
+            self.aux_event.clear()
+
+    # Wait the end of the transmission of a packet of `size` bytes written after _arm_aux()
+    def _wait_transmit_complete(self, timeout, size) -> ResponseStatusCode:
+        if self.aux is None:
+            self.managed_delay(self.estimate_transmit_time_ms(size))
+            if _DEBUG:
+                logger.debug("Wait no AUX pin!")
+        elif self.aux_irq:
+            t = utime.ticks_ms()
+            while not self._aux_rose:
+                if utime.ticks_diff(utime.ticks_ms(), t) > timeout:
+                    # the edge can be missed if the module was faster than the write
+                    if self.aux.value() == 0:
+                        if _DEBUG:
+                            logger.debug("Timeout error!")
+                        return ResponseStatusCode.ERR_E32_TIMEOUT
+                    break
+                machine.idle()
+            if _DEBUG:
+                logger.debug("AUX HIGH!")
+        else:
+            return self.wait_complete_response(timeout)
+
+        self.managed_delay(AUX_SETTLE_MS)
+        return ResponseStatusCode.E32_SUCCESS
+
+    # UART transfer to the module plus time on air at the configured air data rate
+    def estimate_transmit_time_ms(self, size) -> int:
+        uart_ms = size * 10 * 1000 // self.uart_baudrate
+        return uart_ms + self.estimate_time_on_air_ms(size) + 1
+
+    # In MODE_1_WAKE_UP every packet is preceded by a preamble as long as the wireless
+    # wake-up time, so that receivers in MODE_2_POWER_SAVING catch it
+    def estimate_time_on_air_ms(self, size) -> int:
+        if self._shadow is not None:
+            airtime = self._shadow.get_time_on_air_ms(size)
+        else:
+            airtime = time_on_air_ms(self.air_data_rate, ForwardErrorCorrectionSwitch.FEC_1_ON, size)
+        if self.mode == ModeType.MODE_1_WAKE_UP:
+            airtime += self.get_wake_up_time_ms()
+        return airtime
+
+    def get_wake_up_time_ms(self) -> int:
+        wake_up_time = WirelessWakeUpTime.WAKE_UP_250
+        if self._shadow is not None:
+            wake_up_time = self._shadow.OPTION.wirelessWakeupTime
+        return WirelessWakeUpTime.get_milliseconds(wake_up_time)
+
+    # Limit the transmissions to `duty_cycle` (0.01 = 1%) of the time, None removes the limit
+    def set_duty_cycle(self, duty_cycle, window_ms=3600000):
+        self.scheduler = DutyCycleScheduler(duty_cycle, window_ms) if duty_cycle is not None else None
+
+    # ms from now to the end of the transmission of a message of `size` bytes, including
+    # the wait imposed by the duty cycle budget and the fragments of a big message;
+    # wake=True for send_wake_message (every packet carries the wake-up preamble)
+    def predict_send_latency_ms(self, size, wake=False) -> int:
+        packets = 1
+        if size > MAX_SIZE_TX_PAYLOAD:
+            chunk = MAX_SIZE_TX_PACKET - FRAGMENT_HEADER_SIZE
+            packets = (size + chunk - 1) // chunk
+            size += packets * FRAGMENT_HEADER_SIZE
+
+        wake_ms = 0
+        if wake and self.mode != ModeType.MODE_1_WAKE_UP:
+            wake_ms = packets * self.get_wake_up_time_ms()
+
+        latency = self.estimate_transmit_time_ms(size) + packets * AUX_SETTLE_MS + wake_ms
+        if self.scheduler is not None:
+            # every packet pays its own preamble and header on air
+            airtime = self.estimate_time_on_air_ms(size + (packets - 1) * AIR_OVERHEAD_BYTES) + wake_ms
+            latency += self.scheduler.delay_ms(airtime)
+        return latency
+
+    # Book the airtime of a packet, return the wait imposed by the duty cycle
+    def _reserve_airtime(self, size) -> int:
+        if self.scheduler is None:
+            return 0
+        return self.scheduler.reserve(self.estimate_time_on_air_ms(size))
+
+    # Program mode is always possible (set_mode() drops the host UART to 9600), the
+    # normal mode rate must be one the module supports
     def check_UART_configuration(self, mode) -> ResponseStatusCode:
-        if mode == ModeType.MODE_3_PROGRAM and self.uart_baudrate != SerialUARTBaudRate.BPS_RATE_9600:
-            return ResponseStatusCode.ERR_E32_WRONG_UART_CONFIG
+        if mode != ModeType.MODE_3_PROGRAM:
+            try:
+                UARTBaudRate.from_bps(self.uart_baudrate)
+            except ValueError:
+                return ResponseStatusCode.ERR_E32_WRONG_UART_CONFIG
         return ResponseStatusCode.E32_SUCCESS
 
+    # permanentConfiguration: True (default) saves the configuration (0xC0), False keeps it
+    # until the next power down (0xC2), None chooses: 0xC2 when only address/channel change
+    # (see TRANSIENT_CONFIGURATION_BYTES), 0xC0 otherwise. Nothing is written when the
+    # configuration is the same as the one already in the module, unless it must be saved
+    # and only a transient write put it there.
     def set_configuration(self, configuration, permanentConfiguration=True) -> (ResponseStatusCode, Configuration):
-        # code = ResponseStatusCode.E32_SUCCESS
-        code = self.check_UART_configuration(ModeType.MODE_3_PROGRAM)
+        data = self._configuration_image(configuration, permanentConfiguration)
+        if data is None:
+            return ResponseStatusCode.E32_SUCCESS, configuration
+
+        code, prev_mode = self._enter_program_mode()
         if code != ResponseStatusCode.E32_SUCCESS:
             return code, None
 
-        prev_mode = self.mode
-        code = self.set_mode(ModeType.MODE_3_PROGRAM)
+        self._discard_UART()
+        code = self._check_written(self.uart.write(data), len(data))
         if code != ResponseStatusCode.E32_SUCCESS:
-            return code, None
+            self._leave_program_mode(prev_mode)
+            return self._configuration_written(code, configuration)
+        # the module answers with the parameters, they must not reach the ring
+        self._wait_program_response(len(data))
+
+        # the host UART follows the module to its new rate when program mode is left
+        self.uart_baudrate = UARTBaudRate.get_bps(configuration.SPED.uartBaudRate)
+
+        code = self._leave_program_mode(prev_mode, settle=True)
+        return self._configuration_written(code, configuration)
+
+    # Set HEAD and return the bytes to write, None when nothing needs to be written
+    def _configuration_image(self, configuration, permanentConfiguration):
+        changed = None
+        if self._shadow is not None:
+            changed = configuration.diff(self._shadow)
+            if not changed and not (permanentConfiguration and self._unsaved):
+                if _DEBUG:
+                    logger.debug("Configuration unchanged, nothing to write")
+                configuration.HEAD = self._shadow.HEAD
+                return None
+
+        if permanentConfiguration is None:
+            permanentConfiguration = changed is None or \
+                                     any([i not in TRANSIENT_CONFIGURATION_BYTES for i in changed])
 
         if permanentConfiguration:
             configuration.HEAD = ProgramCommand.WRITE_CFG_PWR_DWN_SAVE
@@ -417,188 +713,302 @@ class LoRaE32:
             configuration.HEAD = ProgramCommand.WRITE_CFG_PWR_DWN_LOSE
 
         data = configuration.to_bytes()
-        logger.debug("Writing configuration: {} size {}".format(configuration.to_hex_string(), len(data)))
-
-        len_writed = self.uart.write(data)
-        if len_writed != len(data):
-            self.set_mode(prev_mode)
-            return code, None
-
-        logger.debug("----------------------------------------")
-        logger.debug(
-            "HEAD BIN INSIDE: {:08b} {} {:02x}".format(configuration.HEAD, configuration.HEAD, configuration.HEAD))
-        logger.debug("----------------------------------------")
+        if _DEBUG:
+            logger.debug("Writing configuration: %s size %s", configuration.to_hex_string(), len(data))
+            logger.debug("HEAD BIN INSIDE: %s %s %s", bin(configuration.HEAD), configuration.HEAD,
+                         hex(configuration.HEAD))
+        return data
 
-        code = self.set_mode(prev_mode)
+    # Update the cache once the module left program mode after a write (code)
+    def _configuration_written(self, code, configuration) -> (ResponseStatusCode, Configuration):
         if code != ResponseStatusCode.E32_SUCCESS:
+            # the module state is unknown, read it again next time
+            self._shadow = None
             return code, None
 
         if configuration.HEAD != 0xC0 and configuration.HEAD != 0xC2:
             code = ResponseStatusCode.ERR_E32_HEAD_NOT_RECOGNIZED
-
-        self.clean_UART_buffer();
+        else:
+            self.air_data_rate = configuration.SPED.airDataRate
+            self._shadow = configuration.copy()
+            self._unsaved = configuration.HEAD == ProgramCommand.WRITE_CFG_PWR_DWN_LOSE
 
         return code, configuration
 
-    def write_program_command(self, cmd) -> int:
-        cmd = bytes([cmd, cmd, cmd])
-        size = self.uart.write(cmd)
-        self.managed_delay(50)  # need to check
-        return size != 3
+    # Change only the channel, from the cached configuration (one write, no read); by
+    # default the write is transient when nothing else differs from the module
+    def set_channel(self, CHAN, permanentConfiguration=None) -> ResponseStatusCode:
+        code, configuration = self.get_configuration()
+        if code != ResponseStatusCode.E32_SUCCESS:
+            return code
+        configuration.CHAN = CHAN
+        return self.set_configuration(configuration, permanentConfiguration)[0]
+
+    # Change only the module address, from the cached configuration (one write, no read);
+    # by default the write is transient when nothing else differs from the module
+    def set_address(self, ADDH, ADDL, permanentConfiguration=None) -> ResponseStatusCode:
+        code, configuration = self.get_configuration()
+        if code != ResponseStatusCode.E32_SUCCESS:
+            return code
+        configuration.ADDH = ADDH
+        configuration.ADDL = ADDL
+        return self.set_configuration(configuration, permanentConfiguration)[0]
+
+    # Enter program mode once for several commands, the previous mode is restored at the end:
+    #
+    #   with lora.program_session():
+    #       code, information = lora.get_module_information()
+    #       code = lora.sync_UART_baudrate()    # after begin(sync_UART_baudrate=False)
+    #       code, configuration = lora.get_configuration()
+    #       code, configuration = lora.set_configuration(configuration)
+    def program_session(self):
+        return ProgramSession(self)
+
+    def _enter_program_mode(self) -> (ResponseStatusCode, int):
+        if self._program_session_depth > 0 and self.mode == ModeType.MODE_3_PROGRAM:
+            return ResponseStatusCode.E32_SUCCESS, None
 
-    def get_configuration(self) -> (ResponseStatusCode, Configuration):
         code = self.check_UART_configuration(ModeType.MODE_3_PROGRAM)
-        logger.debug("check_UART_configuration: {}".format(code))
         if code != ResponseStatusCode.E32_SUCCESS:
             return code, None
 
         prev_mode = self.mode
         code = self.set_mode(ModeType.MODE_3_PROGRAM)
-        if code != ResponseStatusCode.E32_SUCCESS:
-            return code, None
-        logger.debug("set_mode: {}".format(code))
+        return code, prev_mode
 
-        self.write_program_command(ProgramCommand.READ_CONFIGURATION)
+    # settle: wait the module to complete the command even if the mode is not changed
+    def _leave_program_mode(self, prev_mode, settle=False) -> ResponseStatusCode:
+        if self._program_session_depth > 0 and prev_mode is None:
+            if settle:
+                return self.wait_complete_response(1000)
+            return ResponseStatusCode.E32_SUCCESS
+        return self.set_mode(prev_mode)
 
-        data = self.uart.read()
+    def write_program_command(self, cmd, delay=50) -> int:
+        cmd = bytes([cmd, cmd, cmd])
+        size = self.uart.write(cmd)
+        if delay:
+            self.managed_delay(delay)  # need to check
+        return size != 3
 
-        if data is None or len(data) != 6:
-            if data is not None:
-                logger.debug("data: {}".format(data))
-                logger.debug("data len: {}".format(len(data)))
+    # Drop the bytes waiting in the UART (noise of the rate change, stale responses), in
+    # program mode only: the packets received before are already in the ring
+    def _discard_UART(self):
+        self._program_count = 0
+        while self.uart.any():
+            self.uart.readinto(self._program_buf)
+
+    # Collect a program mode response of `size` bytes without blocking: (None, None) until
+    # it is complete
+    def _take_program_response(self, size):
+        while self._program_count < size and self.uart.any():
+            n = self.uart.readinto(self._program_buf[self._program_count:size])
+            if not n:
+                break
+            self._program_count += n
+        if self._program_count < size:
+            return None, None
+        self._program_count = 0
+        return ResponseStatusCode.E32_SUCCESS, bytes(self._program_buf[:size])
 
-            code = ResponseStatusCode.ERR_E32_DATA_SIZE_NOT_MATCH
+    def _wait_program_response(self, size, timeout=PROGRAM_RESPONSE_TIMEOUT_MS):
+        t = utime.ticks_ms()
+        while True:
+            code, data = self._take_program_response(size)
+            if code is not None:
+                return code, data
+            if utime.ticks_diff(utime.ticks_ms(), t) >= timeout:
+                if _DEBUG:
+                    logger.debug("Response of %s bytes not received: %s", size, self._program_count)
+                self._program_count = 0
+                return ResponseStatusCode.ERR_E32_DATA_SIZE_NOT_MATCH, None
+
+    # Send a read command and wait exactly `size` bytes of response, at most `timeout` ms
+    def _read_program_response(self, cmd, size, timeout=PROGRAM_RESPONSE_TIMEOUT_MS):
+        self._discard_UART()
+        if self.write_program_command(cmd, delay=0):
+            return ResponseStatusCode.ERR_E32_NO_RESPONSE_FROM_DEVICE, None
+        return self._wait_program_response(size, timeout)
+
+    # The configuration is read from the module only the first time (or with refresh=True),
+    # then it is served from the cache; the caller gets its own copy.
+    def get_configuration(self, refresh=False) -> (ResponseStatusCode, Configuration):
+        if self._shadow is not None and not refresh:
+            return ResponseStatusCode.E32_SUCCESS, self._shadow.copy()
+
+        code, prev_mode = self._enter_program_mode()
+        if code != ResponseStatusCode.E32_SUCCESS:
             return code, None
+        if _DEBUG:
+            logger.debug("set_mode: %s", code)
 
-        logger.debug("data: {}".format(data))
-        logger.debug("data len: {}".format(len(data)))
+        code, data = self._read_program_response(ProgramCommand.READ_CONFIGURATION, 6)
+        if code != ResponseStatusCode.E32_SUCCESS:
+            self._leave_program_mode(prev_mode)
+            return code, None
 
-        logger.debug("model: {}".format(self.model))
+        configuration = self._configuration_read(data)
+        code = self._leave_program_mode(prev_mode)
+        return code, configuration
+
+    def _configuration_read(self, data) -> Configuration:
+        if _DEBUG:
+            logger.debug("data: %s", data)
+            logger.debug("model: %s", self.model)
         configuration = Configuration(self.model)
         configuration.from_bytes(data)
-        code = self.set_mode(prev_mode)
-        return code, configuration
+        self.air_data_rate = configuration.SPED.airDataRate
+        self._shadow = configuration.copy()
+        return configuration
 
     def get_module_information(self):
-        code = self.check_UART_configuration(ModeType.MODE_3_PROGRAM)
+        code, prev_mode = self._enter_program_mode()
         if code != ResponseStatusCode.E32_SUCCESS:
             return code, None
 
-        prev_mode = self.mode
-        code = self.set_mode(ModeType.MODE_3_PROGRAM)
+        code, data = self._read_program_response(ProgramCommand.READ_MODULE_VERSION, 4)
         if code != ResponseStatusCode.E32_SUCCESS:
+            self._leave_program_mode(prev_mode)
             return code, None
 
-        self.write_program_command(ProgramCommand.READ_MODULE_VERSION)
-
-        module_information = ModuleInformation()
-        data = self.uart.read(4)
-        if data is None or len(data) != 4:
-            code = ResponseStatusCode.ERR_E32_DATA_SIZE_NOT_MATCH
-            return code, None
-
-        module_information.from_bytes(data)
-
+        code = self._leave_program_mode(prev_mode)
         if code != ResponseStatusCode.E32_SUCCESS:
-            self.set_mode(prev_mode)
             return code, None
+        return self._module_information_read(data)
 
-        code = self.set_mode(prev_mode)
-        if code != ResponseStatusCode.E32_SUCCESS:
-            return code, None
+    @staticmethod
+    def _module_information_read(data) -> (ResponseStatusCode, ModuleInformation):
+        code = ResponseStatusCode.E32_SUCCESS
+        module_information = ModuleInformation()
+        module_information.from_bytes(data)
 
         if 0xC3 != module_information.HEAD:
             code = ResponseStatusCode.ERR_E32_HEAD_NOT_RECOGNIZED
 
-        logger.debug("----------------------------------------")
-        logger.debug("HEAD BIN INSIDE: ", bin(module_information.HEAD), module_information.HEAD)
-        logger.debug("Freq.: ", hex(module_information.frequency))
-        logger.debug("Version  : ", hex(module_information.version))
-        logger.debug("Features : ", hex(module_information.features))
-        logger.debug("----------------------------------------")
+        if _DEBUG:
+            logger.debug("----------------------------------------")
+            logger.debug("HEAD BIN INSIDE: %s %s", bin(module_information.HEAD), module_information.HEAD)
+            logger.debug("Freq.: %s", hex(module_information.frequency))
+            logger.debug("Version  : %s", hex(module_information.version))
+            logger.debug("Features : %s", hex(module_information.features))
+            logger.debug("----------------------------------------")
 
         return code, module_information
 
     def reset_module(self) -> ResponseStatusCode:
-        code = self.check_UART_configuration(ModeType.MODE_3_PROGRAM)
-        if code != ResponseStatusCode.E32_SUCCESS:
-            return code
-
-        prev_mode = self.mode
-
-        code = self.set_mode(ModeType.MODE_3_PROGRAM)
+        code, prev_mode = self._enter_program_mode()
         if code != ResponseStatusCode.E32_SUCCESS:
             return code
 
         self.write_program_command(ProgramCommand.WRITE_RESET_MODULE)
+        self._forget_configuration()
 
         code = self.wait_complete_response(1000)
         if code != ResponseStatusCode.E32_SUCCESS:
-            self.set_mode(prev_mode)
+            self._leave_program_mode(prev_mode)
             return code
 
-        code = self.set_mode(prev_mode)
+        code = self._leave_program_mode(prev_mode)
         if code != ResponseStatusCode.E32_SUCCESS:
             return code
 
         return code
 
-    @staticmethod
-    def _normalize_array(data):
-        # Convert values to valid byte values
-        for i in range(len(data)):
-            if data[i] > 255:
-                data[i] = data[i] % 256
-        return data
+    # after a reset the module reloads the saved configuration, the transient one is lost
+    def _forget_configuration(self):
+        self._shadow = None
+        self._unsaved = False
 
-    def receive_dict(self, delimiter=None, size=None) -> (ResponseStatusCode, any):
-        code, msg = self.receive_message(delimiter, size)
+    def receive_dict(self, delimiter=None, size=None, timeout=1000) -> (ResponseStatusCode, any):
+        code, msg = self.receive_message(delimiter, size, timeout)
         if code != ResponseStatusCode.E32_SUCCESS:
             return code, None
 
         try:
             msg = ujson.loads(msg)
         except Exception as e:
-            logger.error("Error: {}".format(e))
+            logger.error("Error: %s", e)
             return ResponseStatusCode.ERR_E32_JSON_PARSE, None
 
         return code, msg
 
-    def receive_message(self, delimiter=None, size=None) -> (ResponseStatusCode, any):
-        code = ResponseStatusCode.E32_SUCCESS
+    def receive_message(self, delimiter=None, size=None, timeout=1000) -> (ResponseStatusCode, any):
+        code, data = self.receive_frame(delimiter, size, timeout)
+        if code != ResponseStatusCode.E32_SUCCESS:
+            return code, None
+
+        return code, str(data, 'utf-8')
+
+    # Like receive_message, but return a memoryview on the reader frame buffer (no
+    # allocation); it is overwritten by the next receive.
+    def receive_frame(self, delimiter=None, size=None, timeout=1000) -> (ResponseStatusCode, any):
         if delimiter is not None:
-            data = self._read_until(delimiter)
+            code, data = self.reader.read_until(delimiter, timeout)
         elif size is not None:
-            data = self.uart.read(size)
+            code, data = self.reader.read_exact(size, timeout)
         else:
-            data = self.uart.read()
-            self.clean_UART_buffer()
-
-        if data is None or len(data) == 0:
+            t = utime.ticks_ms()
+            while True:
+                self.reader.fill()
+                code, data = self._take_received()
+                if code is not None or utime.ticks_diff(utime.ticks_ms(), t) >= timeout:
+                    break
+            if code is None:
+                code = ResponseStatusCode.ERR_E32_TIMEOUT
+
+        if code == ResponseStatusCode.ERR_E32_TIMEOUT and self.reader.available() == 0:
             return ResponseStatusCode.ERR_E32_DATA_SIZE_NOT_MATCH, None
+        return code, data
+
+    def _take_received(self) -> (ResponseStatusCode, any):
+        # Never blocks: the next message or packet already in the reader, (None, None)
+        # if there is none yet. The head of the ring is checked before every take, the
+        # fragments go to the reassembler whenever they arrive; an incomplete message
+        # stays there for the next call (it expires after reassembler.timeout_ms).
+        reader = self.reader
+        while True:
+            data = self.reassembler.pop()
+            if data is not None:
+                return ResponseStatusCode.E32_SUCCESS, data
+            if reader.peek() != FRAGMENT_MARKER:
+                return reader.take_packet()
+
+            size = reader.peek(FRAGMENT_HEADER_SIZE - 1)
+            if 0 <= size <= FRAGMENT_PACKET_SIZE - FRAGMENT_HEADER_SIZE:
+                code, fragment = reader.take(FRAGMENT_HEADER_SIZE + size)
+                if code is not None:
+                    self.reassembler.feed(fragment)
+                    continue
+
+            # the fragment is still arriving, or it is cut short or corrupted if the line
+            # is quiet: then the reassembler keeps what is complete and drops the rest
+            code, data = reader.take_packet()
+            if code is None:
+                return None, None
+            self.reassembler.feed(data)
+
+    def receive_record(self, timeout=1000) -> (ResponseStatusCode, any):
+        code, data = self.receive_frame(timeout=timeout)
+        if code != ResponseStatusCode.E32_SUCCESS:
+            return code, None
+        return self._decode_record(self.codec, data)
 
-        # msg = ''
-        # try:
-        #     for i in range(data):
-        #         msg += chr(data[i])
-        # except TypeError as e:
-        #     logger.info("Switch decode type: {}".format(e))
-        data = data.decode('utf-8')
-        msg = data
-
-        return code, msg
+    @staticmethod
+    def _decode_record(codec, data) -> (ResponseStatusCode, any):
+        # the record is returned as (schema name, dict), schema name is None for JSON
+        try:
+            return ResponseStatusCode.E32_SUCCESS, codec.decode(data)
+        except KeyError as e:
+            logger.error("Error: %s", e)
+            return ResponseStatusCode.ERR_E32_NOT_SUPPORT, None
+        except Exception as e:
+            logger.error("Error: %s", e)
+            if len(data) and data[0] == RECORD_MARKER:
+                return ResponseStatusCode.ERR_E32_DATA_SIZE_NOT_MATCH, None
+            return ResponseStatusCode.ERR_E32_JSON_PARSE, None
 
     def clean_UART_buffer(self):
-        self.uart.read()
-
-    def _read_until(self, terminator='\n') -> bytes:
-        line = b''
-        while True:
-            c = self.uart.read(1)
-            if c == terminator:
-                break
-            line += c
-        return line
+        self.reader.clear()
 
     def send_broadcast_message(self, CHAN, message) -> ResponseStatusCode:
         return self._send_message(message, BROADCAST_ADDRESS, BROADCAST_ADDRESS, CHAN)
@@ -621,45 +1031,158 @@ class LoRaE32:
         message = ujson.dumps(dict_message)
         return self._send_message(message)
 
-    def _send_message(self, message, ADDH=None, ADDL=None, CHAN=None) -> ResponseStatusCode:
-        result = ResponseStatusCode.E32_SUCCESS
+    # Send with the wake-up preamble (MODE_1_WAKE_UP) to a receiver sleeping in
+    # MODE_2_POWER_SAVING, then go back to the current mode. See lora_e32_wor.
+    def send_wake_message(self, ADDH, ADDL, CHAN, message) -> ResponseStatusCode:
+        prev_mode = self.mode
+        code = self.set_mode(ModeType.MODE_1_WAKE_UP)
+        if code != ResponseStatusCode.E32_SUCCESS:
+            return code
+
+        code = self._send_message(message, ADDH, ADDL, CHAN)
+        restored = self.set_mode(prev_mode if prev_mode is not None else ModeType.MODE_0_NORMAL)
+        if code != ResponseStatusCode.E32_SUCCESS:
+            return code
+        return restored
 
-        size_ = len(message.encode('utf-8'))
-        if size_ > MAX_SIZE_TX_PACKET + 2:
+    # Send `length` bytes stored at buf[3:], the first 3 bytes are reserved for the address.
+    # buf can be lora.tx_buffer (no allocation at all) or any bytearray/memoryview owned
+    # by the caller (only a view on it is created).
+    def send_into(self, buf, length, ADDH=None, ADDL=None, CHAN=None) -> ResponseStatusCode:
+        if length > MAX_SIZE_TX_PAYLOAD or TX_HEADER_SIZE + length > len(buf):
             return ResponseStatusCode.ERR_E32_PACKET_TOO_BIG
 
-        if ADDH is not None and ADDL is not None and CHAN is not None:
-            if isinstance(message, str):
-                message = message.encode('utf-8')
-            dataarray = bytes([ADDH, ADDL, CHAN]) + message
-            dataarray = LoRaE32._normalize_array(dataarray)
-            lenMS = self.uart.write(bytes(dataarray))
-            size_ += 3
-        elif isinstance(message, str):
-            lenMS = self.uart.write(message.encode('utf-8'))
-        else:
-            lenMS = self.uart.write(bytes(message))
+        data = self._packet_view(buf, length, ADDH, ADDL, CHAN)
 
-        if lenMS != size_:
-            logger.debug("Send... len:", lenMS, " size:", size_)
-            if lenMS == 0:
-                result = ResponseStatusCode.ERR_E32_NO_RESPONSE_FROM_DEVICE
-            else:
-                result = ResponseStatusCode.ERR_E32_DATA_SIZE_NOT_MATCH
+        wait = self._reserve_airtime(len(data))
+        if wait:
+            if _DEBUG:
+                logger.debug("Duty cycle: wait %s ms", wait)
+            utime.sleep_ms(wait)
+
+        self._arm_aux()
+        result = self._check_written(self.uart.write(data), len(data))
+        if result != ResponseStatusCode.E32_SUCCESS:
+            return result
+
+        result = self.wait_complete_response(1000 + self.estimate_transmit_time_ms(len(data)), size=len(data))
         if result != ResponseStatusCode.E32_SUCCESS:
             return result
 
-        result = self.wait_complete_response(1000)
+        if _DEBUG:
+            logger.debug("ok!")
+        return result
+
+    def _packet_view(self, buf, length, ADDH=None, ADDL=None, CHAN=None):
+        fixed = ADDH is not None and ADDL is not None and CHAN is not None
+        if fixed:
+            buf[0] = ADDH & 0xFF
+            buf[1] = ADDL & 0xFF
+            buf[2] = CHAN & 0xFF
+
+        if buf is not self.tx_buffer:
+            if fixed:
+                return memoryview(buf)[:TX_HEADER_SIZE + length]
+            return memoryview(buf)[TX_HEADER_SIZE:TX_HEADER_SIZE + length]
+
+        views = self._fixed_views if fixed else self._transparent_views
+        view = views[length]
+        if view is None:
+            if fixed:
+                view = self.tx_buffer[:TX_HEADER_SIZE + length]
+            else:
+                view = self.tx_buffer[TX_HEADER_SIZE:TX_HEADER_SIZE + length]
+            views[length] = view
+        return view
+
+    # Copy the payload in the TX buffer, return the payload length (-1 if it needs fragments)
+    def _stage_message(self, message) -> int:
+        if isinstance(message, str):
+            # the only allocation of the send path, MicroPython can't encode in place
+            message = message.encode('utf-8')
+
+        length = len(message)
+        if length > MAX_SIZE_TX_PAYLOAD:
+            return -1
+        self.tx_buffer[TX_HEADER_SIZE:TX_HEADER_SIZE + length] = message
+        return length
+
+    # Encode the record with a schema registered in self.codec (JSON if schema is unknown)
+    def send_record(self, record, schema=None, ADDH=None, ADDL=None, CHAN=None) -> ResponseStatusCode:
+        try:
+            message = self.codec.encode(record, schema)
+        except Exception as e:
+            logger.error("Error: %s", e)
+            return ResponseStatusCode.ERR_E32_INVALID_PARAM
+        return self._send_message(message, ADDH, ADDL, CHAN)
+
+    def _send_message(self, message, ADDH=None, ADDL=None, CHAN=None) -> ResponseStatusCode:
+        length = self._stage_message(message)
+        if length >= 0:
+            return self.send_into(self.tx_buffer, length, ADDH, ADDL, CHAN)
+
+        result, packets = self._encode_packets(message, ADDH, ADDL, CHAN)
         if result != ResponseStatusCode.E32_SUCCESS:
             return result
-        logger.debug("Clear buffer...")
-        self.clean_UART_buffer()
 
-        logger.debug("ok!")
+        # Fragments are streamed into the module buffer and AUX is awaited only when
+        # the buffer would overflow; with fixed transmission every packet carries its
+        # own address, so each one must be sent before the next is written.
+        fixed = ADDH is not None and ADDL is not None and CHAN is not None
+        buffered = 0
+        for i in range(len(packets)):
+            data = packets[i]
+            wait = self._reserve_airtime(len(data))
+            if wait:
+                # what is in the module buffer goes on air meanwhile
+                utime.sleep_ms(wait)
+            self._arm_aux()
+            result = self._check_written(self.uart.write(data), len(data))
+            if result != ResponseStatusCode.E32_SUCCESS:
+                return result
+            buffered += len(data)
+
+            last = i == len(packets) - 1
+            if last or fixed or buffered + len(packets[i + 1]) > MODULE_BUFFER_SIZE:
+                result = self.wait_complete_response(1000 + self.estimate_transmit_time_ms(buffered),
+                                                     size=buffered)
+                if result != ResponseStatusCode.E32_SUCCESS:
+                    return result
+                buffered = 0
+
+        if _DEBUG:
+            logger.debug("ok!")
         return result
 
+    # Split a message bigger than a packet in fragments, each one ready to be written
+    def _encode_packets(self, message, ADDH=None, ADDL=None, CHAN=None) -> (ResponseStatusCode, list):
+        if isinstance(message, str):
+            message = message.encode('utf-8')
+
+        try:
+            fragments = fragment_message(message, self._fragment_id, MAX_SIZE_TX_PACKET)
+        except ValueError:
+            return ResponseStatusCode.ERR_E32_PACKET_TOO_BIG, None
+        self._fragment_id = (self._fragment_id + 1) & 0xFF
+
+        if ADDH is not None and ADDL is not None and CHAN is not None:
+            header = bytes([ADDH & 0xFF, ADDL & 0xFF, CHAN & 0xFF])
+            fragments = [header + fragment for fragment in fragments]
+        return ResponseStatusCode.E32_SUCCESS, fragments
+
+    @staticmethod
+    def _check_written(lenMS, size_) -> ResponseStatusCode:
+        if lenMS != size_:
+            if _DEBUG:
+                logger.debug("Send... len: %s size: %s", lenMS, size_)
+            if not lenMS:
+                return ResponseStatusCode.ERR_E32_NO_RESPONSE_FROM_DEVICE
+            return ResponseStatusCode.ERR_E32_DATA_SIZE_NOT_MATCH
+        return ResponseStatusCode.E32_SUCCESS
+
+    # bytes received and not read yet, in the UART or already in the ring buffer
     def available(self) -> int:
-        return self.uart.any()
+        return self.uart.any() + self.reader.available()
 
     def end(self) -> ResponseStatusCode:
         try:
@@ -669,5 +1192,5 @@ class LoRaE32:
             return ResponseStatusCode.E32_SUCCESS
 
         except Exception as E:
-            logger.error("Error: {}".format(E))
+            logger.error("Error: %s", E)
             return ResponseStatusCode.ERR_E32_DEINIT_UART_FAILED
@@ -0,0 +1,252 @@
+#############################################################################################
+# Link adaptation for the EBYTE LoRa E32
+#
+# The module default (2.4kbps, max power) is sized for range. When every peer is close
+# the same packet can go 8x faster at 19.2kbps. LinkAdaptationController tracks the
+# delivery result of each peer (fed by ACKs, see lora_e32_reliable) over windows of
+# `window` attempts and moves one step at a time:
+#
+#   - worst peer clean (>= step_up_ratio) for `hold_windows` windows in a row:
+#     lower the power if already at the fastest rate, else raise the air data rate
+#   - worst peer degraded (< step_down_ratio) in a window: restore full power first,
+#     then step the air data rate down; the next step up waits twice as many windows
+#   - `fallback_failures` failures in a row: back to the base rate at full power
+#
+# Changes are written with WRITE_CFG_PWR_DWN_LOSE (0xC2): a power cycle brings the
+# module back to its saved configuration.
+#
+# The transmit power is local, but both ends of a link must use the same air data rate,
+# so the rate is adapted only with `announce(rate)`, which sends a rate frame
+# | RATE_MARKER | air data rate | to the peers and returns a ResponseStatusCode.
+# ReliableLink provides it (pass the controller as its `adaptation`) and hands the rate
+# frames it receives to follow(). Without announce only the power is adapted.
+# A rate change is a handshake, each end switches only once the other one got the frame:
+#
+#   1. the controller announces the new rate, at the current rate
+#   2. the peer answers with the same frame, switches, and sends it again at the new
+#      rate (lost, the controller is still at the current rate)
+#   3. on the answer the controller does the same: it switches and sends the frame at the
+#      new rate, the peer answers it, which confirms the change at both ends
+#   4. an end that hears nothing at the new rate within `confirm_ms` goes back to the
+#      previous rate: a lost frame or a failed write undoes the change at both ends
+#
+# After `fallback_failures` failures the controller goes back to the base rate without
+# handshake (the link is lost); a peer that hears nothing for `follow_timeout_ms` does the
+# same, so the two ends always meet again.
+#
+# main.py doesn't use the controller: the scoreboard updates are not acknowledged, there
+# is no delivery ratio to adapt to. It is for ReliableLink peers.
+#
+# The controller drives a synchronous LoRaE32; with AsyncLoRaE32 pass alora.lora and
+# call evaluate() while holding alora.lock. evaluate() also runs the timers of follow().
+#############################################################################################
+
+from lora_e32 import logger
+from lora_e32_constants import AirDataRate
+from lora_e32_operation_constant import ResponseStatusCode
+
+import utime
+
+AIR_DATA_RATE_STEPS = (AirDataRate.AIR_DATA_RATE_010_24, AirDataRate.AIR_DATA_RATE_011_48,
+                       AirDataRate.AIR_DATA_RATE_100_96, AirDataRate.AIR_DATA_RATE_101_192)
+# transmissionPower codes go from the maximum (0b00) to the minimum (0b11) power
+MAX_POWER = 0b00
+MIN_POWER = 0b11
+# upper bound of the back-off after a degradation, in windows
+MAX_REQUIRED_WINDOWS = 32
+
+# | RATE_MARKER | air data rate |, 0xF5-0xFF never start valid UTF-8 text
+RATE_MARKER = 0xF9
+RATE_FRAME_SIZE = 2
+
+
+def rate_frame(rate) -> bytes:
+    return bytes([RATE_MARKER, rate])
+
+
+class LinkAdaptationController:
+    def __init__(self, lora, rates=AIR_DATA_RATE_STEPS, window=20, step_up_ratio=0.95, step_down_ratio=0.7,
+                 hold_windows=2, fallback_failures=10, adapt_power=True, announce=None, confirm_ms=3000,
+                 follow_timeout_ms=60000):
+        self.lora = lora
+        self.rates = rates
+        self.window = window
+        self.step_up_ratio = step_up_ratio
+        self.step_down_ratio = step_down_ratio
+        self.hold_windows = hold_windows
+        self.fallback_failures = fallback_failures
+        self.adapt_power = adapt_power
+        self.announce = announce
+        self.confirm_ms = confirm_ms
+        self.follow_timeout_ms = follow_timeout_ms
+
+        self.rate_index = 0
+        self.power = MAX_POWER
+
+        # peer -> [delivered, attempts] of the current window
+        self._peers = {}
+        self._clean_windows = 0
+        self._required_windows = hold_windows
+        self._consecutive_failures = 0
+
+        self.changes = 0
+
+        # rate index to go back to while a switch is unconfirmed, ticks of
+        # the switch and of the last frame heard
+        self._unconfirmed = None
+        self._switched_ms = 0
+        self._heard_ms = utime.ticks_ms()
+
+    @property
+    def adapt_rate(self) -> bool:
+        # the peers can only follow a rate change that is announced
+        return self.announce is not None
+
+    # Start from the rate and power the module is using now
+    def sync(self) -> ResponseStatusCode:
+        code, configuration = self.lora.get_configuration()
+        if code == ResponseStatusCode.E32_SUCCESS:
+            if configuration.SPED.airDataRate in self.rates:
+                self.rate_index = self.rates.index(configuration.SPED.airDataRate)
+            self.power = configuration.OPTION.transmissionPower
+        return code
+
+    def record(self, peer, delivered):
+        stats = self._peers.get(peer)
+        if stats is None:
+            stats = [0, 0]
+            self._peers[peer] = stats
+        stats[1] += 1
+        if delivered:
+            stats[0] += 1
+            self._consecutive_failures = 0
+        else:
+            self._consecutive_failures += 1
+
+    def delivery_ratio(self, peer) -> float:
+        stats = self._peers.get(peer)
+        if stats is None or stats[1] == 0:
+            return 1.0
+        return stats[0] / stats[1]
+
+    def _worst_ratio(self):
+        worst = None
+        for peer in self._peers:
+            if self._peers[peer][1] >= self.window:
+                ratio = self.delivery_ratio(peer)
+                if worst is None or ratio < worst:
+                    worst = ratio
+        return worst
+
+    def heard(self) -> bool:
+        """A frame came from a peer: the link works at the current rate. Return True if
+        it confirms a rate change"""
+        self._heard_ms = utime.ticks_ms()
+        confirmed = self._unconfirmed is not None
+        self._unconfirmed = None
+        return confirmed
+
+    def follow(self, rate, confirmed=False) -> ResponseStatusCode:
+        """A peer sent a rate frame: answer it and switch to `rate` (unconfirmed), or, at
+        `rate` already, answer the frame that confirmed the change (heard() returned True)"""
+        if rate not in self.rates:
+            return ResponseStatusCode.ERR_E32_INVALID_PARAM
+        index = self.rates.index(rate)
+        if index == self.rate_index:
+            if confirmed and self.announce is not None:
+                return self.announce(rate)
+            return ResponseStatusCode.E32_SUCCESS
+
+        if self.announce is not None:
+            self.announce(rate)
+        previous = self.rate_index
+        code = self._write(index, self.power)
+        if code == ResponseStatusCode.E32_SUCCESS:
+            self._unconfirmed = previous
+            self._switched_ms = utime.ticks_ms()
+            if self.announce is not None:
+                self.announce(rate)
+        return code
+
+    def _check_follow(self):
+        now = utime.ticks_ms()
+        if self._unconfirmed is not None and utime.ticks_diff(now, self._switched_ms) >= self.confirm_ms:
+            logger.info("Rate change not confirmed, back to the previous rate")
+            previous = self._unconfirmed
+            self._unconfirmed = None
+            return self._write(previous, self.power)
+        if self.rate_index != 0 and utime.ticks_diff(now, self._heard_ms) >= self.follow_timeout_ms:
+            logger.info("No peer heard, back to the base rate")
+            self._heard_ms = now
+            return self._write(0, self.power)
+        return None
+
+    # Return the ResponseStatusCode of the configuration written or of the rate frame sent,
+    # None if nothing changed
+    def evaluate(self):
+        code = self._check_follow()
+        if code is not None:
+            return code
+
+        base_index = 0 if self.adapt_rate else self.rate_index
+        if self._consecutive_failures >= self.fallback_failures and \
+                (self.rate_index != base_index or self.power != MAX_POWER):
+            logger.info("Link lost, back to the base rate")
+            self._consecutive_failures = 0
+            self._required_windows = self.hold_windows
+            # no handshake: the peers come back by themselves, see follow_timeout_ms
+            self._unconfirmed = None
+            return self._write(base_index, MAX_POWER)
+
+        worst = self._worst_ratio()
+        if worst is None:
+            return None
+        for peer in self._peers:
+            self._peers[peer] = [0, 0]
+
+        if worst < self.step_down_ratio:
+            self._clean_windows = 0
+            self._required_windows = min(self._required_windows * 2, MAX_REQUIRED_WINDOWS)
+            if self.power != MAX_POWER:
+                return self._apply(self.rate_index, MAX_POWER)
+            if self.adapt_rate and self.rate_index > 0:
+                return self._apply(self.rate_index - 1, self.power)
+            return None
+
+        if worst >= self.step_up_ratio:
+            self._clean_windows += 1
+            if self._clean_windows < self._required_windows:
+                return None
+            self._clean_windows = 0
+            self._required_windows = max(self.hold_windows, self._required_windows // 2)
+            if self.adapt_rate and self.rate_index < len(self.rates) - 1:
+                return self._apply(self.rate_index + 1, self.power)
+            if self.adapt_power and self.power < MIN_POWER:
+                return self._apply(self.rate_index, self.power + 1)
+            return None
+
+        # in between: hold
+        self._clean_windows = 0
+        return None
+
+    def _apply(self, rate_index, power):
+        if rate_index == self.rate_index:
+            return self._write(rate_index, power)
+        # the switch happens in follow(), when the peers answer; a new power is applied
+        # once the rate settled
+        return self.announce(self.rates[rate_index])
+
+    def _write(self, rate_index, power):
+        code, configuration = self.lora.get_configuration()
+        if code != ResponseStatusCode.E32_SUCCESS:
+            return code
+
+        configuration.SPED.airDataRate = self.rates[rate_index]
+        configuration.OPTION.transmissionPower = power
+        code, configuration = self.lora.set_configuration(configuration, permanentConfiguration=False)
+        if code == ResponseStatusCode.E32_SUCCESS:
+            logger.info("Link adaptation: %s power %s", AirDataRate.get_description(self.rates[rate_index]), power)
+            self.rate_index = rate_index
+            self.power = power
+            self.changes += 1
+        return code
@@ -0,0 +1,527 @@
+#############################################################################################
+# EBYTE LoRa E32 Series for MicroPython - uasyncio driver
+#
+# AsyncLoRaE32 exposes the same API as LoRaE32, but every wait (mode settling, AUX,
+# no-AUX fallback delay, receive polling) is an `await`, so the other tasks of the
+# event loop (BLE, battery, LED...) keep running while the module is busy.
+#
+# The radio is owned by a single uasyncio.Lock: a task that is sending holds it
+# until the module reports completion, so concurrent tasks cannot interleave mode
+# changes or packets.
+#############################################################################################
+
+from lora_e32 import LoRaE32, logger, BROADCAST_ADDRESS, AUX_SETTLE_MS, MODULE_BUFFER_SIZE, MAX_SIZE_TX_PAYLOAD, \
+    TX_HEADER_SIZE, PROGRAM_RESPONSE_TIMEOUT_MS
+from lora_e32_constants import UARTParity, UARTBaudRate
+from lora_e32_operation_constant import ResponseStatusCode, ModeType, SerialUARTBaudRate, ProgramCommand
+
+from micropython import const
+import uasyncio as asyncio
+import utime
+import ujson
+
+# True compiles back in the debug traces of the AUX wait (see lora_e32_logging)
+_DEBUG = const(False)
+
+# Polling period used while waiting for AUX or for incoming bytes
+POLL_INTERVAL_MS = 1
+
+
+class AsyncProgramSession:
+    def __init__(self, alora):
+        self.alora = alora
+        self.prev_mode = None
+        self.code = ResponseStatusCode.E32_SUCCESS
+
+    async def __aenter__(self):
+        alora = self.alora
+        await alora.lock.acquire()
+        try:
+            if alora.lora._program_session_depth == 0:
+                self.code, self.prev_mode = await alora._enter_program_mode()
+        except BaseException:
+            alora.lock.release()
+            raise
+        alora.lora._program_session_depth += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        alora = self.alora
+        try:
+            alora.lora._program_session_depth -= 1
+            if alora.lora._program_session_depth == 0 and self.code == ResponseStatusCode.E32_SUCCESS:
+                self.code = await alora._set_mode(self.prev_mode)
+        finally:
+            alora.lock.release()
+        return False
+
+    # the radio is already held by the session
+    async def get_configuration(self, refresh=False):
+        return await self.alora._get_configuration(refresh)
+
+    async def set_configuration(self, configuration, permanentConfiguration=True):
+        return await self.alora._set_configuration(configuration, permanentConfiguration)
+
+    async def get_module_information(self):
+        return await self.alora._get_module_information()
+
+    async def sync_UART_baudrate(self):
+        return await self.alora._sync_UART_baudrate()
+
+    async def reset_module(self):
+        return await self.alora._reset_module()
+
+
+class AsyncLoRaE32:
+    def __init__(self, model, uart, aux_pin=None, m0_pin=None, m1_pin=None,
+                 uart_baudrate=SerialUARTBaudRate.BPS_RATE_9600, aux_irq=True):
+        self.lora = LoRaE32(model, uart, aux_pin=aux_pin, m0_pin=m0_pin, m1_pin=m1_pin,
+                            uart_baudrate=uart_baudrate, aux_irq=aux_irq)
+        self.lock = asyncio.Lock()
+        if aux_irq:
+            self.lora.aux_event = asyncio.ThreadSafeFlag()
+
+    @property
+    def uart(self):
+        return self.lora.uart
+
+    @property
+    def model(self):
+        return self.lora.model
+
+    @property
+    def mode(self):
+        return self.lora.mode
+
+    @property
+    def codec(self):
+        return self.lora.codec
+
+    # see LoRaE32.begin for sync_UART_baudrate
+    async def begin(self, uart_parity=UARTParity.MODE_00_8N1, sync_UART_baudrate=True):
+        async with self.lock:
+            self.lora._init_hardware(uart_parity)
+            code = await self._set_mode(ModeType.MODE_0_NORMAL)
+            if code != ResponseStatusCode.E32_SUCCESS or not sync_UART_baudrate or \
+                    self.lora.m0 is None or self.lora.m1 is None:
+                return code
+            return await self._sync_UART_baudrate()
+
+    async def sync_UART_baudrate(self) -> ResponseStatusCode:
+        async with self.lock:
+            return await self._sync_UART_baudrate()
+
+    async def set_mode(self, mode) -> ResponseStatusCode:
+        async with self.lock:
+            return await self._set_mode(mode)
+
+    async def _set_mode(self, mode) -> ResponseStatusCode:
+        await asyncio.sleep_ms(40)
+
+        if not self.lora._drive_mode_pins(mode):
+            return ResponseStatusCode.ERR_E32_INVALID_PARAM
+
+        await asyncio.sleep_ms(40)
+
+        res = await self.wait_complete_response(1000)
+        if res == ResponseStatusCode.E32_SUCCESS:
+            self.lora.mode = mode
+            self.lora._switch_UART_baudrate(mode)
+
+        return res
+
+    async def wait_complete_response(self, timeout, wait_no_aux=100, size=None) -> ResponseStatusCode:
+        if size is not None:
+            return await self._wait_transmit_complete(timeout, size)
+
+        aux = self.lora.aux
+        if aux is not None:
+            t = utime.ticks_ms()
+            while aux.value() == 0:
+                if utime.ticks_diff(utime.ticks_ms(), t) > timeout:
+                    if _DEBUG:
+                        logger.debug("Timeout error!")
+                    return ResponseStatusCode.ERR_E32_TIMEOUT
+                await asyncio.sleep_ms(POLL_INTERVAL_MS)
+            if _DEBUG:
+                logger.debug("AUX HIGH!")
+        else:
+            await asyncio.sleep_ms(wait_no_aux)
+            if _DEBUG:
+                logger.debug("Wait no AUX pin!")
+
+        await asyncio.sleep_ms(20)
+        if _DEBUG:
+            logger.debug("Complete!")
+        return ResponseStatusCode.E32_SUCCESS
+
+    async def _wait_transmit_complete(self, timeout, size) -> ResponseStatusCode:
+        lora = self.lora
+        if lora.aux is None:
+            await asyncio.sleep_ms(lora.estimate_transmit_time_ms(size))
+            if _DEBUG:
+                logger.debug("Wait no AUX pin!")
+        elif lora.aux_event is not None:
+            if not lora._aux_rose:
+                try:
+                    await asyncio.wait_for_ms(lora.aux_event.wait(), timeout)
+                except asyncio.TimeoutError:
+                    # the edge can be missed if the module was faster than the write
+                    if lora.aux.value() == 0:
+                        if _DEBUG:
+                            logger.debug("Timeout error!")
+                        return ResponseStatusCode.ERR_E32_TIMEOUT
+            if _DEBUG:
+                logger.debug("AUX HIGH!")
+        else:
+            return await self.wait_complete_response(timeout)
+
+        await asyncio.sleep_ms(AUX_SETTLE_MS)
+        return ResponseStatusCode.E32_SUCCESS
+
+    # Program mode commands hold the radio (no collision with a send) and await the mode
+    # changes and the responses. A session holds it for several commands in one program
+    # mode round trip; use its methods inside (the ones of AsyncLoRaE32 would wait on the
+    # lock it holds):
+    #
+    #   async with alora.program_session() as radio:
+    #       code, configuration = await radio.get_configuration(refresh=True)
+    def program_session(self):
+        return AsyncProgramSession(self)
+
+    async def get_configuration(self, refresh=False):
+        async with self.lock:
+            return await self._get_configuration(refresh)
+
+    async def set_configuration(self, configuration, permanentConfiguration=True):
+        async with self.lock:
+            return await self._set_configuration(configuration, permanentConfiguration)
+
+    async def set_channel(self, CHAN, permanentConfiguration=None):
+        async with self.lock:
+            code, configuration = await self._get_configuration()
+            if code != ResponseStatusCode.E32_SUCCESS:
+                return code
+            configuration.CHAN = CHAN
+            return (await self._set_configuration(configuration, permanentConfiguration))[0]
+
+    async def set_address(self, ADDH, ADDL, permanentConfiguration=None):
+        async with self.lock:
+            code, configuration = await self._get_configuration()
+            if code != ResponseStatusCode.E32_SUCCESS:
+                return code
+            configuration.ADDH = ADDH
+            configuration.ADDL = ADDL
+            return (await self._set_configuration(configuration, permanentConfiguration))[0]
+
+    async def get_module_information(self):
+        async with self.lock:
+            return await self._get_module_information()
+
+    async def reset_module(self):
+        async with self.lock:
+            return await self._reset_module()
+
+    # The methods below run with the radio held, they follow the ones of LoRaE32
+
+    async def _sync_UART_baudrate(self) -> ResponseStatusCode:
+        code = self.lora.check_UART_configuration(ModeType.MODE_0_NORMAL)
+        if code != ResponseStatusCode.E32_SUCCESS:
+            return code
+
+        code, configuration = await self._get_configuration(refresh=True)
+        if code != ResponseStatusCode.E32_SUCCESS:
+            return code
+        if not self.lora._UART_baudrate_to_write(configuration):
+            return code
+        return (await self._set_configuration(configuration, permanentConfiguration=True))[0]
+
+    async def _enter_program_mode(self) -> (ResponseStatusCode, int):
+        lora = self.lora
+        if lora._program_session_depth > 0 and lora.mode == ModeType.MODE_3_PROGRAM:
+            return ResponseStatusCode.E32_SUCCESS, None
+
+        code = lora.check_UART_configuration(ModeType.MODE_3_PROGRAM)
+        if code != ResponseStatusCode.E32_SUCCESS:
+            return code, None
+
+        prev_mode = lora.mode
+        code = await self._set_mode(ModeType.MODE_3_PROGRAM)
+        return code, prev_mode
+
+    async def _leave_program_mode(self, prev_mode, settle=False) -> ResponseStatusCode:
+        if self.lora._program_session_depth > 0 and prev_mode is None:
+            if settle:
+                return await self.wait_complete_response(1000)
+            return ResponseStatusCode.E32_SUCCESS
+        return await self._set_mode(prev_mode)
+
+    async def _wait_program_response(self, size, timeout=PROGRAM_RESPONSE_TIMEOUT_MS):
+        lora = self.lora
+        t = utime.ticks_ms()
+        while True:
+            code, data = lora._take_program_response(size)
+            if code is not None:
+                return code, data
+            if utime.ticks_diff(utime.ticks_ms(), t) >= timeout:
+                lora._program_count = 0
+                return ResponseStatusCode.ERR_E32_DATA_SIZE_NOT_MATCH, None
+            await asyncio.sleep_ms(POLL_INTERVAL_MS)
+
+    async def _read_program_response(self, cmd, size):
+        self.lora._discard_UART()
+        if self.lora.write_program_command(cmd, delay=0):
+            return ResponseStatusCode.ERR_E32_NO_RESPONSE_FROM_DEVICE, None
+        return await self._wait_program_response(size)
+
+    async def _get_configuration(self, refresh=False):
+        lora = self.lora
+        if lora._shadow is not None and not refresh:
+            return ResponseStatusCode.E32_SUCCESS, lora._shadow.copy()
+
+        code, prev_mode = await self._enter_program_mode()
+        if code != ResponseStatusCode.E32_SUCCESS:
+            return code, None
+
+        code, data = await self._read_program_response(ProgramCommand.READ_CONFIGURATION, 6)
+        if code != ResponseStatusCode.E32_SUCCESS:
+            await self._leave_program_mode(prev_mode)
+            return code, None
+
+        configuration = lora._configuration_read(data)
+        code = await self._leave_program_mode(prev_mode)
+        return code, configuration
+
+    async def _set_configuration(self, configuration, permanentConfiguration=True):
+        lora = self.lora
+        data = lora._configuration_image(configuration, permanentConfiguration)
+        if data is None:
+            return ResponseStatusCode.E32_SUCCESS, configuration
+
+        code, prev_mode = await self._enter_program_mode()
+        if code != ResponseStatusCode.E32_SUCCESS:
+            return code, None
+
+        lora._discard_UART()
+        code = lora._check_written(lora.uart.write(data), len(data))
+        if code != ResponseStatusCode.E32_SUCCESS:
+            await self._leave_program_mode(prev_mode)
+            return lora._configuration_written(code, configuration)
+        # the module answers with the parameters, they must not reach the ring
+        await self._wait_program_response(len(data))
+
+        # the host UART follows the module to its new rate when program mode is left
+        lora.uart_baudrate = UARTBaudRate.get_bps(configuration.SPED.uartBaudRate)
+
+        code = await self._leave_program_mode(prev_mode, settle=True)
+        return lora._configuration_written(code, configuration)
+
+    async def _get_module_information(self):
+        code, prev_mode = await self._enter_program_mode()
+        if code != ResponseStatusCode.E32_SUCCESS:
+            return code, None
+
+        code, data = await self._read_program_response(ProgramCommand.READ_MODULE_VERSION, 4)
+        if code != ResponseStatusCode.E32_SUCCESS:
+            await self._leave_program_mode(prev_mode)
+            return code, None
+
+        code = await self._leave_program_mode(prev_mode)
+        if code != ResponseStatusCode.E32_SUCCESS:
+            return code, None
+        return LoRaE32._module_information_read(data)
+
+    async def _reset_module(self) -> ResponseStatusCode:
+        lora = self.lora
+        code, prev_mode = await self._enter_program_mode()
+        if code != ResponseStatusCode.E32_SUCCESS:
+            return code
+
+        lora.write_program_command(ProgramCommand.WRITE_RESET_MODULE, delay=0)
+        await asyncio.sleep_ms(50)
+        lora._forget_configuration()
+
+        code = await self.wait_complete_response(1000)
+        if code != ResponseStatusCode.E32_SUCCESS:
+            await self._leave_program_mode(prev_mode)
+            return code
+
+        return await self._leave_program_mode(prev_mode)
+
+    async def send_broadcast_message(self, CHAN, message) -> ResponseStatusCode:
+        return await self._send_message(message, BROADCAST_ADDRESS, BROADCAST_ADDRESS, CHAN)
+
+    async def send_broadcast_dict(self, CHAN, dict_message) -> ResponseStatusCode:
+        return await self._send_message(ujson.dumps(dict_message), BROADCAST_ADDRESS, BROADCAST_ADDRESS, CHAN)
+
+    async def send_transparent_message(self, message) -> ResponseStatusCode:
+        return await self._send_message(message)
+
+    async def send_fixed_message(self, ADDH, ADDL, CHAN, message) -> ResponseStatusCode:
+        return await self._send_message(message, ADDH, ADDL, CHAN)
+
+    async def send_fixed_dict(self, ADDH, ADDL, CHAN, dict_message) -> ResponseStatusCode:
+        return await self._send_message(ujson.dumps(dict_message), ADDH, ADDL, CHAN)
+
+    async def send_transparent_dict(self, dict_message) -> ResponseStatusCode:
+        return await self._send_message(ujson.dumps(dict_message))
+
+    async def send_record(self, record, schema=None, ADDH=None, ADDL=None, CHAN=None) -> ResponseStatusCode:
+        try:
+            message = self.lora.codec.encode(record, schema)
+        except Exception as e:
+            logger.error("Error: %s", e)
+            return ResponseStatusCode.ERR_E32_INVALID_PARAM
+        return await self._send_message(message, ADDH, ADDL, CHAN)
+
+    # buf must be owned by the caller: lora.tx_buffer is filled by the other senders once
+    # they hold the radio, so it could hold their message by the time this one gets it
+    async def send_into(self, buf, length, ADDH=None, ADDL=None, CHAN=None) -> ResponseStatusCode:
+        if buf is self.lora.tx_buffer:
+            return ResponseStatusCode.ERR_E32_INVALID_PARAM
+        if length > MAX_SIZE_TX_PAYLOAD or TX_HEADER_SIZE + length > len(buf):
+            return ResponseStatusCode.ERR_E32_PACKET_TOO_BIG
+
+        async with self.lock:
+            return await self._write_packet(self.lora._packet_view(buf, length, ADDH, ADDL, CHAN))
+
+    async def _write_packet(self, data) -> ResponseStatusCode:
+        lora = self.lora
+        wait = lora._reserve_airtime(len(data))
+        if wait:
+            await asyncio.sleep_ms(wait)
+
+        lora._arm_aux()
+        result = lora._check_written(lora.uart.write(data), len(data))
+        if result != ResponseStatusCode.E32_SUCCESS:
+            return result
+
+        result = await self.wait_complete_response(1000 + lora.estimate_transmit_time_ms(len(data)), size=len(data))
+        return result
+
+    async def send_wake_message(self, ADDH, ADDL, CHAN, message) -> ResponseStatusCode:
+        lora = self.lora
+        async with self.lock:
+            prev_mode = lora.mode
+            code = await self._set_mode(ModeType.MODE_1_WAKE_UP)
+            if code != ResponseStatusCode.E32_SUCCESS:
+                return code
+
+            code = await self._send_locked(message, ADDH, ADDL, CHAN)
+            restored = await self._set_mode(prev_mode if prev_mode is not None else ModeType.MODE_0_NORMAL)
+        if code != ResponseStatusCode.E32_SUCCESS:
+            return code
+        return restored
+
+    async def _send_message(self, message, ADDH=None, ADDL=None, CHAN=None) -> ResponseStatusCode:
+        async with self.lock:
+            return await self._send_locked(message, ADDH, ADDL, CHAN)
+
+    # the TX buffer is shared, it is filled only while holding the radio
+    async def _send_locked(self, message, ADDH=None, ADDL=None, CHAN=None) -> ResponseStatusCode:
+        lora = self.lora
+        length = lora._stage_message(message)
+        if length >= 0:
+            return await self._write_packet(lora._packet_view(lora.tx_buffer, length, ADDH, ADDL, CHAN))
+
+        result, packets = lora._encode_packets(message, ADDH, ADDL, CHAN)
+        if result != ResponseStatusCode.E32_SUCCESS:
+            return result
+
+        # same pacing as LoRaE32._send_message, the lock keeps the fragments contiguous
+        fixed = ADDH is not None and ADDL is not None and CHAN is not None
+        buffered = 0
+        for i in range(len(packets)):
+            data = packets[i]
+            wait = lora._reserve_airtime(len(data))
+            if wait:
+                await asyncio.sleep_ms(wait)
+            lora._arm_aux()
+            result = lora._check_written(lora.uart.write(data), len(data))
+            if result != ResponseStatusCode.E32_SUCCESS:
+                return result
+            buffered += len(data)
+
+            last = i == len(packets) - 1
+            if last or fixed or buffered + len(packets[i + 1]) > MODULE_BUFFER_SIZE:
+                result = await self.wait_complete_response(1000 + lora.estimate_transmit_time_ms(buffered),
+                                                           size=buffered)
+                if result != ResponseStatusCode.E32_SUCCESS:
+                    return result
+                buffered = 0
+
+        return result
+
+    async def receive_dict(self, delimiter=None, size=None, timeout=1000) -> (ResponseStatusCode, any):
+        code, msg = await self.receive_message(delimiter, size, timeout)
+        if code != ResponseStatusCode.E32_SUCCESS:
+            return code, None
+
+        try:
+            msg = ujson.loads(msg)
+        except Exception as e:
+            logger.error("Error: %s", e)
+            return ResponseStatusCode.ERR_E32_JSON_PARSE, None
+
+        return code, msg
+
+    async def receive_record(self, timeout=1000) -> (ResponseStatusCode, any):
+        code, data = await self.receive_frame(timeout=timeout)
+        if code != ResponseStatusCode.E32_SUCCESS:
+            return code, None
+        return LoRaE32._decode_record(self.lora.codec, data)
+
+    async def receive_message(self, delimiter=None, size=None, timeout=1000) -> (ResponseStatusCode, any):
+        code, data = await self.receive_frame(delimiter, size, timeout)
+        if code != ResponseStatusCode.E32_SUCCESS:
+            return code, None
+
+        return code, str(data, 'utf-8')
+
+    async def receive_frame(self, delimiter=None, size=None, timeout=1000) -> (ResponseStatusCode, any):
+        reader = self.lora.reader
+        if isinstance(delimiter, str):
+            delimiter = delimiter.encode('utf-8')
+
+        if delimiter is not None:
+            take = lambda: reader.take_until(delimiter)
+        elif size is not None:
+            take = lambda: reader.take(size)
+        else:
+            # fragments go to the reassembler whenever they arrive, see LoRaE32._take_received
+            take = self.lora._take_received
+
+        code, data = await self._wait_frame(take, timeout)
+        if code == ResponseStatusCode.ERR_E32_TIMEOUT and reader.available() == 0:
+            return ResponseStatusCode.ERR_E32_DATA_SIZE_NOT_MATCH, None
+        return code, data
+
+    async def _wait_frame(self, take, timeout) -> (ResponseStatusCode, any):
+        reader = self.lora.reader
+        t = utime.ticks_ms()
+        while True:
+            # the lock is held only while reading: a task waiting for a frame doesn't
+            # hold back the senders
+            async with self.lock:
+                reader.fill()
+                code, data = take()
+            if code is not None:
+                return code, data
+            if utime.ticks_diff(utime.ticks_ms(), t) >= timeout:
+                return ResponseStatusCode.ERR_E32_TIMEOUT, None
+            await asyncio.sleep_ms(POLL_INTERVAL_MS)
+
+    def set_duty_cycle(self, duty_cycle, window_ms=3600000):
+        self.lora.set_duty_cycle(duty_cycle, window_ms)
+
+    def predict_send_latency_ms(self, size, wake=False) -> int:
+        return self.lora.predict_send_latency_ms(size, wake)
+
+    def get_wake_up_time_ms(self) -> int:
+        return self.lora.get_wake_up_time_ms()
+
+    def available(self) -> int:
+        return self.lora.available()
+
+    def end(self) -> ResponseStatusCode:
+        return self.lora.end()
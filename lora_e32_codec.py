@@ -0,0 +1,164 @@
+#############################################################################################
+# Compact binary records for the EBYTE LoRa E32
+#
+# JSON spends most of a 58 byte packet on key names and digits. A Schema declares the
+# fields of a message once; required numeric fields are compiled to a struct format,
+# required strings follow as varint length + UTF-8, optional fields are appended as
+# | field id | value | with integers as zigzag varints, so a missing field costs 0 bytes.
+#
+#   | RECORD_MARKER | schema id | struct fields | strings | optional fields... |
+#
+# A record without a known schema falls back to ujson text, and received text is
+# decoded with ujson, so JSON senders and receivers keep working.
+#
+# Field types: 'u8', 'i8', 'u16', 'i16', 'u32', 'i32', 'f32', 'bool', 'str'
+# (optional fields: any integer type, 'bool' or 'str').
+#############################################################################################
+
+import struct
+import ujson
+
+RECORD_MARKER = 0xFC
+
+_STRUCT_CODES = {'u8': 'B', 'i8': 'b', 'u16': 'H', 'i16': 'h', 'u32': 'I', 'i32': 'i', 'f32': 'f', 'bool': '?'}
+
+
+def _encode_varint(value, out):
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return
+
+
+def _decode_varint(data, offset) -> (int, int):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, offset
+        shift += 7
+
+
+def _zigzag(value) -> int:
+    return (value << 1) if value >= 0 else ((-value << 1) - 1)
+
+
+def _unzigzag(value) -> int:
+    return (value >> 1) if not value & 1 else -((value + 1) >> 1)
+
+
+class Schema:
+    def __init__(self, schema_id, name, fields, optional=()):
+        """fields: [(name, type)], optional: [(field id, name, type)]"""
+        if not 0 <= schema_id <= 255:
+            raise ValueError("Invalid schema id")
+        self.schema_id = schema_id
+        self.name = name
+
+        self.struct_fields = []
+        self.string_fields = []
+        fmt = '<'
+        for field_name, field_type in fields:
+            if field_type == 'str':
+                self.string_fields.append(field_name)
+            elif field_type in _STRUCT_CODES:
+                self.struct_fields.append(field_name)
+                fmt += _STRUCT_CODES[field_type]
+            else:
+                raise ValueError("Invalid field type: {}".format(field_type))
+        self.fmt = fmt
+        self.struct_size = struct.calcsize(fmt)
+
+        self.optional = {}
+        self.optional_by_name = {}
+        for field_id, field_name, field_type in optional:
+            if field_type not in _STRUCT_CODES and field_type != 'str' or field_type == 'f32':
+                raise ValueError("Invalid optional field type: {}".format(field_type))
+            self.optional[field_id] = (field_name, field_type)
+            self.optional_by_name[field_name] = (field_id, field_type)
+
+    def encode(self, record) -> bytes:
+        out = bytearray([RECORD_MARKER, self.schema_id])
+        out.extend(struct.pack(self.fmt, *[record[name] for name in self.struct_fields]))
+
+        for name in self.string_fields:
+            value = record[name].encode('utf-8')
+            _encode_varint(len(value), out)
+            out.extend(value)
+
+        for name in self.optional_by_name:
+            if name not in record or record[name] is None:
+                continue
+            field_id, field_type = self.optional_by_name[name]
+            out.append(field_id)
+            if field_type == 'str':
+                value = record[name].encode('utf-8')
+                _encode_varint(len(value), out)
+                out.extend(value)
+            else:
+                _encode_varint(_zigzag(int(record[name])), out)
+        return bytes(out)
+
+    def decode(self, data, offset=2) -> dict:
+        record = {}
+        values = struct.unpack_from(self.fmt, data, offset)
+        for i in range(len(self.struct_fields)):
+            record[self.struct_fields[i]] = values[i]
+        offset += self.struct_size
+
+        for name in self.string_fields:
+            size, offset = _decode_varint(data, offset)
+            record[name] = str(data[offset:offset + size], 'utf-8')
+            offset += size
+
+        while offset < len(data):
+            field_id = data[offset]
+            if field_id not in self.optional:
+                raise ValueError("Unknown field id {} in schema {}".format(field_id, self.name))
+            name, field_type = self.optional[field_id]
+            if field_type == 'str':
+                size, offset = _decode_varint(data, offset + 1)
+                record[name] = str(data[offset:offset + size], 'utf-8')
+                offset += size
+            else:
+                value, offset = _decode_varint(data, offset + 1)
+                value = _unzigzag(value)
+                record[name] = bool(value) if field_type == 'bool' else value
+        return record
+
+
+class RecordCodec:
+    def __init__(self):
+        self._by_id = {}
+        self._by_name = {}
+
+    def register(self, schema):
+        self._by_id[schema.schema_id] = schema
+        self._by_name[schema.name] = schema
+        return schema
+
+    def get_schema(self, name):
+        return self._by_name.get(name)
+
+    def encode(self, record, schema=None) -> bytes:
+        """Encode with the named schema, or as JSON text if the schema is unknown"""
+        compiled = self._by_name.get(schema) if schema is not None else None
+        if compiled is None:
+            return ujson.dumps(record).encode('utf-8')
+        return compiled.encode(record)
+
+    def decode(self, data) -> (str, dict):
+        """Return (schema name, record); schema name is None for JSON text"""
+        if len(data) >= 2 and data[0] == RECORD_MARKER:
+            schema = self._by_id.get(data[1])
+            if schema is None:
+                raise KeyError("Unknown schema id {}".format(data[1]))
+            return schema.name, schema.decode(data)
+        return None, ujson.loads(str(data, 'utf-8'))
@@ -1,28 +1,29 @@
-class Logger:
-    def __init__(self, enable_debug):
-        self.enable_debug = enable_debug
-        self.name = ''
+from lora_e32_logging import getLogger
 
-    def debug(self, msg, *args):
-        if self.enable_debug:
-            print(self.name + ' DEBUG ' + msg, *args)
+try:
+    from micropython import const
+except ImportError:
+    # CPython (host tools: wor_model.py, provision.py)
+    def const(value):
+        return value
 
-    def info(self, msg, *args):
-        if self.enable_debug:
-            print(self.name + ' INFO ' + msg, *args)
+logger = getLogger(__name__)
 
-    def error(self, msg, *args):
-        if self.enable_debug:
-            print(self.name + ' ERROR ' + msg, *args)
 
-    def getLogger(self, name):
-        self.name = name
-        return Logger(self.enable_debug)
+# The values stay plain class attributes: const() names must be unique in a module and
+# POWER_27, POWER_24... repeat across the power classes. The bounds used by the lookups
+# below are compile time constants (no global, no lookup on the Pico).
+_MAX_CODE_3_BITS = const(0b111)
 
 
-logging = Logger(True)
-
-logger = logging.getLogger(__name__)
+# The description strings are in lora_e32_descriptions, imported by the first
+# get_description() call only: production code needs the values, not the text.
+def _describe(table, value):
+    import lora_e32_descriptions
+    descriptions, invalid = getattr(lora_e32_descriptions, table)
+    if isinstance(value, int) and 0 <= value < len(descriptions):
+        return descriptions[value]
+    return invalid
 
 
 class UARTParity:
@@ -33,16 +34,7 @@ class UARTParity:
 
     @staticmethod
     def get_description(uart_parity):
-        if uart_parity == UARTParity.MODE_00_8N1:
-            return "8N1 (Default)"
-        elif uart_parity == UARTParity.MODE_01_8O1:
-            return "8O1"
-        elif uart_parity == UARTParity.MODE_10_8E1:
-            return "8E1"
-        elif uart_parity == UARTParity.MODE_11_8N1:
-            return "8N1"
-        else:
-            return "Invalid UART Parity!"
+        return _describe('UART_PARITY', uart_parity)
 
     @staticmethod
     def get_uart_value(uart_parity):
@@ -58,6 +50,9 @@ class UARTParity:
             return ValueError("Invalid UART Parity!")
 
 
+_UART_BPS = (1200, 2400, 4800, 9600, 19200, 38400, 57600, 115200)
+
+
 class UARTBaudRate:
     BPS_1200 = 0b000
     BPS_2400 = 0b001
@@ -70,24 +65,22 @@ class UARTBaudRate:
 
     @staticmethod
     def get_description(uart_baud_rate):
-        if uart_baud_rate == UARTBaudRate.BPS_1200:
-            return "1200bps"
-        elif uart_baud_rate == UARTBaudRate.BPS_2400:
-            return "2400bps"
-        elif uart_baud_rate == UARTBaudRate.BPS_4800:
-            return "4800bps"
-        elif uart_baud_rate == UARTBaudRate.BPS_9600:
-            return "9600bps (default)"
-        elif uart_baud_rate == UARTBaudRate.BPS_19200:
-            return "19200bps"
-        elif uart_baud_rate == UARTBaudRate.BPS_38400:
-            return "38400bps"
-        elif uart_baud_rate == UARTBaudRate.BPS_57600:
-            return "57600bps"
-        elif uart_baud_rate == UARTBaudRate.BPS_115200:
-            return "115200bps"
-        else:
-            return "Invalid UART Baud Rate!"
+        return _describe('UART_BAUD_RATE', uart_baud_rate)
+
+    @staticmethod
+    def get_bps(uart_baud_rate):
+        if not 0 <= uart_baud_rate <= _MAX_CODE_3_BITS:
+            raise ValueError("Invalid UART Baud Rate!")
+        return _UART_BPS[uart_baud_rate]
+
+    @staticmethod
+    def from_bps(bps):
+        if bps not in _UART_BPS:
+            raise ValueError("Invalid UART Baud Rate!")
+        return _UART_BPS.index(bps)
+
+
+_AIR_BPS = (300, 1200, 2400, 4800, 9600, 19200, 19200, 19200)
 
 
 class AirDataRate:
@@ -102,24 +95,13 @@ class AirDataRate:
 
     @staticmethod
     def get_description(air_data_rate):
-        if air_data_rate == AirDataRate.AIR_DATA_RATE_000_03:
-            return "0.3kbps"
-        elif air_data_rate == AirDataRate.AIR_DATA_RATE_001_12:
-            return "1.2kbps"
-        elif air_data_rate == AirDataRate.AIR_DATA_RATE_010_24:
-            return "2.4kbps (default)"
-        elif air_data_rate == AirDataRate.AIR_DATA_RATE_011_48:
-            return "4.8kbps"
-        elif air_data_rate == AirDataRate.AIR_DATA_RATE_100_96:
-            return "9.6kbps"
-        elif air_data_rate == AirDataRate.AIR_DATA_RATE_101_192:
-            return "19.2kbps"
-        elif air_data_rate == AirDataRate.AIR_DATA_RATE_110_192:
-            return "19.2kbps"
-        elif air_data_rate == AirDataRate.AIR_DATA_RATE_111_192:
-            return "19.2kbps"
-        else:
-            return "Invalid Air Data Rate!"
+        return _describe('AIR_DATA_RATE', air_data_rate)
+
+    @staticmethod
+    def get_bits_per_second(air_data_rate):
+        if not 0 <= air_data_rate <= _MAX_CODE_3_BITS:
+            raise ValueError("Invalid Air Data Rate!")
+        return _AIR_BPS[air_data_rate]
 
 
 class FixedTransmission:
@@ -128,12 +110,7 @@ class FixedTransmission:
 
     @staticmethod
     def get_description(fixed_transmission):
-        if fixed_transmission == FixedTransmission.TRANSPARENT_TRANSMISSION:
-            return "Transparent transmission (default)"
-        elif fixed_transmission == FixedTransmission.FIXED_TRANSMISSION:
-            return "Fixed transmission (first three bytes can be used as high/low address and channel)"
-        else:
-            return "Invalid fixed transmission param!"
+        return _describe('FIXED_TRANSMISSION', fixed_transmission)
 
 
 class IODriveMode:
@@ -142,12 +119,7 @@ class IODriveMode:
 
     @staticmethod
     def get_description(io_drive_mode):
-        if io_drive_mode == IODriveMode.OPEN_COLLECTOR:
-            return "TXD, RXD, AUX are open-collectors"
-        elif io_drive_mode == IODriveMode.PUSH_PULLS_PULL_UPS:
-            return "TXD, RXD, AUX are push-pulls/pull-ups (default)"
-        else:
-            return "Invalid IO drive mode!"
+        return _describe('IO_DRIVE_MODE', io_drive_mode)
 
 
 class WirelessWakeUpTime:
@@ -162,24 +134,13 @@ class WirelessWakeUpTime:
 
     @staticmethod
     def get_description(wireless_wake_up_time):
-        if wireless_wake_up_time == WirelessWakeUpTime.WAKE_UP_250:
-            return "250ms (default)"
-        elif wireless_wake_up_time == WirelessWakeUpTime.WAKE_UP_500:
-            return "500ms"
-        elif wireless_wake_up_time == WirelessWakeUpTime.WAKE_UP_750:
-            return "750ms"
-        elif wireless_wake_up_time == WirelessWakeUpTime.WAKE_UP_1000:
-            return "1000ms"
-        elif wireless_wake_up_time == WirelessWakeUpTime.WAKE_UP_1250:
-            return "1250ms"
-        elif wireless_wake_up_time == WirelessWakeUpTime.WAKE_UP_1500:
-            return "1500ms"
-        elif wireless_wake_up_time == WirelessWakeUpTime.WAKE_UP_1750:
-            return "1750ms"
-        elif wireless_wake_up_time == WirelessWakeUpTime.WAKE_UP_2000:
-            return "2000ms"
-        else:
-            return "Invalid wireless wake-up mode!"
+        return _describe('WIRELESS_WAKE_UP_TIME', wireless_wake_up_time)
+
+    @staticmethod
+    def get_milliseconds(wireless_wake_up_time):
+        if not 0 <= wireless_wake_up_time <= _MAX_CODE_3_BITS:
+            raise ValueError("Invalid wireless wake-up mode!")
+        return (wireless_wake_up_time + 1) * 250
 
 
 class ForwardErrorCorrectionSwitch:
@@ -188,12 +149,7 @@ class ForwardErrorCorrectionSwitch:
 
     @staticmethod
     def get_description(fec):
-        if fec == ForwardErrorCorrectionSwitch.FEC_0_OFF:
-            return "Turn off Forward Error Correction Switch"
-        elif fec == ForwardErrorCorrectionSwitch.FEC_1_ON:
-            return "Turn on Forward Error Correction Switch (Default)"
-        else:
-            return "Invalid FEC param"
+        return _describe('FEC', fec)
 
 
 class TransmissionPower20:
@@ -204,16 +160,7 @@ class TransmissionPower20:
 
     @staticmethod
     def get_description(transmission_power):
-        if transmission_power == TransmissionPower20.POWER_20:
-            return "20dBm (Default)"
-        elif transmission_power == TransmissionPower20.POWER_17:
-            return "17dBm"
-        elif transmission_power == TransmissionPower20.POWER_14:
-            return "14dBm"
-        elif transmission_power == TransmissionPower20.POWER_10:
-            return "10dBm"
-        else:
-            return "Invalid transmission power param"
+        return _describe('POWER_20', transmission_power)
 
     @staticmethod
     def get_default_value():
@@ -228,16 +175,7 @@ class TransmissionPower27:
 
     @staticmethod
     def get_description(transmission_power):
-        if transmission_power == TransmissionPower27.POWER_27:
-            return "27dBm (Default)"
-        elif transmission_power == TransmissionPower27.POWER_24:
-            return "24dBm"
-        elif transmission_power == TransmissionPower27.POWER_21:
-            return "21dBm"
-        elif transmission_power == TransmissionPower27.POWER_18:
-            return "18dBm"
-        else:
-            return "Invalid transmission power param"
+        return _describe('POWER_27', transmission_power)
 
     @staticmethod
     def get_default_value():
@@ -252,16 +190,7 @@ class TransmissionPower30:
 
     @staticmethod
     def get_description(transmission_power):
-        if transmission_power == TransmissionPower30.POWER_30:
-            return "30dBm (Default)"
-        elif transmission_power == TransmissionPower30.POWER_27:
-            return "27dBm"
-        elif transmission_power == TransmissionPower30.POWER_24:
-            return "24dBm"
-        elif transmission_power == TransmissionPower30.POWER_21:
-            return "21dBm"
-        else:
-            return "Invalid transmission power param"
+        return _describe('POWER_30', transmission_power)
 
     @staticmethod
     def get_default_value():
@@ -276,16 +205,7 @@ class TransmissionPower33:
 
     @staticmethod
     def get_description(transmission_power):
-        if transmission_power == TransmissionPower33.POWER_33:
-            return "33dBm (Default)"
-        elif transmission_power == TransmissionPower33.POWER_30:
-            return "30dBm"
-        elif transmission_power == TransmissionPower33.POWER_27:
-            return "27dBm"
-        elif transmission_power == TransmissionPower33.POWER_24:
-            return "24dBm"
-        else:
-            return "Invalid transmission power param"
+        return _describe('POWER_33', transmission_power)
 
     @staticmethod
     def get_default_value():
@@ -300,19 +220,7 @@ class TransmissionPower37:
 
     @staticmethod
     def get_description(transmission_power):
-        logger.debug("TransmissionPower37.get_description: transmission_power = %s", transmission_power)
-        logger.debug("TransmissionPower37.POWER_37_00: transmission_power = %s", TransmissionPower37.POWER_37_00)
-
-        if transmission_power == TransmissionPower37.POWER_37_00:
-            return "37dBm (Default)"
-        elif transmission_power == TransmissionPower37.POWER_37_01:
-            return "37dBm"
-        elif transmission_power == TransmissionPower37.POWER_37_10:
-            return "37dBm"
-        elif transmission_power == TransmissionPower37.POWER_37_11:
-            return "37dBm"
-        else:
-            return "Invalid transmission power param"
+        return _describe('POWER_37', transmission_power)
 
     @staticmethod
     def get_default_value():
@@ -356,32 +264,78 @@ class OperatingFrequency:
 # the last letter is the package type, D is for discrete S is for SMD  (example D)
 class TransmissionPower:
     def __init__(self, model):
+        spec = ModelSpec.get(model)
         self.model = model
-        self.package_type = None
-        self.frequency = None
-        self.transmission_power = None
-
-        if model is not None:
-            self.package_type = model[6]
-            self.frequency = int(model[0:3])
-            self.transmission_power = int(model[4:6])
-            logger.debug("Package type: " + self.package_type)
-            logger.debug("Frequency: " + str(self.frequency))
-            logger.debug("Transmission power: " + str(self.transmission_power))
+        self.package_type = spec.package_type
+        self.frequency = spec.frequency
+        self.transmission_power = spec.transmission_power
+        self._power_class = spec.power_class
 
-    def get_transmission_power(self):
-        if self.transmission_power == 20:
+    @staticmethod
+    def get_power_class(transmission_power):
+        if transmission_power == 20:
             return TransmissionPower20
-        elif self.transmission_power == 27:
+        elif transmission_power == 27:
             return TransmissionPower27
-        elif self.transmission_power == 30:
+        elif transmission_power == 30:
             return TransmissionPower30
-        elif self.transmission_power == 33:
+        elif transmission_power == 33:
             return TransmissionPower33
-        elif self.transmission_power == 37:
+        elif transmission_power == 37:
             return TransmissionPower37
         else:
             return "Invalid transmission power param"
 
+    def get_transmission_power(self):
+        return self._power_class
+
     def get_transmission_power_description(self, transmission_power):
-        return self.get_transmission_power().get_description(transmission_power)
+        return self._power_class.get_description(transmission_power)
+
+
+# The model string parsed once: ModelSpec.get(model) returns the same object for every
+# LoRaE32, Configuration, Option and TransmissionPower of that model, with the values
+# they need precomputed (frequency base, power class, channel -> MHz).
+class ModelSpec:
+    # CHAN 0x00..0x1F
+    CHANNELS = 32
+
+    _cache = {}
+
+    def __init__(self, model):
+        self.model = model
+        self.package_type = None
+        self.frequency = None
+        self.transmission_power = None
+        self.power_class = None
+        self.default_power = None
+        self.frequency_base = None
+        self.channel_mhz = ()
+
+        if model is not None:
+            self.package_type = model[6]
+            self.frequency = int(model[0:3])
+            self.transmission_power = int(model[4:6])
+            self.power_class = TransmissionPower.get_power_class(self.transmission_power)
+            if not isinstance(self.power_class, str):
+                self.default_power = self.power_class.get_default_value()
+            self.frequency_base = getattr(OperatingFrequency, 'FREQUENCY_' + str(self.frequency), None)
+            if self.frequency_base is not None:
+                self.channel_mhz = tuple([self.frequency_base + channel for channel in range(ModelSpec.CHANNELS)])
+            logger.debug("Package type: %s", self.package_type)
+            logger.debug("Frequency: %s", self.frequency)
+            logger.debug("Transmission power: %s", self.transmission_power)
+
+    @staticmethod
+    def get(model):
+        spec = ModelSpec._cache.get(model)
+        if spec is None:
+            spec = ModelSpec(model)
+            ModelSpec._cache[model] = spec
+        return spec
+
+    def get_freq_from_channel(self, channel):
+        if 0 <= channel < len(self.channel_mhz):
+            return self.channel_mhz[channel]
+        # unknown band: fails like OperatingFrequency
+        return OperatingFrequency.get_freq_from_channel(self.frequency, channel)
@@ -0,0 +1,80 @@
+#############################################################################################
+# De-duplication of the messages bridged from BLE to LoRa
+#
+# After a connection hiccup a phone writes the same update again, and every copy
+# would cost its full airtime on the radio. DedupCache remembers the last `size`
+# messages (least recently seen dropped first):
+#
+#   - a message with an ID ("#<id>:<payload>", see split_message_id) is a duplicate
+#     when the ID was already seen, whatever the time
+#   - otherwise a message is a duplicate when the same payload (hash) was seen less
+#     than `window_ms` ago: the same score sent again later goes out
+#
+# hits / misses count the duplicates and the new messages.
+#############################################################################################
+
+import utime
+
+MESSAGE_ID_PREFIX = '#'
+MESSAGE_ID_SEPARATOR = ':'
+
+
+def split_message_id(message) -> (str, str):
+    """Return (id, payload) of "#<id>:<payload>", (None, message) without an ID"""
+    if not message.startswith(MESSAGE_ID_PREFIX):
+        return None, message
+    end = message.find(MESSAGE_ID_SEPARATOR)
+    if end <= 1:
+        return None, message
+    return message[1:end], message[end + 1:]
+
+
+class DedupCache:
+    def __init__(self, size=32, window_ms=2000):
+        self.size = size
+        self.window_ms = window_ms
+        # key -> ticks_ms when seen first, key is the ID (str) or the payload hash (int)
+        self._seen = {}
+        # keys, least recently seen first
+        self._order = []
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._seen)
+
+    @staticmethod
+    def _key(payload, message_id):
+        if message_id is not None:
+            return str(message_id)
+        return hash(payload)
+
+    def seen(self, payload, message_id=None) -> bool:
+        """True if the message is a duplicate, otherwise remember it"""
+        key = self._key(payload, message_id)
+        now = utime.ticks_ms()
+        first = self._seen.get(key)
+        if first is not None:
+            self._order.remove(key)
+            if message_id is not None or utime.ticks_diff(now, first) < self.window_ms:
+                self._order.append(key)
+                self.hits += 1
+                return True
+
+        if first is None and len(self._order) >= self.size:
+            del self._seen[self._order.pop(0)]
+        self._seen[key] = now
+        self._order.append(key)
+        self.misses += 1
+        return False
+
+    def forget(self, payload, message_id=None):
+        """Forget a message that wasn't sent after all, so that its retry goes out"""
+        key = self._key(payload, message_id)
+        if self._seen.pop(key, None) is not None:
+            self._order.remove(key)
+
+    def clear(self):
+        self._seen = {}
+        self._order = []
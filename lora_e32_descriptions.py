@@ -0,0 +1,35 @@
+#############################################################################################
+# Descriptions of the constants of lora_e32_constants
+#
+# Only print_configuration() and the diagnostics need these strings: get_description()
+# imports this module the first time it is called, so importing the constants doesn't
+# put them on the heap. Every table is (descriptions by value, text of an invalid value).
+# Frozen in the firmware (or compiled with mpy-cross) the strings stay in flash.
+#############################################################################################
+
+UART_PARITY = (("8N1 (Default)", "8O1", "8E1", "8N1"), "Invalid UART Parity!")
+
+UART_BAUD_RATE = (("1200bps", "2400bps", "4800bps", "9600bps (default)", "19200bps", "38400bps", "57600bps",
+                   "115200bps"), "Invalid UART Baud Rate!")
+
+AIR_DATA_RATE = (("0.3kbps", "1.2kbps", "2.4kbps (default)", "4.8kbps", "9.6kbps", "19.2kbps", "19.2kbps",
+                  "19.2kbps"), "Invalid Air Data Rate!")
+
+FIXED_TRANSMISSION = (("Transparent transmission (default)",
+                       "Fixed transmission (first three bytes can be used as high/low address and channel)"),
+                      "Invalid fixed transmission param!")
+
+IO_DRIVE_MODE = (("TXD, RXD, AUX are open-collectors", "TXD, RXD, AUX are push-pulls/pull-ups (default)"),
+                 "Invalid IO drive mode!")
+
+WIRELESS_WAKE_UP_TIME = (("250ms (default)", "500ms", "750ms", "1000ms", "1250ms", "1500ms", "1750ms", "2000ms"),
+                         "Invalid wireless wake-up mode!")
+
+FEC = (("Turn off Forward Error Correction Switch", "Turn on Forward Error Correction Switch (Default)"),
+       "Invalid FEC param")
+
+POWER_20 = (("20dBm (Default)", "17dBm", "14dBm", "10dBm"), "Invalid transmission power param")
+POWER_27 = (("27dBm (Default)", "24dBm", "21dBm", "18dBm"), "Invalid transmission power param")
+POWER_30 = (("30dBm (Default)", "27dBm", "24dBm", "21dBm"), "Invalid transmission power param")
+POWER_33 = (("33dBm (Default)", "30dBm", "27dBm", "24dBm"), "Invalid transmission power param")
+POWER_37 = (("37dBm (Default)", "37dBm", "37dBm", "37dBm"), "Invalid transmission power param")
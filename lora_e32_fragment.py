@@ -0,0 +1,108 @@
+#############################################################################################
+# Fragmentation and reassembly for messages bigger than one EBYTE LoRa E32 packet
+#
+# A message longer than a packet is split in numbered fragments, each one fits in a
+# single packet (MAX_SIZE_TX_PACKET bytes) and starts with a 5 byte header:
+#
+#   | FRAGMENT_MARKER | message id | index | count | payload length | payload |
+#
+# The marker 0xFD never starts valid UTF-8 text, so plain messages can share the
+# channel. The receiver keeps at most `max_messages` partial messages; a message
+# that is not completed within `timeout_ms` of its first fragment is dropped.
+#
+# This module doesn't import lora_e32 (lora_e32 uses it to stream big messages).
+#############################################################################################
+
+import utime
+
+FRAGMENT_MARKER = 0xFD
+FRAGMENT_HEADER_SIZE = 5
+# same value as lora_e32.MAX_SIZE_TX_PACKET
+FRAGMENT_PACKET_SIZE = 58
+
+
+def is_fragment(data) -> bool:
+    return len(data) >= FRAGMENT_HEADER_SIZE and data[0] == FRAGMENT_MARKER
+
+
+def fragment_message(data, msg_id, packet_size=FRAGMENT_PACKET_SIZE) -> list:
+    chunk = packet_size - FRAGMENT_HEADER_SIZE
+    count = (len(data) + chunk - 1) // chunk
+    if count > 255:
+        raise ValueError("Message too big: {} fragments".format(count))
+
+    fragments = []
+    for index in range(count):
+        payload = data[index * chunk:(index + 1) * chunk]
+        fragments.append(bytes([FRAGMENT_MARKER, msg_id & 0xFF, index, count, len(payload)]) + payload)
+    return fragments
+
+
+class Reassembler:
+    def __init__(self, max_messages=4, timeout_ms=5000):
+        self.max_messages = max_messages
+        self.timeout_ms = timeout_ms
+
+        # (source, msg_id) -> [first fragment ticks, count, {index: payload}]
+        self._partial = {}
+        self._ready = []
+
+        self.completed = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def feed(self, data, source=None):
+        """Consume a received chunk, it may hold several fragments or a plain message"""
+        self.expire()
+        i = 0
+        while i < len(data):
+            if not is_fragment(data[i:i + FRAGMENT_HEADER_SIZE]):
+                # not ours: everything left is a plain message
+                self._ready.append(bytes(data[i:]))
+                return
+            msg_id, index, count, size = data[i + 1], data[i + 2], data[i + 3], data[i + 4]
+            start = i + FRAGMENT_HEADER_SIZE
+            if start + size > len(data) or index >= count:
+                # truncated or corrupted fragment, the rest of the chunk can't be trusted
+                return
+            self._add((source, msg_id), index, count, bytes(data[start:start + size]))
+            i = start + size
+
+    def _add(self, key, index, count, payload):
+        entry = self._partial.get(key)
+        if entry is None or entry[1] != count:
+            if len(self._partial) >= self.max_messages:
+                self._evict_oldest()
+            entry = [utime.ticks_ms(), count, {}]
+            self._partial[key] = entry
+
+        entry[2][index] = payload
+        if len(entry[2]) == count:
+            del self._partial[key]
+            self._ready.append(b''.join([entry[2][n] for n in range(count)]))
+            self.completed += 1
+
+    def _evict_oldest(self):
+        now = utime.ticks_ms()
+        oldest = None
+        for key in self._partial:
+            if oldest is None or utime.ticks_diff(now, self._partial[key][0]) > \
+                    utime.ticks_diff(now, self._partial[oldest][0]):
+                oldest = key
+        del self._partial[oldest]
+        self.evicted += 1
+
+    def expire(self):
+        now = utime.ticks_ms()
+        for key in [k for k in self._partial if utime.ticks_diff(now, self._partial[k][0]) > self.timeout_ms]:
+            del self._partial[key]
+            self.expired += 1
+
+    def in_progress(self) -> int:
+        return len(self._partial)
+
+    def pop(self):
+        """Return the next complete message, or None"""
+        if self._ready:
+            return self._ready.pop(0)
+        return None
@@ -0,0 +1,154 @@
+#############################################################################################
+# Leveled logger for the EBYTE LoRa E32 driver
+#
+# Arguments are formatted lazily with %: logger.debug("mode %s", mode) costs one level
+# comparison when DEBUG is disabled, no string is built and nothing is printed.
+# Records can also go to a RingLogSink, a fixed size bytearray in RAM that keeps the
+# latest lines and is dumped on demand (e.g. after a failure, without a USB console).
+#
+# Calls on hot paths can be removed at compile time: a module declares
+#
+#   _DEBUG = const(False)
+#
+# and writes `if _DEBUG: logger.debug(...)`. MicroPython drops the whole statement
+# when the constant is False; set it to True to get those lines back.
+#
+# Logger(True) / Logger(False) and logger.getLogger(name) keep working as before.
+#############################################################################################
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+NONE = 100
+
+_LEVEL_NAMES = {DEBUG: 'DEBUG', INFO: 'INFO', WARNING: 'WARNING', ERROR: 'ERROR'}
+
+# level of the loggers created by getLogger()
+default_level = INFO
+default_sink = None
+
+
+class RingLogSink:
+    def __init__(self, size=2048):
+        self._buf = bytearray(size)
+        self._size = size
+        self._head = 0
+        self._count = 0
+        self.lines = 0
+
+    def write(self, line):
+        data = line.encode('utf-8') if isinstance(line, str) else line
+        # keep the end of a line bigger than the buffer, plus its newline
+        if len(data) >= self._size:
+            data = data[len(data) - self._size + 1:]
+        for chunk in (data, b'\n'):
+            size = len(chunk)
+            tail = (self._head + self._count) % self._size
+            first = min(size, self._size - tail)
+            self._buf[tail:tail + first] = chunk[:first]
+            self._buf[:size - first] = chunk[first:]
+            overflow = self._count + size - self._size
+            if overflow > 0:
+                self._head = (self._head + overflow) % self._size
+                self._count -= overflow
+            self._count += size
+        self.lines += 1
+
+    def clear(self):
+        self._head = 0
+        self._count = 0
+
+    def getvalue(self) -> bytes:
+        end = self._head + self._count
+        if end <= self._size:
+            data = bytes(self._buf[self._head:end])
+        else:
+            data = bytes(self._buf[self._head:]) + bytes(self._buf[:end - self._size])
+        # the oldest line may have been cut by the wrap, drop it
+        if self._count == self._size:
+            data = data[data.find(b'\n') + 1:]
+        return data
+
+    def dump(self):
+        for line in str(self.getvalue(), 'utf-8').split('\n'):
+            if line:
+                print(line)
+
+
+class Logger:
+    def __init__(self, level=INFO, name='', sink=None, console=True):
+        # compatibility with Logger(enable_debug)
+        if level is True:
+            level = DEBUG
+        elif level is False:
+            level = NONE
+        self.level = level
+        self.name = name
+        self.sink = sink
+        self.console = console
+
+    def isEnabledFor(self, level) -> bool:
+        return level >= self.level
+
+    def setLevel(self, level):
+        self.level = level
+
+    def _log(self, level, msg, args):
+        if args:
+            try:
+                msg = msg % args
+            except TypeError:
+                # print style arguments: logger.debug("size:", size)
+                msg = ' '.join([msg] + [str(arg) for arg in args])
+        line = "{} {} {}".format(self.name, _LEVEL_NAMES[level], msg)
+        if self.console:
+            print(line)
+        if self.sink is not None:
+            self.sink.write(line)
+
+    def debug(self, msg, *args):
+        if self.level <= DEBUG:
+            self._log(DEBUG, msg, args)
+
+    def info(self, msg, *args):
+        if self.level <= INFO:
+            self._log(INFO, msg, args)
+
+    def warning(self, msg, *args):
+        if self.level <= WARNING:
+            self._log(WARNING, msg, args)
+
+    def error(self, msg, *args):
+        if self.level <= ERROR:
+            self._log(ERROR, msg, args)
+
+    def getLogger(self, name):
+        return Logger(self.level, name, self.sink, self.console)
+
+
+_loggers = {}
+
+
+def getLogger(name) -> Logger:
+    logger = _loggers.get(name)
+    if logger is None:
+        logger = Logger(default_level, name, default_sink)
+        _loggers[name] = logger
+    return logger
+
+
+def basicConfig(level=None, sink=None, console=None):
+    """Change the level/sink/console of every logger, existing and future"""
+    global default_level, default_sink
+    if level is not None:
+        default_level = level
+    if sink is not None:
+        default_sink = sink
+    for logger in _loggers.values():
+        if level is not None:
+            logger.level = level
+        if sink is not None:
+            logger.sink = sink
+        if console is not None:
+            logger.console = console
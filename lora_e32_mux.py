@@ -0,0 +1,112 @@
+#############################################################################################
+# Multiplexer of several EBYTE LoRa E32 modules
+#
+# One E32 sends one packet at a time: while it waits for AUX the next update queues
+# behind it, even when it goes to another scoreboard on another channel. The RP2040
+# has two hardware UARTs, so LoRaMux drives several AsyncLoRaE32 (one per UART), each
+# with its own CoalescingTxQueue, and exposes the put() of a single queue:
+#
+#   mux = LoRaMux(linger_ms=30, wake=wor)
+#   mux.add(lora1, CHAN)   # CHAN configured in the module
+#   mux.add(lora0, CHAN)
+#   mux.put(message, (ADDH, ADDL, CHAN))
+#   await mux.run()
+#
+# A message goes to the module that already has messages pending for its destination
+# (the order of the updates of a scoreboard is kept), otherwise to the least busy
+# module (pending messages, radio held), the module on the destination channel first.
+# In fixed transmission the channel is in the packet header, so any module reaches
+# any channel: the modules must be configured in fixed transmission with the same air
+# data rate. Transparent messages (destination None) always use the first module.
+#############################################################################################
+
+from lora_e32_txqueue import CoalescingTxQueue
+
+import uasyncio as asyncio
+
+
+class _Lane:
+    def __init__(self, lora, channel, queue):
+        self.lora = lora
+        self.channel = channel
+        self.queue = queue
+        self.routed = 0
+
+    def load(self) -> int:
+        load = self.queue.pending()
+        if self.lora.lock.locked():
+            load += 1
+        return load
+
+
+class LoRaMux:
+    def __init__(self, linger_ms=30, max_pending=32, wake=None):
+        self.linger_ms = linger_ms
+        self.max_pending = max_pending
+        self.wake = wake
+        self.lanes = []
+        self._added = asyncio.Event()
+
+    def add(self, lora, channel) -> CoalescingTxQueue:
+        """Add an AsyncLoRaE32 that has been started (begin), channel is its CHAN"""
+        queue = CoalescingTxQueue(lora, linger_ms=self.linger_ms, max_pending=self.max_pending, wake=self.wake)
+        self.lanes.append(_Lane(lora, channel, queue))
+        self._added.set()
+        return queue
+
+    def __len__(self):
+        return len(self.lanes)
+
+    def _select(self, destination):
+        if not self.lanes:
+            return None
+        if destination is None:
+            return self.lanes[0]
+
+        for lane in self.lanes:
+            if lane.queue.has_pending(destination):
+                return lane
+
+        best = None
+        best_key = None
+        for lane in self.lanes:
+            key = (lane.load(), 0 if lane.channel == destination[2] else 1)
+            if best is None or key < best_key:
+                best = lane
+                best_key = key
+        return best
+
+    def put(self, message, destination=None) -> bool:
+        lane = self._select(destination)
+        if lane is None or not lane.queue.put(message, destination):
+            return False
+        lane.routed += 1
+        return True
+
+    def pending(self) -> int:
+        return sum([lane.queue.pending() for lane in self.lanes])
+
+    def predict_send_latency_ms(self, size, destination=None, wake=False) -> int:
+        lane = self._select(destination)
+        if lane is None:
+            return 0
+        return lane.queue.predict_latency_ms(size, destination, wake)
+
+    @property
+    def messages_sent(self) -> int:
+        return sum([lane.queue.messages_sent for lane in self.lanes])
+
+    @property
+    def dropped(self) -> int:
+        return sum([lane.queue.dropped for lane in self.lanes])
+
+    async def run(self):
+        """Run the queues of the modules, those added later included"""
+        running = 0
+        tasks = []
+        while True:
+            while running < len(self.lanes):
+                tasks.append(asyncio.create_task(self.lanes[running].queue.run()))
+                running += 1
+            self._added.clear()
+            await self._added.wait()
@@ -0,0 +1,162 @@
+#############################################################################################
+# Ring buffer UART reader for the EBYTE LoRa E32
+#
+# Bytes are pulled from the UART with readinto() into a preallocated ring buffer and
+# frames are cut by scanning that buffer (delimiter, exact size or "line quiet"),
+# so receiving never allocates per byte. A frame is copied in a preallocated frame
+# buffer and returned as a memoryview: it is valid until the next read, the caller
+# must copy it (bytes(view)) to keep it.
+#
+# The take_*() methods never block, they are used by the async driver between two
+# awaits; the read_*() methods loop on them until a deadline.
+#############################################################################################
+
+from lora_e32_operation_constant import ResponseStatusCode
+
+import utime
+
+# Silence on the line that marks the end of a packet when no delimiter/size is given
+IDLE_END_OF_PACKET_MS = 20
+
+
+class UARTRingReader:
+    def __init__(self, uart, size=512, max_frame=256):
+        self.uart = uart
+        self._buf = bytearray(size)
+        self._mv = memoryview(self._buf)
+        self._size = size
+        self._head = 0
+        self._count = 0
+        # position (relative to head) up to which the delimiter has already been searched
+        self._scanned = 0
+        # the start of a frame too big for the ring was dropped, its end must be too
+        self._overrun = False
+
+        self._frame = bytearray(max_frame)
+        self._frame_mv = memoryview(self._frame)
+        self.max_frame = max_frame
+
+        self.last_rx_ms = utime.ticks_ms()
+        self.overflows = 0
+
+    def available(self) -> int:
+        return self._count
+
+    def clear(self):
+        self._head = 0
+        self._count = 0
+        self._scanned = 0
+        self._overrun = False
+        while self.uart.any():
+            self.uart.readinto(self._mv)
+
+    def fill(self) -> int:
+        """Move the bytes waiting in the UART into the ring, return how many were read"""
+        total = 0
+        while self._count < self._size:
+            waiting = self.uart.any()
+            if not waiting:
+                break
+            tail = (self._head + self._count) % self._size
+            room = min(self._size - self._count, self._size - tail, waiting)
+            n = self.uart.readinto(self._mv[tail:tail + room])
+            if not n:
+                break
+            self._count += n
+            total += n
+
+        if total:
+            self.last_rx_ms = utime.ticks_ms()
+        elif self._count == self._size and self.uart.any():
+            self.overflows += 1
+        return total
+
+    def peek(self, offset=0) -> int:
+        if self._count <= offset:
+            return -1
+        return self._byte(offset)
+
+    def _byte(self, offset) -> int:
+        return self._buf[(self._head + offset) % self._size]
+
+    def _consume(self, size, skip=0):
+        # copy `size` bytes to the frame buffer, then drop them and `skip` more from the ring
+        first = min(size, self._size - self._head)
+        self._frame_mv[:first] = self._mv[self._head:self._head + first]
+        if size > first:
+            self._frame_mv[first:size] = self._mv[:size - first]
+
+        self._head = (self._head + size + skip) % self._size
+        self._count -= size + skip
+        self._scanned = 0
+        return self._frame_mv[:size]
+
+    def _drop(self, size):
+        self._head = (self._head + size) % self._size
+        self._count -= size
+        self._scanned = 0
+
+    def take(self, size):
+        if size > self.max_frame:
+            return ResponseStatusCode.ERR_E32_BUF_TOO_SMALL, None
+        if self._count < size:
+            return None, None
+        return ResponseStatusCode.E32_SUCCESS, self._consume(size)
+
+    def take_until(self, delimiter):
+        last = len(delimiter) - 1
+        i = self._scanned
+        while i + last < self._count:
+            if self._byte(i + last) == delimiter[last]:
+                match = True
+                for j in range(last):
+                    if self._byte(i + j) != delimiter[j]:
+                        match = False
+                        break
+                if match:
+                    if self._overrun:
+                        self._overrun = False
+                        self._drop(i + last + 1)
+                        i = 0
+                        continue
+                    if i > self.max_frame:
+                        self._drop(i + last + 1)
+                        return ResponseStatusCode.ERR_E32_BUF_TOO_SMALL, None
+                    return ResponseStatusCode.E32_SUCCESS, self._consume(i, last + 1)
+            i += 1
+        self._scanned = i
+
+        if self._count >= self._size:
+            # the ring is full and there is no delimiter: the frame can't fit
+            self._drop(self._count)
+            self._overrun = True
+            return ResponseStatusCode.ERR_E32_BUF_TOO_SMALL, None
+        return None, None
+
+    def take_packet(self, idle_ms=IDLE_END_OF_PACKET_MS):
+        if self._count == 0 or utime.ticks_diff(utime.ticks_ms(), self.last_rx_ms) < idle_ms:
+            return None, None
+        return ResponseStatusCode.E32_SUCCESS, self._consume(min(self._count, self.max_frame))
+
+    def _wait(self, take, timeout):
+        t = utime.ticks_ms()
+        while True:
+            self.fill()
+            code, frame = take()
+            if code is not None:
+                return code, frame
+            if utime.ticks_diff(utime.ticks_ms(), t) >= timeout:
+                return ResponseStatusCode.ERR_E32_TIMEOUT, None
+
+    def read_exact(self, size, timeout=1000):
+        return self._wait(lambda: self.take(size), timeout)
+
+    def read_until(self, delimiter, timeout=1000):
+        if isinstance(delimiter, str):
+            delimiter = delimiter.encode('utf-8')
+        elif isinstance(delimiter, int):
+            delimiter = bytes([delimiter])
+        return self._wait(lambda: self.take_until(delimiter), timeout)
+
+    def read_packet(self, timeout=1000, idle_ms=IDLE_END_OF_PACKET_MS):
+        return self._wait(lambda: self.take_packet(idle_ms), timeout)
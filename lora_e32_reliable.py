@@ -0,0 +1,368 @@
+#############################################################################################
+# Acknowledged delivery for the EBYTE LoRa E32
+#
+# send_fixed_message() only tells if the UART took the bytes. ReliableLink numbers the
+# messages sent to each peer, the peer answers with ACKs addressed back to the sender
+# (fixed transmission strips the address, so every frame carries its source) and
+# unacknowledged messages are sent again when their timer expires:
+#
+#   DATA | DATA_MARKER | session | seq | base | src ADDH | src ADDL | src CHAN | length | payload |
+#   ACK  | ACK_MARKER  | session | next expected seq | bitmap | src ADDH | src ADDL | src CHAN |
+#
+# Packets received while the program doesn't read the UART (a blocking send) come out of
+# the reader as one chunk: every frame gives its size, so a chunk is split back in frames.
+#
+# With a LinkAdaptationController as `adaptation` the link feeds it the delivery results,
+# announces its rate changes to the peers and makes it follow the rate frames received
+# (see lora_e32_adapt).
+#
+# Up to `window` messages per peer are in flight. An ACK acknowledges every seq before
+# `next expected` plus, in `bitmap`, which of the 8 following ones already arrived, so
+# one ACK covers a whole burst and only the lost messages are sent again, as soon as an
+# ACK shows that a later message arrived (no need to wait for the timer). The receiver
+# delivers messages in order; `base` is the oldest seq the sender still retries, a
+# message the sender gave up on is skipped instead of blocking the following ones.
+# `session` is drawn at start, a peer that restarts is recognized and resynchronized.
+#
+# The retransmit timeout starts from the airtime of a data packet plus its ACK and then
+# follows the measured round trips (srtt + 4 * rttvar, doubled at every retry).
+#
+# ReliableLink is not a task: call poll() often, it receives, answers ACKs, retransmits
+# and sends what the window allows. It drives a synchronous LoRaE32; with AsyncLoRaE32
+# pass alora.lora and call poll() while holding alora.lock. Messages must fit in one
+# packet (MAX_SIZE_RELIABLE_PAYLOAD bytes). Plain packets received meanwhile are
+# delivered too, with source None (with the rest of their chunk).
+#############################################################################################
+
+from lora_e32 import MAX_SIZE_TX_PACKET, logger
+from lora_e32_adapt import RATE_MARKER, RATE_FRAME_SIZE, rate_frame
+from lora_e32_operation_constant import ResponseStatusCode
+from lora_e32_reader import IDLE_END_OF_PACKET_MS
+
+import random
+import utime
+
+# 0xF5-0xFF never start valid UTF-8 text
+DATA_MARKER = 0xFB
+ACK_MARKER = 0xFA
+RELIABLE_HEADER_SIZE = 8
+ACK_SIZE = 7
+MAX_SIZE_RELIABLE_PAYLOAD = MAX_SIZE_TX_PACKET - RELIABLE_HEADER_SIZE
+# the bitmap of an ACK covers the 8 seq after `next expected`
+MAX_WINDOW = 8
+
+# receiver processing on top of the airtime before the ACK leaves
+RTO_MARGIN_MS = 50
+MAX_RTO_MS = 10000
+
+
+def _seq_diff(a, b) -> int:
+    """a - b in the 8 bit sequence space, negative if a is before b"""
+    diff = (a - b) & 0xFF
+    return diff - 256 if diff >= 128 else diff
+
+
+class PeerStats:
+    def __init__(self):
+        self.delivered = 0
+        self.failed = 0
+        self.retransmissions = 0
+        self.latency_ms = 0
+        self.max_latency_ms = 0
+        self.srtt_ms = None
+        self.received = 0
+        self.duplicates = 0
+
+    def mean_latency_ms(self) -> int:
+        if self.delivered == 0:
+            return 0
+        return self.latency_ms // self.delivered
+
+    def __str__(self):
+        return "delivered {} failed {} retries {} latency mean {} ms max {} ms".format(
+            self.delivered, self.failed, self.retransmissions, self.mean_latency_ms(), self.max_latency_ms)
+
+
+class _Peer:
+    def __init__(self):
+        # sender side
+        self.next_seq = 0
+        self.queue = []
+        # seq -> [frame, submit ticks, sent ticks, retries, lost]
+        self.inflight = {}
+        self.srtt = None
+        self.rttvar = 0
+
+        # receiver side
+        self.session = None
+        self.expected = 0
+        self.out_of_order = {}
+        self.ack_due = False
+
+        self.stats = PeerStats()
+
+
+class ReliableLink:
+    def __init__(self, lora, ADDH, ADDL, CHAN, window=4, max_retries=5, max_pending=16, adaptation=None):
+        if not 1 <= window <= MAX_WINDOW:
+            raise ValueError("Invalid window")
+        self.lora = lora
+        self.address = bytes([ADDH & 0xFF, ADDL & 0xFF, CHAN & 0xFF])
+        self.window = window
+        self.max_retries = max_retries
+        self.max_pending = max_pending
+        # optional LinkAdaptationController, told the outcome of every transmission
+        self.adaptation = adaptation
+        if adaptation is not None and adaptation.announce is None:
+            adaptation.announce = self.announce_rate
+
+        self.session = random.getrandbits(8)
+        self._peers = {}
+        self.inbox = []
+
+        # minimum timeout: a full data packet (the peer may be sending one) then our ACK
+        self.min_rto_ms = (lora.estimate_transmit_time_ms(MAX_SIZE_TX_PACKET) +
+                           lora.estimate_transmit_time_ms(ACK_SIZE) +
+                           2 * IDLE_END_OF_PACKET_MS + RTO_MARGIN_MS)
+
+    def _peer(self, peer) -> _Peer:
+        state = self._peers.get(peer)
+        if state is None:
+            state = _Peer()
+            self._peers[peer] = state
+        return state
+
+    def send(self, ADDH, ADDL, CHAN, message) -> ResponseStatusCode:
+        """Queue a message for (ADDH, ADDL, CHAN), poll() sends it"""
+        if isinstance(message, str):
+            message = message.encode('utf-8')
+        if len(message) > MAX_SIZE_RELIABLE_PAYLOAD:
+            return ResponseStatusCode.ERR_E32_PACKET_TOO_BIG
+
+        state = self._peer((ADDH & 0xFF, ADDL & 0xFF, CHAN & 0xFF))
+        if len(state.queue) >= self.max_pending:
+            return ResponseStatusCode.ERR_E32_BUF_TOO_SMALL
+        state.queue.append((bytes(message), utime.ticks_ms()))
+        return ResponseStatusCode.E32_SUCCESS
+
+    def pending(self, peer=None) -> int:
+        """Messages queued or waiting for their ACK"""
+        if peer is not None:
+            state = self._peers.get(peer)
+            return 0 if state is None else len(state.queue) + len(state.inflight)
+        return sum(len(state.queue) + len(state.inflight) for state in self._peers.values())
+
+    def stats(self, peer) -> PeerStats:
+        return self._peer(peer).stats
+
+    def peers(self) -> list:
+        return list(self._peers.keys())
+
+    def receive(self):
+        """Return (source, message) of the oldest delivered message, (None, None) if none"""
+        if not self.inbox:
+            return None, None
+        return self.inbox.pop(0)
+
+    def poll(self) -> int:
+        """Do everything that is due now, return how many messages were delivered"""
+        delivered = len(self.inbox)
+        while True:
+            code, frame = self.lora.receive_frame(timeout=0)
+            if code != ResponseStatusCode.E32_SUCCESS:
+                break
+            self._handle(frame)
+
+        for peer in self._peers:
+            state = self._peers[peer]
+            if state.ack_due:
+                self._send_ack(peer, state)
+            self._retransmit(peer, state)
+            self._transmit(peer, state)
+        return len(self.inbox) - delivered
+
+    def flush(self, timeout=5000) -> ResponseStatusCode:
+        """Poll until every queued message is acknowledged or dropped"""
+        t = utime.ticks_ms()
+        while self.pending():
+            if utime.ticks_diff(utime.ticks_ms(), t) >= timeout:
+                return ResponseStatusCode.ERR_E32_TIMEOUT
+            self.poll()
+            utime.sleep_ms(1)
+        return ResponseStatusCode.E32_SUCCESS
+
+    def announce_rate(self, rate) -> ResponseStatusCode:
+        """Send a rate frame to every peer (announce of the LinkAdaptationController)"""
+        code = ResponseStatusCode.E32_SUCCESS
+        frame = rate_frame(rate)
+        for peer in self._peers:
+            result = self._write(peer, frame)
+            if result != ResponseStatusCode.E32_SUCCESS:
+                code = result
+        return code
+
+    def _handle(self, chunk):
+        confirmed = False
+        if self.adaptation is not None:
+            confirmed = self.adaptation.heard()
+        i = 0
+        while i < len(chunk):
+            left = len(chunk) - i
+            if chunk[i] == RATE_MARKER and left >= RATE_FRAME_SIZE and self.adaptation is not None:
+                self.adaptation.follow(chunk[i + 1], confirmed)
+                i += RATE_FRAME_SIZE
+                continue
+            if chunk[i] == ACK_MARKER and left >= ACK_SIZE:
+                end = i + ACK_SIZE
+            elif chunk[i] == DATA_MARKER and left >= RELIABLE_HEADER_SIZE and \
+                    RELIABLE_HEADER_SIZE + chunk[i + 7] <= left:
+                end = i + RELIABLE_HEADER_SIZE + chunk[i + 7]
+            else:
+                # not ours: everything left is a plain message
+                self.inbox.append((None, bytes(chunk[i:])))
+                return
+
+            frame = chunk[i:end]
+            peer = (frame[4], frame[5], frame[6])
+            if frame[0] == DATA_MARKER:
+                self._handle_data(peer, frame)
+            else:
+                self._handle_ack(peer, frame)
+            i = end
+
+    def _handle_data(self, peer, frame):
+        state = self._peer(peer)
+        session, seq, base = frame[1], frame[2], frame[3]
+        if state.session != session:
+            # first contact or the peer restarted
+            state.session = session
+            state.expected = base
+            state.out_of_order = {}
+        state.ack_due = True
+
+        if _seq_diff(seq, state.expected) < 0 or seq in state.out_of_order:
+            state.stats.duplicates += 1
+            return
+        state.out_of_order[seq] = bytes(frame[RELIABLE_HEADER_SIZE:])
+
+        # messages the sender gave up on won't come, don't wait for them
+        if _seq_diff(base, state.expected) > 0:
+            skipped = [old for old in state.out_of_order if _seq_diff(old, base) < 0]
+            skipped.sort(key=lambda old: _seq_diff(old, base))
+            for old in skipped:
+                self._deliver(peer, state, state.out_of_order.pop(old))
+            state.expected = base
+
+        while state.expected in state.out_of_order:
+            self._deliver(peer, state, state.out_of_order.pop(state.expected))
+            state.expected = (state.expected + 1) & 0xFF
+
+    def _deliver(self, peer, state, message):
+        state.stats.received += 1
+        self.inbox.append((peer, message))
+
+    def _handle_ack(self, peer, frame):
+        state = self._peers.get(peer)
+        if state is None or frame[1] != self.session:
+            # ACK of a previous session
+            return
+        expected, bitmap = frame[2], frame[3]
+        now = utime.ticks_ms()
+        latest_sent = None
+        for seq in list(state.inflight):
+            diff = _seq_diff(seq, expected)
+            if diff < 0 or (0 < diff <= MAX_WINDOW and bitmap & (1 << (diff - 1))):
+                sent = state.inflight[seq][2]
+                if latest_sent is None or utime.ticks_diff(sent, latest_sent) > 0:
+                    latest_sent = sent
+                self._acknowledged(peer, state, seq, now)
+
+        # fast retransmit: what was sent before a message that arrived is lost
+        if latest_sent is not None:
+            for entry in state.inflight.values():
+                if utime.ticks_diff(entry[2], latest_sent) < 0:
+                    entry[4] = True
+
+    def _acknowledged(self, peer, state, seq, now):
+        frame, submitted, sent, retries, lost = state.inflight.pop(seq)
+        stats = state.stats
+        if retries == 0:
+            # Karn: the round trip of a retransmitted message is ambiguous
+            rtt = utime.ticks_diff(now, sent)
+            if state.srtt is None:
+                state.srtt = rtt
+                state.rttvar = rtt // 2
+            else:
+                state.rttvar = (3 * state.rttvar + abs(state.srtt - rtt)) // 4
+                state.srtt = (7 * state.srtt + rtt) // 8
+            stats.srtt_ms = state.srtt
+
+        latency = utime.ticks_diff(now, submitted)
+        stats.delivered += 1
+        stats.latency_ms += latency
+        stats.max_latency_ms = max(stats.max_latency_ms, latency)
+        if self.adaptation is not None:
+            self.adaptation.record(peer, True)
+
+    def _rto_ms(self, state, retries) -> int:
+        rto = self.min_rto_ms
+        if state.srtt is not None:
+            rto = max(rto, state.srtt + 4 * state.rttvar)
+        return min(rto << retries, MAX_RTO_MS)
+
+    def _base(self, state) -> int:
+        base = state.next_seq
+        for seq in state.inflight:
+            if _seq_diff(seq, base) < 0:
+                base = seq
+        return base
+
+    def _write(self, peer, frame) -> ResponseStatusCode:
+        code = self.lora.send_fixed_message(peer[0], peer[1], peer[2], frame)
+        if code != ResponseStatusCode.E32_SUCCESS:
+            logger.error("Reliable send to %s: %s", peer, ResponseStatusCode.get_description(code))
+        return code
+
+    def _send_ack(self, peer, state):
+        bitmap = 0
+        for seq in state.out_of_order:
+            diff = _seq_diff(seq, state.expected)
+            if 0 < diff <= MAX_WINDOW:
+                bitmap |= 1 << (diff - 1)
+        ack = bytes([ACK_MARKER, state.session, state.expected, bitmap]) + self.address
+        if self._write(peer, ack) == ResponseStatusCode.E32_SUCCESS:
+            state.ack_due = False
+
+    def _retransmit(self, peer, state):
+        now = utime.ticks_ms()
+        for seq in list(state.inflight):
+            entry = state.inflight[seq]
+            if not entry[4] and utime.ticks_diff(now, entry[2]) < self._rto_ms(state, entry[3]):
+                continue
+            if self.adaptation is not None:
+                self.adaptation.record(peer, False)
+            if entry[3] >= self.max_retries:
+                del state.inflight[seq]
+                state.stats.failed += 1
+                logger.error("Reliable send to %s: seq %s dropped after %s retries", peer, seq, entry[3])
+                continue
+
+            # refresh base: the peer may be waiting for a message that was dropped
+            frame = bytearray(entry[0])
+            frame[3] = self._base(state)
+            self._write(peer, frame)
+            entry[2] = utime.ticks_ms()
+            entry[3] += 1
+            entry[4] = False
+            state.stats.retransmissions += 1
+
+    def _transmit(self, peer, state):
+        while state.queue and _seq_diff(state.next_seq, self._base(state)) < self.window:
+            message, submitted = state.queue.pop(0)
+            seq = state.next_seq
+            base = self._base(state)
+            state.next_seq = (seq + 1) & 0xFF
+            frame = bytes([DATA_MARKER, self.session, seq, base]) + self.address + bytes([len(message)]) + message
+            # an error of the UART is retried like a loss on air
+            self._write(peer, frame)
+            state.inflight[seq] = [frame, submitted, utime.ticks_ms(), 0, False]
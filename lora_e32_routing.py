@@ -0,0 +1,113 @@
+#############################################################################################
+# Routing table for fixed transmission through the EBYTE LoRa E32
+#
+# In transparent mode every scoreboard on the channel receives every packet and has to
+# filter it. With fixed transmission the module only delivers packets addressed to its
+# own ADDH/ADDL/CHAN (or broadcast, 0xFFFF), so the others don't even wake the MCU.
+# RoutingTable maps a project number or scoreboard id to its destination:
+#
+#   {"230411": [0, 1, 23], "230412": [0, 2, 23], "site": 23}
+#
+# A list is (ADDH, ADDL, CHAN); a single channel number is a group, sent as a broadcast
+# on that channel. The table is stored as JSON on flash and changed with update(),
+# which takes the same JSON (one or more keys, null removes a key): small enough to be
+# written from the phone on a BLE characteristic, e.g. {"230411":[0,1,23]}.
+#############################################################################################
+
+from lora_e32 import BROADCAST_ADDRESS, logger
+
+import ujson
+
+ROUTES_FILE = 'routes.json'
+
+
+class RoutingTable:
+    def __init__(self, path=ROUTES_FILE):
+        self.path = path
+        self._routes = {}
+
+    def load(self) -> bool:
+        try:
+            with open(self.path, 'r') as f:
+                routes = ujson.load(f)
+        except OSError:
+            # no table yet
+            return False
+        except ValueError as e:
+            logger.error("Invalid routing table %s: %s", self.path, e)
+            return False
+
+        self._routes = {}
+        return self._merge(routes)
+
+    def save(self) -> bool:
+        try:
+            with open(self.path, 'w') as f:
+                ujson.dump(self._routes, f)
+            return True
+        except OSError as e:
+            logger.error("Save routing table %s: %s", self.path, e)
+            return False
+
+    def __len__(self):
+        return len(self._routes)
+
+    def set_route(self, key, ADDH, ADDL, CHAN):
+        self._routes[str(key)] = [ADDH & 0xFF, ADDL & 0xFF, CHAN & 0xFF]
+
+    def set_group(self, key, CHAN):
+        self._routes[str(key)] = CHAN & 0xFF
+
+    def remove(self, key) -> bool:
+        return self._routes.pop(str(key), None) is not None
+
+    def resolve(self, key):
+        """Return (ADDH, ADDL, CHAN) of the key, a broadcast for a group, None if unknown"""
+        route = self._routes.get(str(key))
+        if route is None:
+            return None
+        if isinstance(route, int):
+            return BROADCAST_ADDRESS, BROADCAST_ADDRESS, route
+        return route[0], route[1], route[2]
+
+    def is_group(self, key) -> bool:
+        return isinstance(self._routes.get(str(key)), int)
+
+    @staticmethod
+    def _valid(route) -> bool:
+        if route is None:
+            return True
+        if isinstance(route, int):
+            return 0 <= route <= 0xFF
+        return isinstance(route, list) and len(route) == 3 and \
+            all(isinstance(b, int) and 0 <= b <= 0xFF for b in route)
+
+    def _merge(self, routes) -> bool:
+        # all or nothing: a bad entry leaves the table unchanged
+        if not isinstance(routes, dict):
+            return False
+        for key in routes:
+            if not self._valid(routes[key]):
+                logger.error("Invalid route for %s: %s", key, routes[key])
+                return False
+
+        for key in routes:
+            route = routes[key]
+            if route is None:
+                self.remove(key)
+            elif isinstance(route, int):
+                self.set_group(key, route)
+            else:
+                self.set_route(key, route[0], route[1], route[2])
+        return True
+
+    def update(self, text) -> bool:
+        """Merge a JSON update (see above) and save the table"""
+        try:
+            routes = ujson.loads(text)
+        except ValueError as e:
+            logger.error("Invalid route update: %s", e)
+            return False
+        if not self._merge(routes):
+            return False
+        return self.save()
@@ -0,0 +1,56 @@
+#############################################################################################
+# Duty cycle aware transmit scheduler for the EBYTE LoRa E32
+#
+# Regulated bands limit the fraction of time a device may transmit (e.g. 1% or 10% in
+# the EU 433/868 MHz sub-bands, measured over one hour). DutyCycleScheduler is a token
+# bucket counted in milliseconds of airtime: it refills at `duty_cycle` ms per ms and
+# holds at most duty_cycle * window_ms, so short bursts are allowed as long as the
+# average stays in budget.
+#
+# reserve() books the airtime of a packet and returns how long the caller must wait
+# before putting it on air; delay_ms() only predicts that wait.
+#############################################################################################
+
+import utime
+
+
+class DutyCycleScheduler:
+    def __init__(self, duty_cycle=0.01, window_ms=3600000):
+        if not 0 < duty_cycle <= 1:
+            raise ValueError("Invalid duty cycle")
+        self.duty_cycle = duty_cycle
+        self.window_ms = window_ms
+        self.capacity_ms = duty_cycle * window_ms
+
+        self._tokens = self.capacity_ms
+        self._last = utime.ticks_ms()
+
+        self.airtime_ms = 0
+        self.deferred = 0
+
+    def _refill(self):
+        now = utime.ticks_ms()
+        self._tokens = min(self.capacity_ms, self._tokens + utime.ticks_diff(now, self._last) * self.duty_cycle)
+        self._last = now
+
+    def available_ms(self) -> float:
+        """Airtime that can be used right now"""
+        self._refill()
+        return max(self._tokens, 0)
+
+    def delay_ms(self, airtime_ms) -> int:
+        """Wait needed before a packet of `airtime_ms` can go on air"""
+        self._refill()
+        missing = airtime_ms - self._tokens
+        if missing <= 0:
+            return 0
+        return int(missing / self.duty_cycle) + 1
+
+    def reserve(self, airtime_ms) -> int:
+        """Book the airtime and return the wait before sending (later reservations queue behind)"""
+        wait = self.delay_ms(airtime_ms)
+        self._tokens -= airtime_ms
+        self.airtime_ms += airtime_ms
+        if wait:
+            self.deferred += 1
+        return wait
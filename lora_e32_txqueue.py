@@ -0,0 +1,201 @@
+#############################################################################################
+# Coalescing transmit queue for the EBYTE LoRa E32
+#
+# Every packet costs the module wake-up, preamble and AUX wait, so a burst of short
+# messages (scoreboard updates from a phone) wastes most of the airtime on overhead.
+# CoalescingTxQueue sits in front of an AsyncLoRaE32, waits `linger_ms` after the
+# first pending message and packs everything that fits (same destination) into one
+# frame of at most MAX_SIZE_TX_PACKET bytes:
+#
+#   | PACKED_FRAME_MARKER | len | message | len | message | ... |
+#
+# A message that travels alone is sent as it is, so receivers that only understand
+# plain text keep working. The marker 0xFE never starts valid UTF-8 text.
+# On the receiving side unpack_frame() returns the list of original messages.
+#
+# With a WakeOnRadioPolicy (lora_e32_wor) frames for a destination that sleeps in power
+# saving mode are sent with the wake-up preamble.
+#############################################################################################
+
+from lora_e32 import MAX_SIZE_TX_PACKET, logger
+from lora_e32_operation_constant import ResponseStatusCode
+
+import uasyncio as asyncio
+import utime
+
+PACKED_FRAME_MARKER = 0xFE
+
+
+def _to_bytes(message):
+    if isinstance(message, str):
+        return message.encode('utf-8')
+    return bytes(message)
+
+
+def pack_messages(messages, max_size=MAX_SIZE_TX_PACKET) -> (bytes, int):
+    """Pack the leading messages that fit in max_size, return the frame and how many were used"""
+    if len(messages) == 1 or len(messages[0]) + 2 > max_size:
+        return messages[0], 1
+
+    frame = bytearray([PACKED_FRAME_MARKER])
+    count = 0
+    for message in messages:
+        if len(message) > 255 or len(frame) + 1 + len(message) > max_size:
+            break
+        frame.append(len(message))
+        frame.extend(message)
+        count += 1
+
+    if count == 1:
+        return messages[0], 1
+    return bytes(frame), count
+
+
+def unpack_frame(data) -> list:
+    """Split a received frame in the original messages (a plain packet is returned alone)"""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    if len(data) == 0 or data[0] != PACKED_FRAME_MARKER:
+        return [bytes(data)]
+
+    messages = []
+    i = 1
+    while i < len(data):
+        size = data[i]
+        if i + 1 + size > len(data):
+            logger.error("Truncated sub-frame at %s", i)
+            break
+        messages.append(bytes(data[i + 1:i + 1 + size]))
+        i += 1 + size
+    return messages
+
+
+class CoalescingTxQueue:
+    def __init__(self, lora, linger_ms=30, max_frame=MAX_SIZE_TX_PACKET, max_pending=32, wake=None):
+        self.lora = lora
+        self.wake = wake
+        self.linger_ms = linger_ms
+        self.max_frame = max_frame
+        self.max_pending = max_pending
+
+        # list of (destination, message bytes), destination is None or (ADDH, ADDL, CHAN)
+        self._pending = []
+        self._event = asyncio.Event()
+        # destination and size of the frame on the air, while sending
+        self.sending = False
+        self.sending_to = None
+        self._sending_size = 0
+
+        self.messages_sent = 0
+        self.frames_sent = 0
+        self.dropped = 0
+        self.last_result = ResponseStatusCode.E32_SUCCESS
+
+    def put(self, message, destination=None) -> bool:
+        if len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return False
+        self._pending.append((destination, _to_bytes(message)))
+        self._event.set()
+        return True
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def has_pending(self, destination) -> bool:
+        """True while messages for destination are queued or being sent"""
+        if self.sending and self.sending_to == destination:
+            return True
+        for dest, message in self._pending:
+            if dest == destination:
+                return True
+        return False
+
+    def predict_latency_ms(self, size, destination=None, wake=False) -> int:
+        """ms until a message of `size` bytes put now is sent: the frame on the air, the
+        linger, the frames of the other destinations queued before it, then its own frame
+        (an upper bound, the frame on the air is counted whole)"""
+        latency = self.linger_ms
+        if self.sending:
+            latency += self.lora.predict_send_latency_ms(self._sending_size)
+
+        packed = False
+        seen = []
+        for dest, message in self._pending:
+            if dest == destination:
+                packed = True
+                continue
+            if dest in seen:
+                continue
+            seen.append(dest)
+            woken = self.wake is not None and self.wake.needs_wake(dest)
+            latency += self.lora.predict_send_latency_ms(self._pending_size(dest), woken)
+
+        if packed:
+            # packed with the ones already waiting for the destination
+            size += self._pending_size(destination) + 1
+        return latency + self.lora.predict_send_latency_ms(size, wake)
+
+    def _pending_size(self, destination) -> int:
+        size = 1
+        for dest, message in self._pending:
+            if dest == destination:
+                size += 1 + len(message)
+        return size
+
+    async def _linger(self):
+        destination = self._pending[0][0]
+        t = utime.ticks_ms()
+        while utime.ticks_diff(utime.ticks_ms(), t) < self.linger_ms:
+            if self._pending_size(destination) >= self.max_frame:
+                return
+            await asyncio.sleep_ms(1)
+
+    def _take_batch(self) -> (tuple, list):
+        destination = self._pending[0][0]
+        messages = [message for dest, message in self._pending if dest == destination]
+        frame, count = pack_messages(messages, self.max_frame)
+
+        taken = 0
+        remaining = []
+        for entry in self._pending:
+            if entry[0] == destination and taken < count:
+                taken += 1
+            else:
+                remaining.append(entry)
+        self._pending = remaining
+        return destination, frame, count
+
+    async def flush(self):
+        while self._pending:
+            destination, frame, count = self._take_batch()
+            woken = self.wake is not None and self.wake.needs_wake(destination)
+            self.sending = True
+            self.sending_to = destination
+            self._sending_size = len(frame)
+            if destination is None:
+                code = await self.lora.send_transparent_message(frame)
+            elif woken:
+                code = await self.lora.send_wake_message(destination[0], destination[1], destination[2], frame)
+            else:
+                code = await self.lora.send_fixed_message(destination[0], destination[1], destination[2], frame)
+            self.sending = False
+            if self.wake is not None and code == ResponseStatusCode.E32_SUCCESS:
+                self.wake.sent(destination, woken)
+
+            self.last_result = code
+            if code == ResponseStatusCode.E32_SUCCESS:
+                self.frames_sent += 1
+                self.messages_sent += count
+            else:
+                self.dropped += count
+                logger.error("Send frame of %s messages: %s", count, ResponseStatusCode.get_description(code))
+
+    async def run(self):
+        while True:
+            await self._event.wait()
+            self._event.clear()
+            if not self._pending:
+                continue
+            await self._linger()
+            await self.flush()
@@ -0,0 +1,153 @@
+#############################################################################################
+# Wake on radio for battery powered EBYTE LoRa E32 receivers
+#
+# In MODE_2_POWER_SAVING the module sleeps and listens for a few ms every wireless
+# wake-up time (OPTION.wirelessWakeupTime, 250..2000 ms). A sender in MODE_1_WAKE_UP
+# puts a preamble as long as that time in front of every packet, so the sleeping
+# receiver catches it, outputs the packet on the UART and the MCU wakes up.
+# Sender and receivers must be configured with the same wake-up time.
+#
+# The preamble costs its full length in latency and airtime, so it is only used when
+# the target is asleep:
+#
+#   - PowerSavingReceiver (scoreboard side) goes back to MODE_0_NORMAL when woken,
+#     stays awake `stay_awake_ms` after the last packet for the follow-ups, then
+#     returns to MODE_2_POWER_SAVING
+#   - WakeOnRadioPolicy (gateway side) knows which destinations sleep and, after a
+#     wake message, considers them awake for the same time (minus a margin), so the
+#     follow-ups go out without preamble
+#
+# wor_model.py (host) estimates battery life and latency for every wake-up time.
+#############################################################################################
+
+from lora_e32 import logger
+from lora_e32_operation_constant import ResponseStatusCode, ModeType
+
+import machine
+import utime
+
+STAY_AWAKE_MS = 5000
+# the gateway stops relying on the receiver being awake this much before it sleeps again
+AWAKE_MARGIN_MS = 500
+# sleep slice of the receiver MCU while waiting for a packet in power saving mode
+WAKE_POLL_MS = 10
+
+
+def set_wake_up_time(lora, wake_up_time, permanentConfiguration=True) -> ResponseStatusCode:
+    """Write OPTION.wirelessWakeupTime (a WirelessWakeUpTime code) on a synchronous LoRaE32"""
+    code, configuration = lora.get_configuration()
+    if code != ResponseStatusCode.E32_SUCCESS:
+        return code
+    configuration.OPTION.wirelessWakeupTime = wake_up_time
+    code, configuration = lora.set_configuration(configuration, permanentConfiguration)
+    return code
+
+
+class WakeOnRadioPolicy:
+    def __init__(self, stay_awake_ms=STAY_AWAKE_MS):
+        self.stay_awake_ms = stay_awake_ms
+        # (ADDH, ADDL, CHAN) of the receivers in power saving mode
+        self.sleepy = set()
+        self._awake_until = {}
+
+        self.wake_messages = 0
+
+    def add_sleepy(self, destination):
+        self.sleepy.add(tuple(destination))
+
+    def remove_sleepy(self, destination):
+        self.sleepy.discard(tuple(destination))
+        self._awake_until.pop(tuple(destination), None)
+
+    def needs_wake(self, destination) -> bool:
+        if destination is None:
+            return False
+        destination = tuple(destination)
+        if destination not in self.sleepy:
+            return False
+        until = self._awake_until.get(destination)
+        return until is None or utime.ticks_diff(until, utime.ticks_ms()) <= 0
+
+    def sent(self, destination, woken):
+        """Tell the policy that a message reached `destination` (with a wake preamble or not)"""
+        if destination is None:
+            return
+        destination = tuple(destination)
+        if destination in self.sleepy:
+            if woken:
+                self.wake_messages += 1
+            # every packet received restarts the receiver stay awake time
+            self._awake_until[destination] = utime.ticks_add(utime.ticks_ms(),
+                                                             self.stay_awake_ms - AWAKE_MARGIN_MS)
+
+
+class PowerSavingReceiver:
+    def __init__(self, lora, stay_awake_ms=STAY_AWAKE_MS, lightsleep=False):
+        self.lora = lora
+        self.stay_awake_ms = stay_awake_ms
+        # machine.lightsleep() between polls instead of machine.idle(): less current, but
+        # the UART may lose the first bytes on ports that stop its clock
+        self.lightsleep = lightsleep
+        self._awake_until = None
+
+        self.wakeups = 0
+
+    def sleep(self) -> ResponseStatusCode:
+        self._awake_until = None
+        return self.lora.set_mode(ModeType.MODE_2_POWER_SAVING)
+
+    def is_awake(self) -> bool:
+        return self.lora.mode == ModeType.MODE_0_NORMAL
+
+    def _wait_wake(self, timeout) -> bool:
+        t = utime.ticks_ms()
+        while not self.lora.available():
+            if timeout is not None and utime.ticks_diff(utime.ticks_ms(), t) >= timeout:
+                return False
+            if self.lightsleep:
+                machine.lightsleep(WAKE_POLL_MS)
+            else:
+                machine.idle()
+        return True
+
+    def receive(self, timeout=None) -> (ResponseStatusCode, any):
+        """Wait for a message (timeout=None waits forever), handling sleep and wake up"""
+        lora = self.lora
+        if lora.mode != ModeType.MODE_0_NORMAL and lora.mode != ModeType.MODE_2_POWER_SAVING:
+            code = self.sleep()
+            if code != ResponseStatusCode.E32_SUCCESS:
+                return code, None
+
+        t = utime.ticks_ms()
+        if lora.mode == ModeType.MODE_0_NORMAL:
+            awake_left = 0
+            if self._awake_until is not None:
+                awake_left = max(utime.ticks_diff(self._awake_until, t), 0)
+            wait = awake_left if timeout is None else min(awake_left, timeout)
+            if wait > 0 and self._wait_wake(wait):
+                return self._received()
+            if timeout is not None and timeout <= awake_left:
+                return ResponseStatusCode.ERR_E32_TIMEOUT, None
+            # nothing for stay_awake_ms: back to sleep
+            code = self.sleep()
+            if code != ResponseStatusCode.E32_SUCCESS:
+                return code, None
+
+        if timeout is not None:
+            timeout = max(timeout - utime.ticks_diff(utime.ticks_ms(), t), 0)
+        if not self._wait_wake(timeout):
+            return ResponseStatusCode.ERR_E32_TIMEOUT, None
+        self.wakeups += 1
+        logger.debug("Woken up by radio")
+        return self._received()
+
+    def _received(self) -> (ResponseStatusCode, any):
+        lora = self.lora
+        code, data = lora.receive_frame()
+        if code == ResponseStatusCode.E32_SUCCESS:
+            data = bytes(data)
+            if lora.mode != ModeType.MODE_0_NORMAL:
+                # follow-ups are sent without preamble while we are awake
+                lora.set_mode(ModeType.MODE_0_NORMAL)
+        self._awake_until = utime.ticks_add(utime.ticks_ms(), self.stay_awake_ms)
+        return code, data
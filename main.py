@@ -2,12 +2,20 @@ import sys
 
 import aioble
 import bluetooth
-from lora_e32 import Logger, LoRaE32, Configuration
+from lora_e32_async import AsyncLoRaE32
+from lora_e32_constants import FixedTransmission
+from lora_e32_routing import RoutingTable
+from lora_e32_dedup import DedupCache, split_message_id
+from lora_e32_mux import LoRaMux
+from lora_e32_txqueue import unpack_frame
+from lora_e32_wor import WakeOnRadioPolicy
 from lora_e32_operation_constant import ResponseStatusCode
+import machine
 from machine import ADC, Pin, UART
 import uasyncio as asyncio
 from micropython import const
 import struct
+import utime
 
 _FLAG_READ = const(0x0002)
 _FLAG_WRITE_NO_RESPONSE = const(0x0004)
@@ -38,11 +46,69 @@ BLE_VERSION_ID = const(0x2A28)
 
 led = Pin("LED", Pin.OUT)
 
-# Initialize the LoRaE32 module
+# Initialize the LoRaE32 module: traffic runs at LORA_UART_BAUDRATE (written in the module
+# at boot if needed), the driver drops to 9600 by itself for the program mode commands
+LORA_UART_BAUDRATE = 115200
 uart1 = UART(1, baudrate=9600)
-lora = LoRaE32('433T20D', uart1, m0_pin=21, m1_pin=22)
-code = lora.begin()
-print("Initialization: {}", ResponseStatusCode.get_description(code))
+lora = AsyncLoRaE32('433T20D', uart1, m0_pin=21, m1_pin=22, uart_baudrate=LORA_UART_BAUDRATE)
+# Optional second module on UART0, True when it is fitted: two scoreboards are then
+# updated in parallel. It is only used if it answers at boot. Wiring (Pico GP pins):
+#   E32 RXD <- GP0 (UART0 TX), E32 TXD -> GP1 (UART0 RX), M0 <- GP18, M1 <- GP19,
+#   AUX not connected (like the first module: the driver waits the worst case instead)
+LORA_SECOND_MODULE = False
+radios = [lora]
+if LORA_SECOND_MODULE:
+    uart0 = UART(0, baudrate=9600)
+    radios.append(AsyncLoRaE32('433T20D', uart0, m0_pin=18, m1_pin=19, uart_baudrate=LORA_UART_BAUDRATE))
+# (ADDH, ADDL, CHAN) of the battery scoreboards sleeping in power saving mode (MODE_2):
+# they get the wake-up preamble, use wor_model.py to choose the wake-up time
+WOR_DESTINATIONS = []
+wor = WakeOnRadioPolicy()
+for destination in WOR_DESTINATIONS:
+    wor.add_sleepy(destination)
+# packs bursts of BLE writes into as few LoRa packets as possible and spreads them on
+# the modules (see lora_e32_mux)
+mux = LoRaMux(linger_ms=30, wake=wor)
+
+# phones write an update again after a connection hiccup: a message seen again within
+# DEDUP_WINDOW_MS (or with an ID already seen, "#<id>:<message>") is not sent again
+DEDUP_SIZE = 32
+DEDUP_WINDOW_MS = 2_000
+dedup = DedupCache(DEDUP_SIZE, DEDUP_WINDOW_MS)
+
+# Fraction of time the radio may transmit (e.g. 0.1 for 10% in the EU 433 MHz band),
+# None for no limit
+DUTY_CYCLE = None
+# When an update will go out later than this, the phone is told when
+ETA_NOTIFY_MS = 1_000
+
+# project number / scoreboard id -> (ADDH, ADDL, CHAN), see lora_e32_routing
+# (loaded by settings_task)
+routes = RoutingTable()
+# channel of the gateway, read at boot: projects without a route are broadcast on it
+lora_channel = 23
+
+# LoRa -> BLE: packets from the scoreboards (ACKs, status) waiting to be notified.
+# When the queue is full the oldest one is dropped and counted.
+DOWNLINK_QUEUE_SIZE = 16
+DOWNLINK_POLL_MS = 10
+downlink = []
+downlink_event = asyncio.Event()
+downlink_dropped = 0
+
+# Staged boot: advertising starts first, the settings (project.txt, routes) and the radio
+# come up in background tasks and raise these flags. Messages written by the phone
+# before the radio is ready wait in early_writes (oldest dropped when full).
+settings_ready = asyncio.Event()
+radio_ready = asyncio.Event()
+EARLY_WRITES_SIZE = 16
+# (Message, message_id), a message that isn't sent is forgotten by dedup: its retry goes out
+early_writes = []
+early_writes_dropped = 0
+# advertising restarts this often until the settings are loaded, so that the name
+# carries the project number read from project.txt
+ADV_RESTART_MS = 500
+first_advertisement_ms = None
 
 _DEVICE_INFO_UUID = bluetooth.UUID(0x180A) # Device Information
 _GENERIC = bluetooth.UUID(0x1848)
@@ -54,6 +120,9 @@ _PROJECT_UUID = bluetooth.UUID("116459e5-ad1a-4d85-9b9d-fc2e6cd6b3e0")
 
 _PROJ_NUM_UUID = bluetooth.UUID("116459e6-ad1a-4d85-9b9d-fc2e6cd6b3e0")
 
+# write a JSON route update, e.g. {"230411":[0,1,23]}
+_ROUTES_UUID = bluetooth.UUID("116459e7-ad1a-4d85-9b9d-fc2e6cd6b3e0")
+
 #this is the generic Nordic Uart Service UUID, it supports two characteristics - TX and RX
 _UART_UUID = bluetooth.UUID("6E400001-B5A3-F393-E0A9-E50E24DCCA9E")
 
@@ -80,23 +149,23 @@ connection = None
 Project = "000000"
 
 
-readproj = False
-while (readproj == False):
+def load_project():
+    """ Read the project number from project.txt, create the file if missing """
     try:
         f1 = open('project.txt','r')
-        Project = f1.read()
-        readproj = True
-    except:              #I think this means there is no such file
+        project = f1.read()
+        f1.close()
+    except OSError:              # no such file
+        project = '000000'
         f1 = open('project.txt','w')
-        f1.write('000000')
+        f1.write(project)
         f1.close()
-    
-
-print (f'Project No: {Project}')
+    return project
 
 proj_characteristic = aioble.Characteristic(project_info, _PROJ_NUM_UUID, read=True, write=True, capture=True, initial=Project)
 
-print (f'Project Char: {proj_characteristic}')
+routes_characteristic = aioble.Characteristic(project_info, _ROUTES_UUID, read=True, write=True, capture=True,
+                                              initial="0 routes")
 # Create Characteristic for device info
 aioble.Characteristic(device_info, bluetooth.UUID(MANUFACTURER_ID), read=True, initial=Company)
 aioble.Characteristic(device_info, bluetooth.UUID(MODEL_NUMBER_ID), read=True, initial=Model)
@@ -127,9 +196,9 @@ battery_info = aioble.Service(_BATTERY_UUID)
 
 batt_level = aioble.Characteristic(battery_info, _BATTERY, read=True, notify=True)
 
-print("Registering services")
-
-aioble.register_services(uart_service, device_info, project_info, battery_info)
+def register_services():
+    print("Registering services")
+    aioble.register_services(uart_service, device_info, project_info, battery_info)
 
 connected = False
 
@@ -144,15 +213,24 @@ def measure_vsys():
 async def peripheral_task():
     """ Task to handle peripheral """
     print('peripheral task started')
-    global connected, connection, message, Project
+    global connected, connection, message, Project, first_advertisement_ms
     while True:
         connected = False
-        async with await aioble.advertise(
-            ADV_INTERVAL_MS,
-            name="AusSport Sboard P" + Project,
-            appearance=_BLE_APPEARANCE_GENERIC_REMOTE_CONTROL,
-            services=[_UART_UUID]
-        ) as connection:
+        if first_advertisement_ms is None:
+            first_advertisement_ms = utime.ticks_ms()
+            print(f"First advertisement {first_advertisement_ms} ms after reset")
+        try:
+            connection = await aioble.advertise(
+                ADV_INTERVAL_MS,
+                name="AusSport Sboard P" + Project,
+                appearance=_BLE_APPEARANCE_GENERIC_REMOTE_CONTROL,
+                services=[_UART_UUID],
+                timeout_ms=None if settings_ready.is_set() else ADV_RESTART_MS
+            )
+        except asyncio.TimeoutError:
+            # again with the project number, once loaded
+            continue
+        async with connection:
             print("Connection from, ", connection.device)
             connected = True
             print("connected")
@@ -169,6 +247,8 @@ async def proj_task():
     print('proj task started')
     global read_char
     read_char = False
+    # a write before the settings are loaded would be overwritten by project.txt
+    await settings_ready.wait()
     while True:
         if connected == True:
            # print("Connected in RX")
@@ -217,6 +297,25 @@ async def proj_task():
 
 
 
+async def routes_task():
+    print('routes task started')
+    await settings_ready.wait()
+    while True:
+        connection, rec_val = await routes_characteristic.written()
+        try:
+            if routes.update(rec_val.decode('ascii')):
+                update_str = f"Routes updated: {len(routes)} routes"
+            else:
+                update_str = "Invalid route update"
+            print (update_str)
+            routes_characteristic.write(f"{len(routes)} routes".encode('ascii'))
+            if connected:
+                tx_characteristic.write(update_str.encode('ascii'), send_update=True)
+        except (UnicodeError, ValueError) as e:
+            # a bad write from the phone must not stop the route updates
+            print(f'Invalid route update: {e}')
+
+
 async def rx_task():
     global connected, connection
     print('rx task started')
@@ -243,9 +342,16 @@ async def rx_task():
                     Message = rec_val.decode('ascii')
                     print (f"Received: {Message}")
                     read_char = True
-                    code = lora.send_transparent_message(Message)
-                    print(f"Send Radio message: {Message}", ResponseStatusCode.get_description(code))
-                    tx_characteristic.write(Message.encode('ascii'), send_update=True)
+                    message_id, Message = split_message_id(Message)
+                    if dedup.seen(Message, message_id):
+                        print(f"Duplicate not sent: {Message}", dedup.hits, dedup.misses)
+                        tx_characteristic.write(Message.encode('ascii'), send_update=True)
+                    elif radio_ready.is_set():
+                        if not forward(Message):
+                            # its retry must go out
+                            dedup.forget(Message, message_id)
+                    else:
+                        queue_early_write(Message, message_id)
                     await asyncio.sleep_ms(50)
                     
                         
@@ -266,6 +372,134 @@ async def rx_task():
                     return
             await asyncio.sleep_ms(1)
             
+def forward(Message):
+    """ Queue a message from the phone for the scoreboard of the project, False if dropped """
+    destination = routes.resolve(Project)
+    if destination is None:
+        # no route: every scoreboard on the channel gets it, as in transparent mode
+        destination = (0xFF, 0xFF, lora_channel)
+    eta = mux.predict_send_latency_ms(len(Message), destination, wor.needs_wake(destination))
+    queued = mux.put(Message, destination)
+    print(f"Queued Radio message: {Message}", queued, mux.pending(), f"ETA {eta} ms")
+    tx_characteristic.write(Message.encode('ascii'), send_update=True)
+    if eta > ETA_NOTIFY_MS:
+        tx_characteristic.write(f"ETA {eta} ms".encode('ascii'), send_update=True)
+    return queued
+
+def queue_early_write(Message, message_id=None):
+    """ Keep a message written before the radio is ready, sent by radio_task """
+    global early_writes_dropped
+    if len(early_writes) >= EARLY_WRITES_SIZE:
+        dropped, dropped_id = early_writes.pop(0)
+        dedup.forget(dropped, dropped_id)
+        early_writes_dropped += 1
+        print(f"Early write queue full, dropped {early_writes_dropped}")
+    early_writes.append((Message, message_id))
+    print(f"Radio not ready, message kept: {Message}", len(early_writes))
+    tx_characteristic.write(Message.encode('ascii'), send_update=True)
+
+async def settings_task():
+    """ Task to load the settings from the flash once advertising runs """
+    global Project
+    Project = load_project()
+    print (f'Project No: {Project}')
+    proj_characteristic.write(Project.encode('ascii'))
+    routes.load()
+    routes_characteristic.write(f"{len(routes)} routes".encode('ascii'))
+    settings_ready.set()
+    print(f"Settings ready {utime.ticks_ms()} ms after reset")
+
+async def boot_radio(module):
+    """ Start a LoRa module, return the channel read from it (None if it didn't answer) """
+    channel = None
+    # the UART rate is checked in the session below: one program mode round trip at boot
+    code = await module.begin(sync_UART_baudrate=False)
+    print("Initialization: {}", ResponseStatusCode.get_description(code))
+    module.set_duty_cycle(DUTY_CYCLE)
+
+    # one program mode round trip for all the boot time maintenance commands
+    async with module.program_session() as radio:
+        code, information = await radio.get_module_information()
+        print("Module information: {}", ResponseStatusCode.get_description(code))
+        code = await radio.sync_UART_baudrate()
+        print("UART rate: {}", ResponseStatusCode.get_description(code))
+        # read from the module by sync_UART_baudrate
+        code, configuration = await radio.get_configuration()
+        print("Retrieve configuration: {}", ResponseStatusCode.get_description(code))
+        if code == ResponseStatusCode.E32_SUCCESS:
+            channel = configuration.CHAN
+            # every packet is addressed: scoreboards only wake for their own traffic
+            if configuration.OPTION.fixedTransmission != FixedTransmission.FIXED_TRANSMISSION:
+                configuration.OPTION.fixedTransmission = FixedTransmission.FIXED_TRANSMISSION
+                code, configuration = await radio.set_configuration(configuration)
+                print("Fixed transmission: {}", ResponseStatusCode.get_description(code))
+    return channel
+
+async def radio_task():
+    """ Task to bring up the LoRa modules, then run the radio tasks """
+    global lora_channel
+    # begin and the program session yield while waiting for the modules, so BLE keeps
+    # advertising and the modules (one lock each) come up side by side
+    channels = await asyncio.gather(*[boot_radio(module) for module in radios])
+    if channels[0] is not None:
+        lora_channel = channels[0]
+    # the first module is used even if it didn't answer, as always
+    mux.add(lora, lora_channel)
+    for module, channel in zip(radios[1:], channels[1:]):
+        if channel is None:
+            print("Second LoRa module not answering, not used")
+            continue
+        mux.add(module, channel)
+
+    # the routes are needed to address the early writes
+    await settings_ready.wait()
+    radio_ready.set()
+    print(f"Radio ready {utime.ticks_ms()} ms after reset")
+    while early_writes:
+        Message, message_id = early_writes.pop(0)
+        if not forward(Message):
+            dedup.forget(Message, message_id)
+
+    await asyncio.gather(mux.run(), *[lora_rx_task(lane.lora) for lane in mux.lanes])
+
+async def lora_rx_task(module):
+    """ Task to drain the UART of a LoRa module into the downlink queue """
+    global downlink_dropped
+    print('lora rx task started')
+    while True:
+        if not module.available():
+            await asyncio.sleep_ms(DOWNLINK_POLL_MS)
+            continue
+        code, data = await module.receive_frame()
+        if code != ResponseStatusCode.E32_SUCCESS:
+            print("LoRa receive: {}".format(ResponseStatusCode.get_description(code)))
+            continue
+        # unpack_frame copies out of the receive buffer (and splits packed frames)
+        for message in unpack_frame(data):
+            if len(downlink) >= DOWNLINK_QUEUE_SIZE:
+                downlink.pop(0)
+                downlink_dropped += 1
+                print(f"Downlink queue full, dropped {downlink_dropped}")
+            downlink.append(message)
+        downlink_event.set()
+
+
+async def downlink_task():
+    """ Task to notify the received LoRa packets to the phone """
+    print('downlink task started')
+    while True:
+        await downlink_event.wait()
+        downlink_event.clear()
+        # kept while nobody is connected, the queue bound limits how many
+        while downlink and connected:
+            message = downlink.pop(0)
+            print(f"Downlink: {message}")
+            tx_characteristic.write(message, send_update=True)
+            await asyncio.sleep_ms(1)
+        if downlink and not connected:
+            await asyncio.sleep_ms(100)
+            downlink_event.set()
+
     # Helper to encode the voltage characteristic encoding (sint16).
 def _encode_voltage(vc):
     return struct.pack("<h", int(vc))
@@ -318,12 +552,17 @@ async def blink_task():
         await asyncio.sleep_ms(blink)
 
 async def main():
-
+    # GATT first: the board is visible to the phones before the radio and the settings
+    register_services()
     tasks = [
         asyncio.create_task(peripheral_task()),
+        asyncio.create_task(settings_task()),
+        asyncio.create_task(radio_task()),
         asyncio.create_task(blink_task()),
         asyncio.create_task(rx_task()),
+        asyncio.create_task(downlink_task()),
         asyncio.create_task(proj_task()),
+        asyncio.create_task(routes_task()),
         asyncio.create_task(read_voltage())
     ]
     await asyncio.gather(*tasks)
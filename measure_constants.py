@@ -0,0 +1,68 @@
+# Description:
+# Import cost of lora_e32_constants: time and heap (gc.mem_free() delta) taken by the
+# import, then by the first get_description() calls (they load the description
+# tables of lora_e32_descriptions, production code never does).
+# Run it on the Pico right after a reset, once per version to compare; it runs on the
+# PC too (CPython), where tracemalloc replaces gc.mem_free().
+
+import gc
+import sys
+
+try:
+    from utime import ticks_us, ticks_diff
+except ImportError:
+    import time
+
+    def ticks_us():
+        return int(time.perf_counter() * 1000000)
+
+    def ticks_diff(ticks1, ticks2):
+        return ticks1 - ticks2
+
+try:
+    mem_free = gc.mem_free
+except AttributeError:
+    import tracemalloc
+    tracemalloc.start()
+
+    def mem_free():
+        return -tracemalloc.get_traced_memory()[0]
+
+# imported by lora_e32_constants, not part of the measure
+import lora_e32_logging
+
+
+def measure(name, fn):
+    gc.collect()
+    free = mem_free()
+    t = ticks_us()
+    fn()
+    elapsed = ticks_diff(ticks_us(), t)
+    gc.collect()
+    used = free - mem_free()
+    print("{:<24} {:>8} us {:>8} bytes".format(name, elapsed, used))
+    return elapsed, used
+
+
+def import_constants():
+    import lora_e32_constants
+
+
+def describe_all():
+    from lora_e32_constants import UARTParity, UARTBaudRate, AirDataRate, FixedTransmission, IODriveMode, \
+        WirelessWakeUpTime, ForwardErrorCorrectionSwitch, TransmissionPower
+    for value in range(8):
+        for constant in (UARTParity, UARTBaudRate, AirDataRate, FixedTransmission, IODriveMode,
+                         WirelessWakeUpTime, ForwardErrorCorrectionSwitch):
+            constant.get_description(value)
+        for model in ('433T20D', '433T27D', '433T30D', '433T33D', '433T37D'):
+            TransmissionPower(model).get_transmission_power_description(value)
+
+
+for module in ('lora_e32_constants', 'lora_e32_descriptions'):
+    if module in sys.modules:
+        print("{} already imported: reset the board first".format(module))
+
+measure("import", import_constants)
+measure("first get_description", describe_all)
+measure("next get_description", describe_all)
@@ -0,0 +1,309 @@
+# Description:
+# Fleet provisioning of the E32 modules of a site. Run it on the PC (CPython) with the
+# modules connected through a USB-serial adapter, M0 and M1 high (program mode):
+#
+#   python provision.py site.json check
+#   python provision.py site.json images --out images.json
+#   python provision.py site.json write --port /dev/ttyUSB0
+#   python provision.py site.json verify --port /dev/ttyUSB0 --node court-1
+#
+# The site description gives the model and the defaults, every node overrides them:
+#
+#   {"model": "433T20D",
+#    "defaults": {"channel": 23, "air_data_rate": 2400, "power_dbm": 20, "fixed": true},
+#    "nodes": [{"name": "gateway", "address": "0x0001"},
+#              {"name": "court-1", "address": 2, "power_dbm": 14, "port": "/dev/ttyUSB1"}]}
+#
+# Node fields: name, address (0..0xFFFF), channel (0..31), air_data_rate (bps),
+# power_dbm, uart_baudrate, parity (8N1/8O1/8E1), fec, fixed, wake_up_ms, push_pull,
+# port. The whole site is validated before anything is written (power levels of the
+# model, duplicate addresses, nodes of a channel on different air data rates), then
+# every image is built with Configuration.to_bytes() and written with C0 (saved),
+# read back with C1 C1 C1 and compared. A node with its own "port" is written there,
+# the others one after the other on --port, swapping the module when asked.
+# Writing needs pyserial (pip install pyserial); check and images don't.
+
+import argparse
+import json
+import sys
+import time
+
+import e32emu
+
+# lora_e32 imports machine, utime, ...: the fake ones of the emulator are enough to
+# build configurations on the PC
+e32emu.install()
+
+from lora_e32 import Configuration
+from lora_e32_constants import AirDataRate, UARTBaudRate, UARTParity, TransmissionPower, \
+    WirelessWakeUpTime, OperatingFrequency
+from lora_e32_operation_constant import ProgramCommand
+
+try:
+    import serial
+except ImportError:
+    serial = None
+
+MAX_CHANNEL = 31
+BROADCAST = 0xFFFF
+PROGRAM_BAUDRATE = 9600
+# the module needs a few ms per command, the flash write (C0) a bit more
+WRITE_SETTLE_S = 0.1
+READ_TIMEOUT_S = 1
+
+PARITIES = {'8N1': UARTParity.MODE_00_8N1, '8O1': UARTParity.MODE_01_8O1, '8E1': UARTParity.MODE_10_8E1}
+DEFAULTS = {
+    'channel': 23,
+    'air_data_rate': 2400,
+    'uart_baudrate': 9600,
+    'parity': '8N1',
+    'fec': True,
+    'fixed': False,
+    'wake_up_ms': 250,
+    'push_pull': True,
+}
+
+
+class SiteError(Exception):
+    pass
+
+
+def _number(value):
+    if isinstance(value, str):
+        return int(value, 0)
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError(value)
+    return value
+
+
+def _lookup(table, value, what):
+    if value not in table:
+        raise ValueError("{} {} not in {}".format(what, value, sorted(table)))
+    return table[value]
+
+
+def power_levels(model) -> dict:
+    """dBm -> OPTION.transmissionPower of the power class of the model"""
+    power_class = TransmissionPower(model).get_transmission_power()
+    if isinstance(power_class, str):
+        raise SiteError("model {}: {}".format(model, power_class))
+    levels = {}
+    for code in range(4):
+        levels.setdefault(int(power_class.get_description(code)[:2]), code)
+    return levels
+
+
+def build_configuration(model, settings, levels) -> Configuration:
+    """Configuration of a node from its settings (defaults applied), ValueError if invalid"""
+    address = _number(settings['address'])
+    if not 0 <= address <= BROADCAST:
+        raise ValueError("address {} out of 0..0xFFFF".format(address))
+    channel = _number(settings['channel'])
+    if not 0 <= channel <= MAX_CHANNEL:
+        raise ValueError("channel {} out of 0..{}".format(channel, MAX_CHANNEL))
+
+    configuration = Configuration(model)
+    configuration.HEAD = ProgramCommand.WRITE_CFG_PWR_DWN_SAVE
+    configuration.ADDH = address >> 8
+    configuration.ADDL = address & 0xFF
+    configuration.CHAN = channel
+
+    air_data_rates = {AirDataRate.get_bits_per_second(code): code for code in
+                      range(AirDataRate.AIR_DATA_RATE_101_192, -1, -1)}
+    configuration.SPED.airDataRate = _lookup(air_data_rates, _number(settings['air_data_rate']), 'air_data_rate')
+    try:
+        configuration.SPED.uartBaudRate = UARTBaudRate.from_bps(_number(settings['uart_baudrate']))
+    except ValueError:
+        raise ValueError("uart_baudrate {} not supported".format(settings['uart_baudrate']))
+    configuration.SPED.uartParity = _lookup(PARITIES, settings['parity'], 'parity')
+
+    power = settings.get('power_dbm')
+    if power is None:
+        power = max(levels)
+    configuration.OPTION.transmissionPower = _lookup(levels, _number(power), 'power_dbm')
+    configuration.OPTION.fec = 1 if settings['fec'] else 0
+    configuration.OPTION.fixedTransmission = 1 if settings['fixed'] else 0
+    configuration.OPTION.ioDriveMode = 1 if settings['push_pull'] else 0
+    wake_up_times = {WirelessWakeUpTime.get_milliseconds(code): code for code in
+                     range(WirelessWakeUpTime.WAKE_UP_2000 + 1)}
+    configuration.OPTION.wirelessWakeupTime = _lookup(wake_up_times, _number(settings['wake_up_ms']), 'wake_up_ms')
+    return configuration
+
+
+def load_site(path):
+    """Return (model, [(node, Configuration)]), SiteError with every problem found"""
+    with open(path) as f:
+        site = json.load(f)
+
+    model = site.get('model')
+    if not isinstance(model, str) or len(model) != 7:
+        raise SiteError("model: expected a string like '433T20D', got {!r}".format(model))
+    try:
+        if str(int(model[:3])) not in OperatingFrequency.get_frequency_dict():
+            raise SiteError("model {}: unknown frequency".format(model))
+        levels = power_levels(model)
+    except ValueError:
+        raise SiteError("model: expected a string like '433T20D', got {!r}".format(model))
+
+    defaults = dict(DEFAULTS)
+    defaults.update(site.get('defaults', {}))
+
+    errors = []
+    nodes = []
+    names = set()
+    addresses = {}
+    channel_rates = {}
+    for index, node in enumerate(site.get('nodes', [])):
+        name = node.get('name', '#{}'.format(index))
+        node = dict(node, name=name)
+        settings = dict(defaults)
+        settings.update(node)
+        if name in names:
+            errors.append("{}: duplicate name".format(name))
+        names.add(name)
+        if 'address' not in settings:
+            errors.append("{}: no address".format(name))
+            continue
+        try:
+            configuration = build_configuration(model, settings, levels)
+        except (ValueError, TypeError) as e:
+            errors.append("{}: {}".format(name, e))
+            continue
+
+        address = (configuration.ADDH << 8) | configuration.ADDL
+        key = (address, configuration.CHAN)
+        if address != BROADCAST and key in addresses:
+            errors.append("{}: address 0x{:04X} channel {} already used by {}".format(
+                name, address, configuration.CHAN, addresses[key]))
+        addresses[key] = name
+        # nodes of a channel only hear each other at the same air data rate
+        rate = channel_rates.setdefault(configuration.CHAN, (configuration.SPED.airDataRate, name))
+        if rate[0] != configuration.SPED.airDataRate:
+            errors.append("{}: air data rate differs from {} on channel {}".format(name, rate[1], configuration.CHAN))
+        nodes.append((node, configuration))
+
+    if not nodes and not errors:
+        errors.append("no nodes")
+    if errors:
+        raise SiteError("\n".join(errors))
+    return model, nodes
+
+
+class SerialModule:
+    """E32 in program mode on a serial port (9600 8N1)"""
+
+    def __init__(self, port):
+        if serial is None:
+            raise SiteError("pyserial is needed to write the modules: pip install pyserial")
+        self.port = serial.Serial(port, PROGRAM_BAUDRATE, bytesize=8, parity='N', stopbits=1,
+                                  timeout=READ_TIMEOUT_S)
+
+    def close(self):
+        self.port.close()
+
+    def _command(self, data, size) -> bytes:
+        self.port.reset_input_buffer()
+        self.port.write(data)
+        self.port.flush()
+        return self.port.read(size)
+
+    def read_configuration(self) -> bytes:
+        return self._command(bytes([ProgramCommand.READ_CONFIGURATION] * 3), 6)
+
+    def write_configuration(self, image):
+        # the module answers with the parameters, the readback is what counts
+        self._command(image, 6)
+        time.sleep(WRITE_SETTLE_S)
+
+
+def provision(module, configuration, write) -> str:
+    """Write (optionally) and read back one node, return None or the error"""
+    image = configuration.to_bytes()
+    if write:
+        module.write_configuration(image)
+    readback = module.read_configuration()
+    if len(readback) != 6:
+        return "no answer ({} bytes), is the module in program mode?".format(len(readback))
+    if readback[1:] != image[1:]:
+        return "readback {} != {}".format(readback.hex(), image.hex())
+    return None
+
+
+def run_nodes(nodes, port, write) -> int:
+    failed = 0
+    shared = None
+    try:
+        for node, configuration in nodes:
+            name = node['name']
+            own_port = node.get('port')
+            if own_port is None:
+                if port is None:
+                    print("{}: no port (--port or \"port\" in the node)".format(name))
+                    failed += 1
+                    continue
+                if shared is not None:
+                    input("Connect {} on {} and press Enter ".format(name, port))
+                else:
+                    shared = SerialModule(port)
+                module = shared
+            else:
+                module = SerialModule(own_port)
+
+            try:
+                error = provision(module, configuration, write)
+            finally:
+                if module is not shared:
+                    module.close()
+            print("{:<20} {} {}".format(name, configuration.to_bytes().hex(), error or 'OK'))
+            if error:
+                failed += 1
+    finally:
+        if shared is not None:
+            shared.close()
+    print("{} of {} nodes {}".format(len(nodes) - failed, len(nodes), 'written' if write else 'verified'))
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Provision the E32 modules of a site")
+    parser.add_argument('site', help='site description (JSON)')
+    parser.add_argument('command', choices=('check', 'images', 'write', 'verify'))
+    parser.add_argument('--port', help='serial port of the adapter for the nodes without "port"')
+    parser.add_argument('--node', action='append', help='only these nodes (repeatable)')
+    parser.add_argument('--out', help='images: write {name: hex} to this JSON file')
+    args = parser.parse_args()
+
+    try:
+        model, nodes = load_site(args.site)
+    except SiteError as e:
+        print(e)
+        sys.exit(2)
+    if args.node:
+        unknown = set(args.node) - {node['name'] for node, configuration in nodes}
+        if unknown:
+            print("unknown nodes: {}".format(', '.join(sorted(unknown))))
+            sys.exit(2)
+        nodes = [(node, configuration) for node, configuration in nodes if node['name'] in args.node]
+
+    if args.command == 'check':
+        print("{}: {} nodes OK".format(model, len(nodes)))
+    elif args.command == 'images':
+        images = {node['name']: configuration.to_bytes().hex() for node, configuration in nodes}
+        if args.out:
+            with open(args.out, 'w') as f:
+                json.dump(images, f, indent=2)
+        else:
+            for name, image in images.items():
+                print("{:<20} {}".format(name, image))
+    else:
+        try:
+            failed = run_nodes(nodes, args.port, args.command == 'write')
+        except SiteError as e:
+            print(e)
+            sys.exit(2)
+        if failed:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
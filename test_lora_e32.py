@@ -0,0 +1,227 @@
+# Description:
+# Tests of the LoRaE32 driver against the e32emu emulator, run them on the PC:
+#
+#   python -m pytest test_lora_e32*.py
+
+import pytest
+import time
+
+import e32emu
+
+board = e32emu.install()
+
+from machine import UART
+from lora_e32 import LoRaE32
+from lora_e32_fragment import fragment_message
+from lora_e32_operation_constant import ResponseStatusCode
+from lora_e32_adapt import LinkAdaptationController
+from lora_e32_constants import AirDataRate
+from lora_e32_reliable import ReliableLink
+
+# fixed transmission, ADDL 1 and 2 on channel 0x17
+FIXED_CONFIGURATION_1 = b'\xc0\x00\x01\x1a\x17\xc4'
+FIXED_CONFIGURATION_2 = b'\xc0\x00\x02\x1a\x17\xc4'
+
+
+def make_module(configuration=e32emu.DEFAULT_CONFIGURATION, peer_configuration=e32emu.DEFAULT_CONFIGURATION):
+    board.modules[:] = []
+    board.uart_rx.clear()
+    air = e32emu.Air()
+    module = e32emu.E32Module(board, 1, m0_pin=21, m1_pin=22, aux_pin=15, configuration=configuration, air=air)
+    peer = e32emu.E32Module(board, 0, m0_pin=2, m1_pin=3, aux_pin=4, configuration=peer_configuration, air=air)
+    return module, peer
+
+
+@pytest.fixture
+def radio():
+    """A started LoRaE32 on UART1 with its emulated module"""
+    module, peer = make_module()
+    lora = LoRaE32('433T20D', UART(1), aux_pin=15, m0_pin=21, m1_pin=22)
+    assert lora.begin() == ResponseStatusCode.E32_SUCCESS
+    return lora, module
+
+
+def test_begin_brings_a_module_moved_to_115200_back_to_9600():
+    module, peer = make_module(b'\xc0\x00\x00\x3a\x17\x44')
+    lora = LoRaE32('433T20D', UART(1), aux_pin=15, m0_pin=21, m1_pin=22)
+    assert lora.begin() == ResponseStatusCode.E32_SUCCESS
+    assert module.uart_baudrate == 9600
+    assert lora.send_transparent_message('hello') == ResponseStatusCode.E32_SUCCESS
+    time.sleep(0.1)
+    assert module.framing_errors == 0
+    assert [packet.payload for packet in peer.received] == [b'hello']
+
+
+def test_baud_rate_sync_in_the_boot_program_session(monkeypatch):
+    module, peer = make_module(b'\xc0\x00\x00\x3a\x17\x44')
+    lora = LoRaE32('433T20D', UART(1), aux_pin=15, m0_pin=21, m1_pin=22)
+    assert lora.begin(sync_UART_baudrate=False) == ResponseStatusCode.E32_SUCCESS
+
+    modes = []
+    set_mode = lora.set_mode
+    monkeypatch.setattr(lora, 'set_mode', lambda mode: modes.append(mode) or set_mode(mode))
+    with lora.program_session():
+        assert lora.sync_UART_baudrate() == ResponseStatusCode.E32_SUCCESS
+        code, configuration = lora.get_configuration()
+        assert code == ResponseStatusCode.E32_SUCCESS
+    assert len(modes) == 2
+    assert module.uart_baudrate == 9600
+    assert configuration.SPED.uartBaudRate == module.config[3] >> 3 & 0x07
+
+
+def test_transient_then_permanent_configuration_is_saved(radio):
+    lora, module = radio
+    assert lora.set_channel(5) == ResponseStatusCode.E32_SUCCESS
+    assert module.config[4] == 5
+    assert module.saved[4] == 0x17
+
+    code, configuration = lora.get_configuration()
+    assert code == ResponseStatusCode.E32_SUCCESS
+    code, configuration = lora.set_configuration(configuration, permanentConfiguration=True)
+    assert code == ResponseStatusCode.E32_SUCCESS
+    assert bytes(module.saved) == bytes(module.config)
+    assert module.saved[4] == 5
+
+
+def test_set_configuration_saves_a_channel_change_by_default(radio):
+    lora, module = radio
+    code, configuration = lora.get_configuration()
+    configuration.CHAN = 6
+    assert lora.set_configuration(configuration)[0] == ResponseStatusCode.E32_SUCCESS
+    assert module.saved[4] == 6
+
+
+def test_short_configuration_write_is_an_error(radio, monkeypatch):
+    lora, module = radio
+    code, configuration = lora.get_configuration()
+    configuration.CHAN = 6
+    monkeypatch.setattr(lora.uart, 'write', lambda data: 3)
+    code, configuration = lora.set_configuration(configuration)
+    assert code == ResponseStatusCode.ERR_E32_DATA_SIZE_NOT_MATCH
+    assert configuration is None
+
+
+def test_unchanged_configuration_is_not_written(radio, monkeypatch):
+    lora, module = radio
+    code, configuration = lora.get_configuration(refresh=True)
+    assert code == ResponseStatusCode.E32_SUCCESS
+
+    written = []
+    write = lora.uart.write
+    monkeypatch.setattr(lora.uart, 'write', lambda data: written.append(bytes(data)) or write(data))
+    code, configuration = lora.set_configuration(configuration, permanentConfiguration=True)
+    assert code == ResponseStatusCode.E32_SUCCESS
+    assert written == []
+
+
+def test_packet_received_before_program_mode_is_kept(radio):
+    lora, module = radio
+    module.inject(b'score 3-1')
+    time.sleep(0.1)
+    assert lora.get_configuration(refresh=True)[0] == ResponseStatusCode.E32_SUCCESS
+    configuration = lora.get_configuration()[1]
+    configuration.CHAN = 4
+    assert lora.set_configuration(configuration)[0] == ResponseStatusCode.E32_SUCCESS
+    assert lora.receive_message() == (ResponseStatusCode.E32_SUCCESS, 'score 3-1')
+
+
+def test_fragments_arriving_during_the_wait_are_reassembled(radio):
+    lora, module = radio
+    message = 'score ' * 20
+    fragments = fragment_message(message.encode('utf-8'), 7)
+    assert len(fragments) == 3
+    # the ring is empty when receive_message starts waiting
+    for i, fragment in enumerate(fragments):
+        module.inject(fragment, at_ms=board.ms() + 200 + 150 * i)
+    assert lora.receive_message(timeout=2000) == (ResponseStatusCode.E32_SUCCESS, message)
+
+
+def test_receive_keeps_the_caller_timeout_on_a_partial_message(radio):
+    lora, module = radio
+    fragments = fragment_message(b'x' * 100, 3)
+    module.inject(fragments[0])
+    time.sleep(0.1)
+
+    t = time.monotonic()
+    code, data = lora.receive_frame(timeout=0)
+    assert time.monotonic() - t < 0.1
+    assert code != ResponseStatusCode.E32_SUCCESS
+    assert lora.reassembler.in_progress() == 1
+
+    module.inject(fragments[1])
+    time.sleep(0.1)
+    assert lora.receive_frame(timeout=1000) == (ResponseStatusCode.E32_SUCCESS, b'x' * 100)
+
+
+def make_link(gateway_adaptation=None, scoreboard_adaptation=None):
+    """ReliableLink on a gateway (UART1, ADDL 1) and on a scoreboard (UART0, ADDL 2)"""
+    module, peer = make_module(FIXED_CONFIGURATION_1, FIXED_CONFIGURATION_2)
+    gateway = LoRaE32('433T20D', UART(1), aux_pin=15, m0_pin=21, m1_pin=22)
+    scoreboard = LoRaE32('433T20D', UART(0), aux_pin=4, m0_pin=2, m1_pin=3)
+    assert gateway.begin() == ResponseStatusCode.E32_SUCCESS
+    assert scoreboard.begin() == ResponseStatusCode.E32_SUCCESS
+    links = []
+    for lora, addl, factory in ((gateway, 1, gateway_adaptation), (scoreboard, 2, scoreboard_adaptation)):
+        adaptation = None
+        if factory is not None:
+            adaptation = factory(lora)
+            assert adaptation.sync() == ResponseStatusCode.E32_SUCCESS
+        links.append(ReliableLink(lora, 0, addl, 0x17, adaptation=adaptation))
+    return module, peer, links[0], links[1]
+
+
+def exchange(sender, receiver, messages, timeout=20):
+    for message in messages:
+        assert sender.send(0, 2, 0x17, message) == ResponseStatusCode.E32_SUCCESS
+    t = time.monotonic()
+    while sender.pending() and time.monotonic() - t < timeout:
+        sender.poll()
+        receiver.poll()
+    assert sender.pending() == 0
+    return [receiver.receive() for message in messages]
+
+
+def poll_for(links, seconds):
+    t = time.monotonic()
+    while time.monotonic() - t < seconds:
+        for link in links:
+            link.poll()
+            link.adaptation.evaluate()
+
+
+def test_reliable_link_delivers_a_burst_in_order():
+    module, peer, sender, receiver = make_link()
+    messages = [b'score %d' % i for i in range(6)]
+    # the window is sent in one poll: the scoreboard reads the packets in one chunk
+    assert exchange(sender, receiver, messages) == [((0, 1, 0x17), message) for message in messages]
+    assert sender.stats((0, 2, 0x17)).failed == 0
+
+
+def test_rate_change_is_followed_by_the_peer():
+    module, peer, sender, receiver = make_link(
+        lambda lora: LinkAdaptationController(lora, window=4, hold_windows=1, adapt_power=False),
+        lambda lora: LinkAdaptationController(lora))
+    messages = [b'score %d' % i for i in range(4)]
+    exchange(sender, receiver, messages)
+    assert sender.adaptation.evaluate() == ResponseStatusCode.E32_SUCCESS
+    poll_for([sender, receiver], 1)
+
+    assert module.air_data_rate == peer.air_data_rate == AirDataRate.AIR_DATA_RATE_011_48
+    assert sender.adaptation.heard() is False and receiver.adaptation.heard() is False
+    assert exchange(sender, receiver, messages) == [((0, 1, 0x17), message) for message in messages]
+
+
+def test_rate_change_is_undone_when_the_write_fails(monkeypatch):
+    module, peer, sender, receiver = make_link(
+        lambda lora: LinkAdaptationController(lora, window=4, hold_windows=1, adapt_power=False),
+        lambda lora: LinkAdaptationController(lora, confirm_ms=500))
+    messages = [b'score %d' % i for i in range(4)]
+    exchange(sender, receiver, messages)
+    monkeypatch.setattr(sender.lora, 'set_configuration',
+                        lambda configuration, permanentConfiguration=True: (ResponseStatusCode.ERR_E32_TIMEOUT, None))
+    assert sender.adaptation.evaluate() == ResponseStatusCode.E32_SUCCESS
+    poll_for([sender, receiver], 1.5)
+
+    assert module.air_data_rate == peer.air_data_rate == AirDataRate.AIR_DATA_RATE_010_24
+    monkeypatch.undo()
+    assert exchange(sender, receiver, messages) == [((0, 1, 0x17), message) for message in messages]
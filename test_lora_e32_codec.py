@@ -0,0 +1,59 @@
+# Description:
+# Tests of lora_e32_codec (schema-based binary records), run them on the PC:
+#
+#   python -m pytest test_lora_e32*.py
+
+import json
+import pytest
+
+import e32emu
+
+e32emu.install()
+
+from lora_e32_codec import Schema, RecordCodec, RECORD_MARKER
+
+SCORE = Schema(1, 'score', [('home', 'u8'), ('away', 'u8'), ('clock', 'u16'), ('team', 'str')],
+               optional=[(1, 'period', 'u8'), (2, 'delta', 'i16'), (3, 'final', 'bool'), (4, 'note', 'str')])
+
+
+@pytest.fixture
+def codec():
+    codec = RecordCodec()
+    codec.register(SCORE)
+    return codec
+
+
+def test_record_round_trip(codec):
+    record = {'home': 12, 'away': 7, 'clock': 2537, 'team': 'Élan', 'delta': -300, 'final': True, 'note': 'OT'}
+    data = codec.encode(record, 'score')
+    assert data[0] == RECORD_MARKER and data[1] == 1
+    assert codec.decode(data) == ('score', record)
+
+
+def test_missing_optional_fields_cost_nothing(codec):
+    record = {'home': 1, 'away': 0, 'clock': 60, 'team': 'A'}
+    data = codec.encode(record, 'score')
+    assert len(data) == 2 + 4 + 1 + 1
+    assert len(data) < len(json.dumps(record))
+    assert codec.decode(data) == ('score', record)
+
+
+def test_unknown_schema_falls_back_to_json(codec):
+    record = {'home': 1, 'away': 2}
+    data = codec.encode(record, 'unknown')
+    assert json.loads(data) == record
+    assert codec.decode(data) == (None, record)
+
+
+def test_unknown_schema_id_on_receive(codec):
+    with pytest.raises(KeyError):
+        codec.decode(bytes([RECORD_MARKER, 9, 0]))
+
+
+def test_invalid_schemas():
+    with pytest.raises(ValueError):
+        Schema(1, 'bad', [('x', 'u64')])
+    with pytest.raises(ValueError):
+        Schema(1, 'bad', [], optional=[(1, 'x', 'f32')])
+    with pytest.raises(ValueError):
+        Schema(256, 'bad', [])
@@ -0,0 +1,55 @@
+# Description:
+# Tests of lora_e32_dedup (duplicate BLE writes), run them on the PC:
+#
+#   python -m pytest test_lora_e32*.py
+
+import time
+
+import e32emu
+
+e32emu.install()
+
+from lora_e32_dedup import DedupCache, split_message_id
+
+
+def test_split_message_id():
+    assert split_message_id('#42:score 3-1') == ('42', 'score 3-1')
+    assert split_message_id('score 3-1') == (None, 'score 3-1')
+    assert split_message_id('#:x') == (None, '#:x')
+    assert split_message_id('#42') == (None, '#42')
+
+
+def test_message_id_is_a_duplicate_whatever_the_time():
+    dedup = DedupCache(window_ms=10)
+    assert not dedup.seen('score 3-1', '42')
+    time.sleep(0.05)
+    assert dedup.seen('score 3-1', '42')
+    assert not dedup.seen('score 3-1', '43')
+    assert (dedup.hits, dedup.misses) == (1, 2)
+
+
+def test_payload_is_a_duplicate_within_the_window_only():
+    dedup = DedupCache(window_ms=50)
+    assert not dedup.seen('score 3-1')
+    assert dedup.seen('score 3-1')
+    time.sleep(0.1)
+    assert not dedup.seen('score 3-1')
+
+
+def test_least_recently_seen_is_dropped_first():
+    dedup = DedupCache(size=2)
+    dedup.seen('a', '1')
+    dedup.seen('b', '2')
+    dedup.seen('a', '1')
+    dedup.seen('c', '3')
+    assert len(dedup) == 2
+    assert dedup.seen('a', '1')
+    assert not dedup.seen('b', '2')
+
+
+def test_forgotten_message_goes_out_again():
+    dedup = DedupCache()
+    dedup.seen('score 3-1', '42')
+    dedup.forget('score 3-1', '42')
+    assert not dedup.seen('score 3-1', '42')
+    dedup.forget('never seen')
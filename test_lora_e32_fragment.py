@@ -0,0 +1,85 @@
+# Description:
+# Tests of lora_e32_fragment (fragmentation and reassembly), run them on the PC:
+#
+#   python -m pytest test_lora_e32*.py
+
+import pytest
+import time
+
+import e32emu
+
+e32emu.install()
+
+from lora_e32_fragment import fragment_message, Reassembler, FRAGMENT_HEADER_SIZE, FRAGMENT_PACKET_SIZE
+
+MESSAGE = bytes(range(256)) * 2
+
+
+def test_fragments_fit_in_a_packet():
+    fragments = fragment_message(MESSAGE, 9)
+    assert len(fragments) == 10
+    assert all(len(fragment) <= FRAGMENT_PACKET_SIZE for fragment in fragments)
+    assert [fragment[2] for fragment in fragments] == list(range(10))
+
+
+def test_fragments_are_reassembled_in_any_order():
+    reassembler = Reassembler()
+    fragments = fragment_message(MESSAGE, 1)
+    for fragment in reversed(fragments[1:]):
+        reassembler.feed(fragment)
+        assert reassembler.pop() is None
+    reassembler.feed(fragments[0])
+    assert reassembler.pop() == MESSAGE
+    assert reassembler.completed == 1
+    assert reassembler.in_progress() == 0
+
+
+def test_chunk_with_several_fragments_and_plain_text():
+    reassembler = Reassembler()
+    fragments = fragment_message(b'a' * 80, 2)
+    reassembler.feed(fragments[0] + fragments[1] + b'plain')
+    assert reassembler.pop() == b'a' * 80
+    assert reassembler.pop() == b'plain'
+
+
+def test_messages_of_two_sources_are_kept_apart():
+    reassembler = Reassembler()
+    first = fragment_message(b'x' * 60, 5)
+    second = fragment_message(b'y' * 60, 5)
+    reassembler.feed(first[0], source=1)
+    reassembler.feed(second[0], source=2)
+    reassembler.feed(second[1], source=2)
+    reassembler.feed(first[1], source=1)
+    assert reassembler.pop() == b'y' * 60
+    assert reassembler.pop() == b'x' * 60
+
+
+def test_truncated_fragment_is_dropped():
+    reassembler = Reassembler()
+    fragment = fragment_message(b'z' * 100, 4)[0]
+    reassembler.feed(fragment[:FRAGMENT_HEADER_SIZE + 10])
+    assert reassembler.pop() is None
+    assert reassembler.in_progress() == 0
+
+
+def test_incomplete_message_expires():
+    reassembler = Reassembler(timeout_ms=50)
+    reassembler.feed(fragment_message(MESSAGE, 3)[0])
+    time.sleep(0.1)
+    reassembler.expire()
+    assert reassembler.in_progress() == 0
+    assert reassembler.expired == 1
+
+
+def test_oldest_message_is_evicted_when_full():
+    reassembler = Reassembler(max_messages=2)
+    for msg_id in range(3):
+        reassembler.feed(fragment_message(MESSAGE, msg_id)[0])
+        time.sleep(0.01)
+    assert reassembler.in_progress() == 2
+    assert reassembler.evicted == 1
+
+
+def test_too_many_fragments():
+    with pytest.raises(ValueError):
+        fragment_message(bytes(256 * (FRAGMENT_PACKET_SIZE - FRAGMENT_HEADER_SIZE)), 0)
@@ -0,0 +1,87 @@
+# Description:
+# Tests of lora_e32_reader (UART ring buffer reader), run them on the PC:
+#
+#   python -m pytest test_lora_e32*.py
+
+import time
+
+import e32emu
+
+e32emu.install()
+
+from lora_e32_operation_constant import ResponseStatusCode
+from lora_e32_reader import UARTRingReader, IDLE_END_OF_PACKET_MS
+
+
+class FakeUART:
+    """Bytes written by the test come out of readinto, at most `chunk` per call"""
+
+    def __init__(self, chunk=1000):
+        self.rx = bytearray()
+        self.chunk = chunk
+
+    def feed(self, data):
+        self.rx.extend(data)
+
+    def any(self):
+        return len(self.rx)
+
+    def readinto(self, buf):
+        n = min(len(buf), len(self.rx), self.chunk)
+        buf[:n] = self.rx[:n]
+        del self.rx[:n]
+        return n
+
+
+def test_frames_are_cut_on_the_delimiter_across_the_end_of_the_ring():
+    uart = FakeUART(chunk=5)
+    reader = UARTRingReader(uart, size=16, max_frame=16)
+    for message in (b'first', b'second', b'third'):
+        uart.feed(message + b'\r\n')
+        code, frame = reader.read_until('\r\n', timeout=100)
+        assert code == ResponseStatusCode.E32_SUCCESS
+        assert bytes(frame) == message
+    assert reader.available() == 0
+
+
+def test_exact_size_and_peek():
+    uart = FakeUART()
+    reader = UARTRingReader(uart)
+    uart.feed(b'\xfd\x01\x00\x02\x03abc')
+    reader.fill()
+    assert reader.peek() == 0xFD
+    assert reader.peek(4) == 3
+    assert reader.peek(8) == -1
+    code, frame = reader.take(5)
+    assert code == ResponseStatusCode.E32_SUCCESS
+    assert bytes(frame) == b'\xfd\x01\x00\x02\x03'
+    assert reader.take(4) == (None, None)
+    assert bytes(reader.read_exact(3, timeout=10)[1]) == b'abc'
+
+
+def test_packet_ends_when_the_line_is_quiet():
+    uart = FakeUART()
+    reader = UARTRingReader(uart)
+    uart.feed(b'score 2-1')
+    reader.fill()
+    assert reader.take_packet() == (None, None)
+    time.sleep(2 * IDLE_END_OF_PACKET_MS / 1000)
+    code, frame = reader.take_packet()
+    assert code == ResponseStatusCode.E32_SUCCESS
+    assert bytes(frame) == b'score 2-1'
+
+
+def test_timeout_without_data():
+    reader = UARTRingReader(FakeUART())
+    assert reader.read_packet(timeout=10) == (ResponseStatusCode.ERR_E32_TIMEOUT, None)
+
+
+def test_frame_bigger_than_the_ring_is_dropped():
+    uart = FakeUART()
+    reader = UARTRingReader(uart, size=16, max_frame=16)
+    uart.feed(b'x' * 20 + b'\n' + b'ok\n')
+    code, frame = reader.read_until(b'\n', timeout=10)
+    assert code == ResponseStatusCode.ERR_E32_BUF_TOO_SMALL
+    assert reader.overflows == 0
+    code, frame = reader.read_until(b'\n', timeout=10)
+    assert (code, bytes(frame)) == (ResponseStatusCode.E32_SUCCESS, b'ok')
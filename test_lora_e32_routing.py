@@ -0,0 +1,55 @@
+# Description:
+# Tests of lora_e32_routing (project number to fixed address table), run them on the PC:
+#
+#   python -m pytest test_lora_e32*.py
+
+import pytest
+
+import e32emu
+
+e32emu.install()
+
+from lora_e32 import BROADCAST_ADDRESS
+from lora_e32_routing import RoutingTable
+
+
+@pytest.fixture
+def routes(tmp_path):
+    return RoutingTable(str(tmp_path / 'routes.json'))
+
+
+def test_update_resolve_and_reload(routes):
+    assert routes.update('{"230411": [0, 1, 23], "site": 23}')
+    assert routes.resolve(230411) == (0, 1, 23)
+    assert routes.resolve('site') == (BROADCAST_ADDRESS, BROADCAST_ADDRESS, 23)
+    assert routes.is_group('site')
+    assert routes.resolve('other') is None
+
+    reloaded = RoutingTable(routes.path)
+    assert reloaded.load()
+    assert len(reloaded) == 2
+    assert reloaded.resolve('230411') == (0, 1, 23)
+
+
+def test_null_removes_a_route(routes):
+    assert routes.update('{"230411": [0, 1, 23], "230412": [0, 2, 23]}')
+    assert routes.update('{"230411": null}')
+    assert routes.resolve('230411') is None
+    assert len(routes) == 1
+
+
+@pytest.mark.parametrize('text', ['not json', '[0, 1, 23]', '{"a": [0, 1]}', '{"a": [0, 1, 256]}',
+                                  '{"a": "x"}', '{"a": [0, 1, 2], "b": -1}'])
+def test_invalid_update_leaves_the_table_unchanged(routes, text):
+    assert routes.update('{"a": [0, 1, 23]}')
+    assert not routes.update(text)
+    assert len(routes) == 1
+    assert routes.resolve('a') == (0, 1, 23)
+
+
+def test_missing_or_corrupted_file(routes):
+    assert not routes.load()
+    with open(routes.path, 'w') as f:
+        f.write('{')
+    assert not routes.load()
+    assert len(routes) == 0
@@ -0,0 +1,143 @@
+# Description:
+# Tests of lora_e32_txqueue (coalescing transmit queue) and lora_e32_mux (several modules),
+# run them on the PC:
+#
+#   python -m pytest test_lora_e32*.py
+
+import e32emu
+
+e32emu.install()
+
+import uasyncio as asyncio
+from lora_e32_operation_constant import ResponseStatusCode
+from lora_e32_txqueue import CoalescingTxQueue, pack_messages, unpack_frame, PACKED_FRAME_MARKER
+from lora_e32_mux import LoRaMux
+
+SCOREBOARD_1 = (0, 1, 23)
+SCOREBOARD_2 = (0, 2, 23)
+
+
+class FakeRadio:
+    """Stands for an AsyncLoRaE32: a send holds the radio for `airtime_ms`"""
+
+    def __init__(self, airtime_ms=20):
+        self.airtime_ms = airtime_ms
+        self.lock = asyncio.Lock()
+        # (destination, frame, wake)
+        self.frames = []
+
+    async def _send(self, destination, frame, wake=False):
+        async with self.lock:
+            await asyncio.sleep_ms(self.airtime_ms)
+            self.frames.append((destination, bytes(frame), wake))
+        return ResponseStatusCode.E32_SUCCESS
+
+    async def send_transparent_message(self, frame):
+        return await self._send(None, frame)
+
+    async def send_fixed_message(self, ADDH, ADDL, CHAN, frame):
+        return await self._send((ADDH, ADDL, CHAN), frame)
+
+    async def send_wake_message(self, ADDH, ADDL, CHAN, frame):
+        return await self._send((ADDH, ADDL, CHAN), frame, True)
+
+    def predict_send_latency_ms(self, size, wake=False):
+        return self.airtime_ms + size
+
+    def messages(self):
+        return [(destination, unpack_frame(frame)) for destination, frame, wake in self.frames]
+
+
+async def run_until_sent(runner, radios, count, timeout_ms=2000):
+    task = asyncio.create_task(runner)
+    waited = 0
+    while sum([len(radio.frames) for radio in radios]) < count and waited < timeout_ms:
+        await asyncio.sleep_ms(5)
+        waited += 5
+    task.cancel()
+
+
+def test_pack_and_unpack():
+    messages = [b'score 1-0', b'score 2-0', b'x' * 50]
+    frame, count = pack_messages(messages)
+    assert frame[0] == PACKED_FRAME_MARKER
+    assert count == 2
+    assert unpack_frame(frame) == messages[:2]
+    assert pack_messages([b'alone']) == (b'alone', 1)
+    assert unpack_frame('plain') == [b'plain']
+
+
+def test_burst_is_sent_in_one_frame():
+    async def main():
+        radio = FakeRadio()
+        queue = CoalescingTxQueue(radio, linger_ms=30)
+        for i in range(3):
+            assert queue.put('score %d' % i, SCOREBOARD_1)
+        await run_until_sent(queue.run(), [radio], 1)
+        assert radio.messages() == [(SCOREBOARD_1, [b'score 0', b'score 1', b'score 2'])]
+        assert (queue.frames_sent, queue.messages_sent) == (1, 3)
+
+    asyncio.run(main())
+
+
+def test_destinations_keep_their_order():
+    async def main():
+        radio = FakeRadio()
+        queue = CoalescingTxQueue(radio, linger_ms=10)
+        queue.put('a1', SCOREBOARD_1)
+        queue.put('b1', SCOREBOARD_2)
+        queue.put('a2', SCOREBOARD_1)
+        await run_until_sent(queue.run(), [radio], 2)
+        assert radio.messages() == [(SCOREBOARD_1, [b'a1', b'a2']), (SCOREBOARD_2, [b'b1'])]
+
+    asyncio.run(main())
+
+
+def test_full_queue_drops():
+    radio = FakeRadio()
+    queue = CoalescingTxQueue(radio, max_pending=2)
+    assert queue.put('1') and queue.put('2')
+    assert not queue.put('3')
+    assert queue.dropped == 1
+
+
+def test_predicted_latency_counts_the_backlog():
+    radio = FakeRadio()
+    queue = CoalescingTxQueue(radio, linger_ms=30)
+    empty = queue.predict_latency_ms(10, SCOREBOARD_1)
+    assert empty == 30 + radio.predict_send_latency_ms(10)
+
+    queue.put('x' * 20, SCOREBOARD_2)
+    assert queue.predict_latency_ms(10, SCOREBOARD_1) == empty + radio.predict_send_latency_ms(1 + 21)
+    # packed with the message already waiting for the same destination
+    assert queue.predict_latency_ms(10, SCOREBOARD_2) == 30 + radio.predict_send_latency_ms(10 + 22 + 1)
+
+
+def test_mux_spreads_the_destinations_and_keeps_their_order():
+    async def main():
+        radios = [FakeRadio(), FakeRadio()]
+        mux = LoRaMux(linger_ms=10)
+        mux.add(radios[0], 23)
+        mux.add(radios[1], 23)
+        assert mux.put('a1', SCOREBOARD_1)
+        assert mux.put('b1', SCOREBOARD_2)
+        assert mux.put('a2', SCOREBOARD_1)
+        assert [lane.routed for lane in mux.lanes] == [2, 1]
+        await run_until_sent(mux.run(), radios, 2)
+        assert radios[0].messages() == [(SCOREBOARD_1, [b'a1', b'a2'])]
+        assert radios[1].messages() == [(SCOREBOARD_2, [b'b1'])]
+        assert mux.messages_sent == 3
+
+    asyncio.run(main())
+
+
+def test_mux_prefers_the_module_on_the_destination_channel():
+    radios = [FakeRadio(), FakeRadio()]
+    mux = LoRaMux()
+    mux.add(radios[0], 5)
+    mux.add(radios[1], 23)
+    mux.put('a', SCOREBOARD_1)
+    mux.put('transparent')
+    assert [lane.queue.pending() for lane in mux.lanes] == [1, 1]
+    assert mux.lanes[1].queue.has_pending(SCOREBOARD_1)
+    assert mux.lanes[0].queue.has_pending(None)
@@ -0,0 +1,80 @@
+# Description:
+# Energy / latency model of wake on radio (lora_e32_wor) to choose the wireless wake-up
+# time of a deployment. Run it on the PC (CPython), not on the board:
+#
+#   python wor_model.py --messages-per-hour 30 --battery-mah 2000
+#
+# For every WirelessWakeUpTime it prints the average current and battery life of a
+# receiver sleeping in MODE_2_POWER_SAVING, the latency of the first (woken) message
+# and the airtime the gateway spends on preambles. The currents default to typical
+# E32 (433T20D) and Pico figures: measure yours and pass them, the model is linear.
+
+import argparse
+
+from lora_e32_constants import AirDataRate, WirelessWakeUpTime
+
+# same model as lora_e32.time_on_air_ms (FEC on), not imported: lora_e32 needs machine
+AIR_OVERHEAD_BYTES = 6
+
+
+def time_on_air_ms(air_data_rate, payload_size):
+    return (payload_size + AIR_OVERHEAD_BYTES) * 8 * 1000 / AirDataRate.get_bits_per_second(air_data_rate)
+
+
+def model(wake_ms, args):
+    airtime = time_on_air_ms(args.air_data_rate, args.payload)
+    hour_ms = 3600 * 1000
+    woken = args.messages_per_hour * (1 - args.follow_up_ratio)
+
+    # module: asleep, plus a listen window at every wake-up period
+    listen_mah = args.rx_ma * args.listen_ms * (hour_ms / wake_ms) / hour_ms
+    sleep_mah = args.module_sleep_ua / 1000 + args.mcu_sleep_ma
+    # a woken message: the receiver hears on average half of the preamble, then the
+    # packet, then stays awake (module in RX, MCU running) waiting for follow-ups
+    awake_ms = wake_ms / 2 + airtime + args.stay_awake_ms
+    message_mah = woken * awake_ms * (args.rx_ma + args.mcu_active_ma) / hour_ms
+    average_ma = listen_mah + sleep_mah + message_mah
+
+    return {
+        'average_ma': average_ma,
+        'battery_weeks': args.battery_mah / average_ma / (24 * 7),
+        # the preamble always lasts the full wake-up time
+        'first_latency_ms': wake_ms + airtime,
+        'follow_up_latency_ms': airtime,
+        'gateway_airtime_s_per_hour': woken * (wake_ms + airtime) / 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Wake on radio energy / latency model")
+    parser.add_argument('--messages-per-hour', type=float, default=30)
+    parser.add_argument('--follow-up-ratio', type=float, default=0.5,
+                        help='fraction of messages arriving while the receiver is still awake')
+    parser.add_argument('--payload', type=int, default=30, help='bytes per message')
+    parser.add_argument('--air-data-rate', type=int, default=AirDataRate.AIR_DATA_RATE_010_24)
+    parser.add_argument('--stay-awake-ms', type=float, default=5000)
+    parser.add_argument('--battery-mah', type=float, default=2000)
+    parser.add_argument('--rx-ma', type=float, default=16, help='module receive current')
+    parser.add_argument('--listen-ms', type=float, default=5, help='module listen window per wake-up')
+    parser.add_argument('--module-sleep-ua', type=float, default=5)
+    parser.add_argument('--mcu-sleep-ma', type=float, default=1.3, help='MCU current while waiting (lightsleep)')
+    parser.add_argument('--mcu-active-ma', type=float, default=25)
+    args = parser.parse_args()
+
+    # always listening in MODE_0_NORMAL, for comparison
+    always_on_ma = args.rx_ma + args.mcu_sleep_ma
+    print("MODE_0 always on: {:.2f} mA, {:.1f} weeks".format(always_on_ma,
+                                                               args.battery_mah / always_on_ma / (24 * 7)))
+    print("{:>8} {:>8} {:>8} {:>12} {:>12} {:>14}".format(
+        'wake', 'avg mA', 'weeks', 'first ms', 'follow ms', 'gw air s/h'))
+    for wake_up_time in range(WirelessWakeUpTime.WAKE_UP_250, WirelessWakeUpTime.WAKE_UP_2000 + 1):
+        wake_ms = WirelessWakeUpTime.get_milliseconds(wake_up_time)
+        result = model(wake_ms, args)
+        print("{:>8} {:>8.3f} {:>8.1f} {:>12.0f} {:>12.0f} {:>14.1f}".format(
+            WirelessWakeUpTime.get_description(wake_up_time).split(' ')[0], result['average_ma'],
+            result['battery_weeks'], result['first_latency_ms'], result['follow_up_latency_ms'],
+            result['gateway_airtime_s_per_hour']))
+
+
+if __name__ == '__main__':
+    main()